@@ -0,0 +1,212 @@
+from app import app, bcrypt
+from concurrent.futures import ThreadPoolExecutor
+import math
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class HashingBusy(Exception):
+    """
+    Raised when too many password hashes are already running or waiting.
+    """
+    pass
+
+
+class HostSlots:
+    """
+    Hashing slots shared by every worker process of the machine through locked files.
+    A sync worker serves one request at a time, so a limit kept in the memory of each
+    process never fills up, the lock files let the workers see the hashes of each other.
+    The lock of a slot is released by the system when its process dies.
+    """
+
+    def __init__(self, directory, count):
+        """
+        :param directory: Directory of the lock files, the same for every worker
+        :param count: Number of hashes admitted at a time on the machine
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.paths = [os.path.join(directory, 'slot-' + str(number)) for number in range(count)]
+
+    def acquire(self):
+        """
+        Take a free slot without waiting.
+        :return: File descriptor holding the slot, or None when every slot is taken
+        """
+        for path in self.paths:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+            else:
+                return fd
+        return None
+
+    def release(self, fd):
+        """
+        Free a slot, closing its file drops the lock.
+        :param fd: File descriptor returned by acquire
+        :return:
+        """
+        os.close(fd)
+
+
+class PasswordHasher:
+    """
+    Run bcrypt on a dedicated, size limited thread pool.
+    At most workers + queue_depth hashes are admitted at a time in the process, and at most
+    host_slots on the machine when a slots directory is given. Any other request is rejected
+    straight away with HashingBusy instead of waiting for a worker.
+    """
+
+    def __init__(self, workers, queue_depth, host_slots=None, slots_dir=None):
+        """
+        :param workers: Threads hashing at the same time in the process
+        :param queue_depth: Hashes waiting for a thread in the process
+        :param host_slots: Hashes admitted at a time by all the worker processes of the machine
+        :param slots_dir: Directory of the lock files of the host slots, None to only limit the process
+        """
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._slots = threading.BoundedSemaphore(workers + queue_depth)
+        self._host_slots = HostSlots(slots_dir, host_slots) if slots_dir and fcntl is not None else None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._total_seconds = 0.0
+        self._max_seconds = 0.0
+        self._calibrated = {}
+
+    def generate_password_hash(self, password):
+        """
+        Hash a password with the configured number of bcrypt rounds.
+        :param password: Password
+        :return: Password hash string
+        """
+        return self._run(bcrypt.generate_password_hash, password, self.log_rounds()).decode('utf-8')
+
+    def check_password_hash(self, pw_hash, password):
+        """
+        Check a password against its hash.
+        :param pw_hash: Password hash
+        :param password: Password
+        :return: True if the password matches
+        """
+        return self._run(bcrypt.check_password_hash, pw_hash, password)
+
+    def log_rounds(self):
+        """
+        Number of bcrypt rounds new hashes are made with. When BCRYPT_TARGET_HASH_MS is set
+        the rounds are measured once so that a hash takes about that long on this machine,
+        otherwise BCRYPT_LOG_ROUNDS is used.
+        :return: Log rounds
+        """
+        target_ms = app.config.get('BCRYPT_TARGET_HASH_MS')
+        if not target_ms:
+            return app.config['BCRYPT_LOG_ROUNDS']
+        if target_ms not in self._calibrated:
+            self._calibrated[target_ms] = self.calibrate(target_ms)
+        return self._calibrated[target_ms]
+
+    @staticmethod
+    def calibrate(target_ms, minimum=4, maximum=31):
+        """
+        Find the number of bcrypt rounds whose hash time is closest to the target.
+        Every extra round doubles the hashing time, so only hashes at the minimum cost are timed.
+        :param target_ms: Target hash time in milliseconds
+        :param minimum: Lowest rounds allowed
+        :param maximum: Highest rounds allowed
+        :return: Log rounds
+        """
+        timings = []
+        for _ in range(3):
+            start = time.time()
+            bcrypt.generate_password_hash('calibration', minimum)
+            timings.append(time.time() - start)
+        elapsed_ms = max(min(timings) * 1000, 0.001)
+        rounds = minimum + int(round(math.log(target_ms / elapsed_ms, 2)))
+        return min(max(rounds, minimum), maximum)
+
+    def needs_rehash(self, pw_hash):
+        """
+        Check whether a password hash was made with a different cost than new hashes use.
+        Rounds measured for BCRYPT_TARGET_HASH_MS can differ by one between workers, so in
+        that mode hashes are only upgraded, never lowered, or logins served by different
+        workers would hash the password again every time.
+        :param pw_hash: Password hash
+        :return: True if the password should be hashed again
+        """
+        try:
+            rounds = int(pw_hash.split('$')[2])
+        except (IndexError, ValueError):
+            return True
+        if app.config.get('BCRYPT_TARGET_HASH_MS'):
+            return rounds < self.log_rounds()
+        return rounds != self.log_rounds()
+
+    def stats(self):
+        """
+        Hashing metrics: queue depth, admitted and rejected hashes and their latency.
+        :return: Dict of metrics
+        """
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queue_limit': self.queue_depth,
+                'in_flight': self._in_flight,
+                'queued': max(0, self._in_flight - self.workers),
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'average_ms': round(self._total_seconds * 1000 / self._completed, 2) if self._completed else 0,
+                'max_ms': round(self._max_seconds * 1000, 2),
+                'log_rounds': self.log_rounds()
+            }
+
+    def _run(self, func, *args):
+        """
+        Run func on the executor and wait for its result, unless the process or the machine
+        already admitted as many hashes as it has slots.
+        :return: Result of func
+        """
+        host_slot = None
+        admitted = self._slots.acquire(blocking=False)
+        if admitted and self._host_slots is not None:
+            host_slot = self._host_slots.acquire()
+            if host_slot is None:
+                self._slots.release()
+                admitted = False
+        if not admitted:
+            with self._lock:
+                self._rejected += 1
+            raise HashingBusy()
+        with self._lock:
+            self._in_flight += 1
+        start = time.time()
+        try:
+            return self._executor.submit(func, *args).result()
+        finally:
+            elapsed = time.time() - start
+            with self._lock:
+                self._in_flight -= 1
+                self._completed += 1
+                self._total_seconds += elapsed
+                self._max_seconds = max(self._max_seconds, elapsed)
+            if host_slot is not None:
+                self._host_slots.release(host_slot)
+            self._slots.release()
+
+
+hasher = PasswordHasher(app.config['PASSWORD_HASH_WORKERS'], app.config['PASSWORD_HASH_QUEUE_DEPTH'],
+                        app.config['PASSWORD_HASH_HOST_SLOTS'], app.config['PASSWORD_HASH_SLOTS_DIR'])
+
+# Measure the bcrypt cost at startup rather than on the first login
+hasher.log_rounds()
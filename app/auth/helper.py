@@ -1,7 +1,13 @@
-from flask import request, make_response, jsonify
+from flask import request, make_response, jsonify, g
+from app import app
+from app.auth.revocation import revocations
+from app.cache import TTLCache
 from app.models.users import User
 from functools import wraps
 
+# Payloads of the auth tokens that were already verified
+token_cache = TTLCache(app.config['AUTH_TOKEN_CACHE_SIZE'])
+
 
 def token_required(f):
     """
@@ -31,9 +37,17 @@ def token_required(f):
                 'message': 'Token is missing'
             })), 401
 
+        decode_response = None
         try:
-            decode_response = User.decode_auth_token(token)
-            current_user = User.query.filter_by(id=decode_response).first()
+            payload = token_cache.get(token)
+            if payload is not None and revocations.is_revoked(token):
+                # Blacklisted since it was cached, the verification reports it
+                evict_token(token)
+                payload = None
+            if payload is None:
+                decode_response = User.decode_auth_payload(token)
+                payload = decode_response
+            current_user = User.query.get(payload['sub'])
         except:
             message = 'Invalid token'
             if isinstance(decode_response, str):
@@ -43,11 +57,43 @@ def token_required(f):
                 'message': message
             })), 401
 
+        if current_user is None or not current_user.is_token_current(payload):
+            evict_token(token)
+            return make_response(jsonify({
+                'status': 'failed',
+                'message': 'Token was revoked, Please login In'
+            })), 401
+        if decode_response is not None:
+            cache_token(token, payload)
+        g.current_user = current_user
+
         return f(current_user, *args, **kwargs)
 
     return decorated_function
 
 
+def cache_token(token, payload):
+    """
+    Remember the payload of a verified token so that its next uses skip the token verification.
+    The entry never outlives the token's own expiry time nor the configured cache time. The
+    revocation set and the token version of the user are still checked on every request, so a
+    token blacklisted by another worker is refused once the revocation set is refreshed.
+    :param token: Auth token
+    :param payload: Decoded token payload
+    :return:
+    """
+    token_cache.set(token, payload, ttl=app.config['AUTH_TOKEN_CACHE_SECONDS'], expires_at=payload['exp'])
+
+
+def evict_token(token):
+    """
+    Remove a token from the cache so that it is verified again on its next use.
+    :param token: Auth token
+    :return:
+    """
+    token_cache.delete(token)
+
+
 def response(status, message, status_code):
     """
     Helper method to make an Http response
@@ -0,0 +1,93 @@
+from app import app
+from app.models.blacklist_token import BlackListToken
+import calendar
+import datetime
+import threading
+import time
+
+
+class RevocationSet:
+    """
+    In-process copy of the blacklisted tokens that have not expired yet, keyed by token digest.
+    Every worker refreshes its copy incrementally from the blacklist_token table using the
+    highest blacklisted_on it has seen, so the revocation check does not touch the database
+    unless the token is found in the set. blacklisted_on is stamped before the row commits,
+    so rows are read again from REVOCATION_REFRESH_WINDOW_SECONDS before that time, which
+    catches a row stamped earlier than another but committed after it was loaded.
+    """
+
+    def __init__(self):
+        self._revoked = {}
+        self._high_water = None
+        self._last_refresh = None
+        self._lock = threading.Lock()
+
+    def revoke(self, token):
+        """
+        Blacklist a token in the database and in this worker's set.
+        :param token: Auth token
+        :return:
+        """
+        blacklisted = BlackListToken(token)
+        blacklisted.blacklist()
+        with self._lock:
+            self._add(blacklisted.token_digest, blacklisted.expires_on)
+
+    def is_revoked(self, token):
+        """
+        Check whether a token was blacklisted. A token found in the set is confirmed
+        against the database before it is reported as revoked.
+        :param token: Auth token
+        :return: True if the token is blacklisted
+        """
+        self.refresh()
+        if BlackListToken.digest(token) not in self._revoked:
+            return False
+        return BlackListToken.check_blacklist(token)
+
+    def refresh(self, force=False):
+        """
+        Load the tokens blacklisted since the last refresh and drop the expired ones.
+        The database is queried at most once every REVOCATION_REFRESH_SECONDS.
+        :param force: Refresh even if the refresh interval has not elapsed
+        :return:
+        """
+        now = time.time()
+        if not force and self._last_refresh is not None \
+                and now - self._last_refresh < app.config['REVOCATION_REFRESH_SECONDS']:
+            return
+        with self._lock:
+            query = BlackListToken.query.filter(BlackListToken.expires_on > datetime.datetime.utcnow())
+            if self._high_water is not None:
+                window = datetime.timedelta(seconds=app.config['REVOCATION_REFRESH_WINDOW_SECONDS'])
+                query = query.filter(BlackListToken.blacklisted_on >= self._high_water - window)
+            for blacklisted in query.order_by(BlackListToken.blacklisted_on):
+                self._add(blacklisted.token_digest, blacklisted.expires_on)
+                if self._high_water is None or blacklisted.blacklisted_on > self._high_water:
+                    self._high_water = blacklisted.blacklisted_on
+            self._revoked = {digest: exp for digest, exp in self._revoked.items() if exp > now}
+            self._last_refresh = now
+
+    def reset(self):
+        """
+        Forget every revocation and reload them from scratch on the next check.
+        :return:
+        """
+        with self._lock:
+            self._revoked = {}
+            self._high_water = None
+            self._last_refresh = None
+
+    def _add(self, digest, expires_on):
+        """
+        Add a token digest to the set until its expiry time.
+        :param digest: Token digest
+        :param expires_on: UTC datetime at which the token expires
+        :return:
+        """
+        exp = calendar.timegm(expires_on.utctimetuple())
+        if exp > time.time():
+            self._revoked[digest] = exp
+
+
+revocations = RevocationSet()
@@ -1,9 +1,9 @@
-from app import bcrypt
 from flask import Blueprint, request
 from flask.views import MethodView
-from app.auth.helper import response, response_auth, token_required
+from app.auth.helper import response, response_auth, token_required, evict_token
 from app.models.users import User
-from app.models.blacklist_token import BlackListToken
+from app.auth.revocation import revocations
+from app.auth.hashing import hasher
 import re
 
 auth = Blueprint('auth', __name__)
@@ -44,7 +44,8 @@ class LoginUser(MethodView):
             password = post_data.get('password')
             if re.match(r"[^@]+@[^@]+\.[^@]+", email) and len(password) > 4:
                 user = User.query.filter_by(email=email).first()
-                if user and bcrypt.check_password_hash(user.password, password):
+                if user and hasher.check_password_hash(user.password, password):
+                    user.rehash_password(password)
                     return response_auth('success', 'Successfully logged In', user.encode_auth_token(user.id), 200)
                 return response('failed', 'User does not exist or password is incorrect', 401)
             return response('failed', 'Missing or wrong email format or password is less than four characters', 401)
@@ -69,8 +70,8 @@ class LogOutUser(MethodView):
             else:
                 decoded_token_response = User.decode_auth_token(auth_token)
                 if not isinstance(decoded_token_response, str):
-                    token = BlackListToken(auth_token)
-                    token.blacklist()
+                    revocations.revoke(auth_token)
+                    evict_token(auth_token)
                     return response('success', 'Successfully logged out', 200)
                 return response('failed', decoded_token_response, 401)
         return response('failed', 'Provide an authorization header', 403)
@@ -86,17 +87,30 @@ def reset_password(current_user):
         password_confirmation = data.get('passwordConfirmation')
         if not old_password or not new_password or not password_confirmation:
             return response('failed', "Missing required attributes", 400)
-        if bcrypt.check_password_hash(current_user.password, old_password.encode('utf-8')):
+        if hasher.check_password_hash(current_user.password, old_password.encode('utf-8')):
             if not new_password == password_confirmation:
                 return response('failed', 'New Passwords do not match', 400)
             if not len(new_password) > 4:
                 return response('failed', 'New password should be greater than four characters long', 400)
             current_user.reset_password(new_password)
-            return response('success', 'Password reset successfully', 200)
+            return response_auth('success', 'Password reset successfully',
+                                 current_user.encode_auth_token(current_user.id), 200)
         return response('failed', "Incorrect password", 401)
     return response('failed', 'Content type must be json', 400)
 
 
+@auth.route('/auth/logout/all', methods=['POST'])
+@token_required
+def logout_everywhere(current_user):
+    """
+    Log out the user from every session by invalidating all the auth tokens issued to them.
+    :param current_user: User
+    :return:
+    """
+    current_user.revoke_tokens()
+    return response('success', 'Successfully logged out of all sessions', 200)
+
+
 # Register classes as views
 registration_view = RegisterUser.as_view('register')
 login_view = LoginUser.as_view('login')
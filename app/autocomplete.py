@@ -0,0 +1,185 @@
+from flask import request
+from app import app, db
+from app.cache import TTLCache
+from app.models.events import Event
+from app.models.guests import Guest
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session, object_session
+import bisect
+import heapq
+import threading
+
+
+class PrefixIndex:
+    """
+    Distinct values of a column with the number of rows holding each of them, sorted
+    case insensitively so the values starting with a prefix are found by a binary search.
+    """
+
+    def __init__(self, counts):
+        """
+        :param counts: Dict of row counts by value
+        """
+        self._counts = dict(counts)
+        self._keys = sorted((value.lower(), value) for value in self._counts)
+        self._lock = threading.Lock()
+
+    def add(self, value, count=1):
+        """
+        Count rows holding a value, a new value is inserted at its sorted position.
+        :param value: Value
+        :param count: Number of rows
+        :return:
+        """
+        with self._lock:
+            if value not in self._counts:
+                bisect.insort(self._keys, (value.lower(), value))
+                self._counts[value] = 0
+            self._counts[value] += count
+
+    def remove(self, value):
+        """
+        Stop counting a row holding a value, the value is dropped once no row holds it.
+        :param value: Value
+        :return:
+        """
+        with self._lock:
+            if value not in self._counts:
+                return
+            self._counts[value] -= 1
+            if self._counts[value] <= 0:
+                del self._counts[value]
+                del self._keys[bisect.bisect_left(self._keys, (value.lower(), value))]
+
+    def suggest(self, prefix, limit):
+        """
+        Values starting with a prefix, whatever their case, the ones held by most rows first.
+        :param prefix: Prefix
+        :param limit: Maximum number of values
+        :return: List of values and row counts
+        """
+        prefix = prefix.lower()
+        with self._lock:
+            matches = []
+            for position in range(bisect.bisect_left(self._keys, (prefix,)), len(self._keys)):
+                key, value = self._keys[position]
+                if not key.startswith(prefix):
+                    break
+                matches.append((value, self._counts[value]))
+        return heapq.nsmallest(limit, matches, key=lambda match: (-match[1], match[0].lower(), match[0]))
+
+
+class Autocomplete:
+    """
+    Suggestions for a column of the rows a user owns. The prefix index of a user is built from
+    the database on the first request and kept in sync with the rows committed through the
+    session. The least recently used indexes are evicted, and every index expires so changes
+    committed by other workers are picked up.
+    """
+
+    def __init__(self, model, column):
+        """
+        :param model: Model with a user_id column
+        :param column: Column whose values are suggested
+        """
+        self.model = model
+        self.column = column
+        self.indexes = TTLCache(app.config['AUTOCOMPLETE_CACHE_SIZE'], app.config['AUTOCOMPLETE_CACHE_SECONDS'])
+
+    def suggest(self, user_id, prefix, limit):
+        """
+        Values of the user's rows starting with a prefix, the most frequent first.
+        :param user_id: User Id
+        :param prefix: Prefix
+        :param limit: Maximum number of values
+        :return: List of values and row counts
+        """
+        index = self.indexes.get(user_id)
+        if index is None:
+            counts = db.session.query(self.column, func.count()) \
+                .filter(self.model.user_id == user_id) \
+                .filter(self.column.isnot(None)) \
+                .group_by(self.column)
+            index = PrefixIndex(counts)
+            self.indexes.set(user_id, index)
+        return index.suggest(prefix, limit)
+
+    def change(self, user_id, old, new):
+        """
+        Move a row from one value to another in the user's index, if it is built.
+        :param user_id: User Id
+        :param old: Previous value or None for a new row
+        :param new: New value or None for a deleted row
+        :return:
+        """
+        index = self.indexes.get(user_id)
+        if index is None:
+            return
+        if old is not None:
+            index.remove(old)
+        if new is not None:
+            index.add(new)
+
+    def evict(self, user_id):
+        """
+        Drop the index of a user, after rows were written outside of the session.
+        :param user_id: User Id
+        :return:
+        """
+        self.indexes.delete(user_id)
+
+
+guest_organizations = Autocomplete(Guest, Guest.organization)
+event_locations = Autocomplete(Event, Event.event_location)
+
+
+def suggestion_limit_arg():
+    """
+    Read the limit query parameter, bounded by the server maximum.
+    :return: Number of suggestions
+    """
+    limit = request.args.get('limit', app.config['AUTOCOMPLETE_LIMIT'], type=int)
+    return min(max(limit, 1), app.config['AUTOCOMPLETE_MAX_LIMIT'])
+
+
+def track(autocomplete, attribute):
+    """
+    Record the changes of an attribute of the rows flushed by a session. They are applied to
+    the prefix indexes once the session commits and dropped if it rolls back.
+    :param autocomplete: Autocomplete
+    :param attribute: Attribute name of the column
+    :return:
+    """
+    model = autocomplete.model
+
+    def pending(target):
+        return object_session(target).info.setdefault('autocomplete_changes', [])
+
+    @event.listens_for(model, 'after_insert')
+    def inserted(mapper, connection, target):
+        pending(target).append((autocomplete, target.user_id, None, getattr(target, attribute)))
+
+    @event.listens_for(model, 'after_update')
+    def updated(mapper, connection, target):
+        history = db.inspect(target).attrs[attribute].history
+        if history.deleted:
+            pending(target).append((autocomplete, target.user_id, history.deleted[0], getattr(target, attribute)))
+
+    @event.listens_for(model, 'after_delete')
+    def deleted(mapper, connection, target):
+        pending(target).append((autocomplete, target.user_id, getattr(target, attribute), None))
+
+
+track(guest_organizations, 'organization')
+track(event_locations, 'event_location')
+
+
+@event.listens_for(Session, 'after_commit')
+def apply_changes(session):
+    for autocomplete, user_id, old, new in session.info.pop('autocomplete_changes', []):
+        autocomplete.change(user_id, old, new)
+
+
+@event.listens_for(Session, 'after_rollback')
+def drop_changes(session):
+    session.info.pop('autocomplete_changes', None)
@@ -0,0 +1,335 @@
+from app import app
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+import json
+import threading
+import time
+
+
+class TTLCache:
+    """
+    Bounded in-process cache with least recently used eviction and a per entry expiry time.
+    Safe to share between the threads of a worker.
+    """
+
+    def __init__(self, max_size, ttl=None):
+        """
+        :param max_size: Maximum number of entries kept before the least recently used is evicted
+        :param ttl: Default time to live in seconds, None for entries that only leave through eviction
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Return the value stored under the key if it has not expired.
+        :param key: Cache key
+        :param default: Value returned on a miss
+        :return:
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None, expires_at=None):
+        """
+        Store a value in the cache. The entry expires after the ttl or at the absolute
+        expires_at timestamp, whichever comes first.
+        :param key: Cache key
+        :param value: Value
+        :param ttl: Time to live in seconds, defaults to the cache ttl
+        :param expires_at: Absolute unix timestamp at which the entry expires
+        :return:
+        """
+        ttl = ttl if ttl is not None else self.ttl
+        if ttl is not None:
+            deadline = time.time() + ttl
+            expires_at = deadline if expires_at is None else min(expires_at, deadline)
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """
+        Evict an entry from the cache if it exists.
+        :param key: Cache key
+        :return:
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_where(self, predicate):
+        """
+        Evict every entry whose key and value match the predicate.
+        :param predicate: Callable taking the key and the value
+        :return:
+        """
+        with self._lock:
+            for key in [key for key, (value, _) in self._entries.items() if predicate(key, value)]:
+                del self._entries[key]
+
+    def clear(self):
+        """
+        Remove all the entries from the cache.
+        :return:
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class LocalBackend:
+    """
+    Response cache backend keeping the entries in the memory of the worker.
+    """
+    name = 'local'
+
+    def __init__(self, max_size):
+        """
+        :param max_size: Maximum number of entries kept before the least recently used is evicted
+        """
+        self.entries = TTLCache(max_size)
+        self.generations = TTLCache(max_size)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, value, ttl):
+        self.entries.set(key, value, ttl)
+
+    def delete(self, keys):
+        for key in keys:
+            self.entries.delete(key)
+
+    def generation(self, key):
+        return self.generations.get(key, 0)
+
+    def bump(self, keys, ttl):
+        with self._lock:
+            for key in keys:
+                self.generations.set(key, self.generations.get(key, 0) + 1, ttl)
+
+    def clear(self):
+        self.entries.clear()
+        self.generations.clear()
+
+
+class RedisBackend:
+    """
+    Response cache backend shared by every worker through a Redis server, or any client with
+    the same get, set and delete methods. A failing server is treated as an empty cache.
+    """
+    name = 'redis'
+
+    def __init__(self, client, prefix='eplanner:', errors=(ConnectionError, TimeoutError)):
+        """
+        :param client: Redis client
+        :param prefix: Prefix of the keys, so the server can be shared with other applications
+        :param errors: Exceptions of the client raised when the server cannot be reached
+        """
+        self.client = client
+        self.prefix = prefix
+        self.errors = errors
+
+    def get(self, key):
+        try:
+            value = self.client.get(self.prefix + key)
+        except self.errors:
+            return None
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    def set(self, key, value, ttl):
+        try:
+            self.client.set(self.prefix + key, value, ex=ttl)
+        except self.errors:
+            pass
+
+    def delete(self, keys):
+        try:
+            self.client.delete(*[self.prefix + key for key in keys])
+        except self.errors:
+            pass
+
+    def generation(self, key):
+        try:
+            return int(self.client.get(self.prefix + 'generation:' + key) or 0)
+        except self.errors:
+            return None
+
+    def bump(self, keys, ttl):
+        try:
+            for key in keys:
+                self.client.incr(self.prefix + 'generation:' + key)
+                self.client.expire(self.prefix + 'generation:' + key, ttl)
+        except self.errors:
+            pass
+
+    def clear(self):
+        try:
+            keys = list(self.client.scan_iter(self.prefix + '*'))
+            if keys:
+                self.client.delete(*keys)
+        except self.errors:
+            pass
+
+
+class ResponseCache:
+    """
+    Read-through cache of the json representation of single records. An entry is keyed by the
+    kind and Id of the record and holds the Id of its owner, so it is only served to that user.
+    Records changed in a transaction are evicted once the transaction commits, and every eviction
+    moves the generation of the key forward. A record read from the database is only kept if the
+    generation of its key did not move during the read, so a read racing with a write cannot
+    cache the json from before the write.
+    """
+
+    def __init__(self, backend, ttl):
+        """
+        :param backend: LocalBackend or RedisBackend
+        :param ttl: Time to live of the entries in seconds
+        """
+        self.backend = backend
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    @staticmethod
+    def key(kind, record_id):
+        return kind + ':' + str(int(record_id))
+
+    def get(self, kind, record_id, owner_id):
+        """
+        Return the cached json of a record if it belongs to the user.
+        :param kind: event, guest or ticket
+        :param record_id: Record Id
+        :param owner_id: Id of the user asking for the record
+        :return: Json representation or None on a miss
+        """
+        value = self.backend.get(self.key(kind, record_id))
+        entry = json.loads(value) if value is not None else None
+        hit = entry is not None and entry['owner'] == owner_id
+        with self._lock:
+            if hit:
+                self._hits += 1
+            else:
+                self._misses += 1
+        return entry['data'] if hit else None
+
+    def generation(self, kind, record_id):
+        """
+        Return the generation of a record's key, to be read before the record is loaded from the database.
+        :param kind: event, guest or ticket
+        :param record_id: Record Id
+        :return: Generation, or None if it cannot be read
+        """
+        return self.backend.generation(self.key(kind, record_id))
+
+    def set(self, kind, record_id, owner_id, data, generation):
+        """
+        Cache the json representation of a record read from the database, unless the record was
+        evicted since its generation was read. The generation is checked again after the entry is
+        stored, an eviction moves it forward before deleting the entry, so either this check or
+        the eviction removes an entry stored from an outdated read.
+        :param kind: event, guest or ticket
+        :param record_id: Record Id
+        :param owner_id: Id of the user owning the record
+        :param data: Json representation
+        :param generation: Generation read before the record was loaded
+        :return:
+        """
+        key = self.key(kind, record_id)
+        if generation is None or self.backend.generation(key) != generation:
+            return
+        self.backend.set(key, json.dumps({'owner': owner_id, 'data': data}), self.ttl)
+        if self.backend.generation(key) != generation:
+            self.backend.delete([key])
+
+    def invalidate(self, session, kind, record_id):
+        """
+        Evict a record changed in the session's transaction once the transaction commits.
+        :param session: Session
+        :param kind: event, guest or ticket
+        :param record_id: Record Id
+        :return:
+        """
+        if record_id is not None:
+            session.info.setdefault('response_cache_keys', set()).add(self.key(kind, record_id))
+
+    def evict(self, keys):
+        """
+        Move the generation of keys forward, then evict their entries from the backend.
+        :param keys: Cache keys
+        :return:
+        """
+        if keys:
+            self.backend.bump(keys, self.ttl)
+            self.backend.delete(keys)
+            with self._lock:
+                self._invalidations += len(keys)
+
+    def clear(self):
+        """
+        Remove all the entries and reset the counters.
+        :return:
+        """
+        self.backend.clear()
+        with self._lock:
+            self._hits = self._misses = self._invalidations = 0
+
+    def stats(self):
+        """
+        Cache metrics: backend, hits, misses, hit rate and evictions of changed records.
+        :return: Dict of metrics
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'backend': self.backend.name,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(float(self._hits) / lookups, 4) if lookups else 0.0,
+                'invalidations': self._invalidations
+            }
+
+
+def make_backend():
+    """
+    Create the response cache backend chosen by the RESPONSE_CACHE_BACKEND setting.
+    The redis package is only needed by the redis backend.
+    :return: Backend
+    """
+    if app.config['RESPONSE_CACHE_BACKEND'] == 'redis':
+        import redis
+        client = redis.StrictRedis.from_url(app.config['RESPONSE_CACHE_REDIS_URL'])
+        return RedisBackend(client, errors=(redis.RedisError,))
+    return LocalBackend(app.config['RESPONSE_CACHE_SIZE'])
+
+
+response_cache = ResponseCache(make_backend(), app.config['RESPONSE_CACHE_SECONDS'])
+
+
+@event.listens_for(Session, 'after_commit')
+def evict_committed(session):
+    response_cache.evict(session.info.pop('response_cache_keys', None))
+
+
+@event.listens_for(Session, 'after_rollback')
+def keep_rolled_back(session):
+    session.info.pop('response_cache_keys', None)
@@ -0,0 +1,33 @@
+from flask import g
+from app.models.events import Event
+from app.models.guests import Guest
+
+
+def get_user_event(current_user, event_id):
+    """
+    Return the event with the given Id if it belongs to the user.
+    The event is looked up once per request and reused by every later call.
+    :param current_user: User
+    :param event_id: Event Id
+    :return: Event or None
+    """
+    events = g.setdefault('user_events', {})
+    key = (current_user.id, int(event_id))
+    if key not in events:
+        events[key] = Event.query.filter_by(user_id=current_user.id, event_id=event_id).first()
+    return events[key]
+
+
+def get_user_guest(current_user, guest_id):
+    """
+    Return the guest with the given Id if it belongs to the user.
+    The guest is looked up once per request and reused by every later call.
+    :param current_user: User
+    :param guest_id: Guest Id
+    :return: Guest or None
+    """
+    guests = g.setdefault('user_guests', {})
+    key = (current_user.id, int(guest_id))
+    if key not in guests:
+        guests[key] = Guest.query.filter_by(user_id=current_user.id, guest_id=guest_id).first()
+    return guests[key]
@@ -1,6 +1,24 @@
 from flask import make_response, jsonify, url_for
 from app import app
 from app.models.events import Event
+from app.pagination import paginate, seek
+from app.search import search
+from app.export import created_between
+
+# Columns of the event export by name
+EVENT_EXPORT_COLUMNS = (
+    ('event_id', Event.event_id),
+    ('event_name', Event.event_name),
+    ('event_location', Event.event_location),
+    ('event_eval_link', Event.event_eval_link),
+    ('event_time', Event.event_time),
+    ('created_on', Event.event_created_on),
+    ('modified_on', Event.event_updated_on),
+    ('tickets_total', Event.tickets_total),
+    ('tickets_accepted', Event.tickets_accepted),
+    ('tickets_vvip', Event.tickets_vvip),
+    ('tickets_checked_in', Event.tickets_checked_in)
+)
 
 
 def response_for_user_event(user_event):
@@ -77,34 +95,69 @@ def response_with_pagination(events, previous, nex, count):
     })), 200
 
 
-def paginate_events(user_id, page, q, user):
+def paginate_events(user_id, page, q, user, cursor=None, per_page=None, count=True):
     """
     Get a user by Id, then get hold of their events and also paginate the results.
     There is also an option to search for an event name if the query param is set.
     Generate previous and next pagination urls
+    When a cursor is given the events are paged by creation time instead of page number
+    and no total count is returned.
     :param q: Query parameter
     :param user_id: User Id
     :param user: Current User
     :param page: Page number
-    :return: Pagination next url, previous url and the user events.
+    :param cursor: Cursor from a previous page, an empty string for the first page
+    :param per_page: Page size requested by the client, defaults to the configured page size
+    :param count: Whether to count the total, the total is None otherwise
+    :return: Pagination next url, total, previous url and the user events.
     """
     if q:
-        pagination = Event.query.filter(Event.event_name.like("%" + q.lower().strip() + "%")).filter_by(user_id=user_id) \
-            .paginate(page=page, per_page=app.config['EVENTS_AND_TICKETS_PER_PAGE'], error_out=False)
+        query = search(Event.query.filter_by(user_id=user_id), Event.event_name, q)
     else:
-        pagination = user.events.paginate(page=page, per_page=app.config['EVENTS_AND_TICKETS_PER_PAGE'],
-                                           error_out=False)
+        query = user.events
+
+    page_size = per_page or app.config['EVENTS_AND_TICKETS_PER_PAGE']
+    # Parameters carried over to the previous and next urls
+    link_args = dict(per_page=per_page, count=None if count else 'false', _external=True)
+
+    if cursor is not None:
+        items, next_cursor, previous_cursor = seek(query, Event.event_created_on, Event.event_id, cursor, page_size)
+        nex = url_for('events.eventlist', q=q, cursor=next_cursor, **link_args) if next_cursor else None
+        previous = url_for('events.eventlist', q=q, cursor=previous_cursor, **link_args) if previous_cursor else None
+        return items, nex, None, previous
+
+    pagination = paginate(query.order_by(Event.event_created_on, Event.event_id), page, page_size, count)
     previous = None
     if pagination.has_prev:
-        if q:
-            previous = url_for('events.eventlist', q=q, page=page - 1, _external=True)
-        else:
-            previous = url_for('events.eventlist', page=page - 1, _external=True)
+        previous = url_for('events.eventlist', q=q, page=page - 1, **link_args)
     nex = None
     if pagination.has_next:
-        if q:
-            nex = url_for('events.eventlist', q=q, page=page + 1, _external=True)
-        else:
-            nex = url_for('events.eventlist', page=page + 1, _external=True)
-    items = pagination.items
-    return items, nex, pagination, previous
\ No newline at end of file
+        nex = url_for('events.eventlist', q=q, page=page + 1, **link_args)
+    return pagination.items, nex, pagination.total, previous
+
+
+def export_user_events(user_id, since, until):
+    """
+    Query the columns of the user's events created in a time range, in the order they were created.
+    :param user_id: User Id
+    :param since: Earliest creation time, or None
+    :param until: Latest creation time excluded, or None
+    :return: Query and column names
+    """
+    query = Event.query.filter_by(user_id=user_id) \
+        .with_entities(*[column for _, column in EVENT_EXPORT_COLUMNS]) \
+        .order_by(Event.event_created_on, Event.event_id)
+    query = created_between(query, Event.event_created_on, since, until)
+    return query, [name for name, _ in EVENT_EXPORT_COLUMNS]
+
+
+def response_with_suggestions(suggestions):
+    """
+    Http response for autocomplete suggestions.
+    :param suggestions: List of values and the number of times they are used
+    :return: Http Json response
+    """
+    return make_response(jsonify({
+        'status': 'success',
+        'suggestions': [{'value': value, 'count': count} for value, count in suggestions]
+    })), 200
@@ -1,8 +1,13 @@
 from flask import Blueprint, request, abort
 from app.auth.helper import token_required
 from app.events.helper import response, response_for_created_event, response_for_user_event, response_with_pagination, \
-    get_user_events_json_list, paginate_events
-from app.models.users import User
+    get_user_events_json_list, paginate_events, export_user_events, response_with_suggestions
+from app.context import get_user_event
+from app import app
+from app.pagination import InvalidCursor, per_page_arg, count_arg
+from app.export import InvalidExport, export_args, export_response
+from app.autocomplete import event_locations, suggestion_limit_arg
+from app.cache import response_cache
 from app.models.events import Event
 
 # Initialize blueprint
@@ -18,15 +23,20 @@ def eventlist(current_user):
     :param current_user:
     :return:
     """
-    user = User.get_by_id(current_user.id)
     page = request.args.get('page', 1, type=int)
     q = request.args.get('q', None, type=str)
+    cursor = request.args.get('cursor', None, type=str)
+    per_page = per_page_arg(app.config['EVENTS_MAX_PER_PAGE'])
+    count = count_arg()
 
-    items, nex, pagination, previous = paginate_events(current_user.id, page, q, user)
+    try:
+        items, nex, total, previous = paginate_events(current_user.id, page, q, current_user, cursor, per_page, count)
+    except InvalidCursor:
+        return response('failed', 'Please provide a valid cursor', 400)
 
     if items:
-        return response_with_pagination(get_user_events_json_list(items), previous, nex, pagination.total)
-    return response_with_pagination([], previous, nex, 0)
+        return response_with_pagination(get_user_events_json_list(items), previous, nex, total)
+    return response_with_pagination([], previous, nex, 0 if cursor is None and count else None)
 
 
 @events.route('/events', methods=['POST'])
@@ -52,11 +62,41 @@ def create_event(current_user):
     return response('failed', 'Content-type must be json', 202)
 
 
+@events.route('/events/export', methods=['GET'])
+@token_required
+def export_events(current_user):
+    """
+    Stream all the user's events as CSV or newline delimited JSON, optionally gzipped and
+    limited to the events created in a time range.
+    :param current_user: Current User
+    :return: Streamed Http response
+    """
+    try:
+        export_format, compress, since, until = export_args()
+    except InvalidExport:
+        return response('failed', 'Provide a valid format, csv or ndjson, and valid since and until times', 400)
+    query, names = export_user_events(current_user.id, since, until)
+    return export_response(query, names, export_format, compress, 'events')
+
+
+@events.route('/events/locations', methods=['GET'])
+@token_required
+def locations(current_user):
+    """
+    Suggest the locations of the user's events starting with the prefix query param,
+    the locations of most events first.
+    :param current_user: Current User
+    :return: Http Json response
+    """
+    prefix = request.args.get('prefix', '', type=str)
+    return response_with_suggestions(event_locations.suggest(current_user.id, prefix, suggestion_limit_arg()))
+
+
 @events.route('/events/<event_id>', methods=['GET'])
 @token_required
 def get_event(current_user, event_id):
     """
-    Return a user event with the supplied user Id.
+    Return a user event with the supplied user Id, from the response cache when it was read recently.
     :param current_user: User
     :param event_id: Event Id
     :return:
@@ -66,9 +106,15 @@ def get_event(current_user, event_id):
     except ValueError:
         return response('failed', 'Please provide a valid Event Id', 400)
     else:
-        user_event = User.get_by_id(current_user.id).events.filter_by(event_id=event_id).first()
+        cached = response_cache.get('event', event_id, current_user.id)
+        if cached is not None:
+            return response_for_user_event(cached)
+        generation = response_cache.generation('event', event_id)
+        user_event = get_user_event(current_user, event_id)
         if user_event:
-            return response_for_user_event(user_event.json())
+            user_event_json = user_event.json()
+            response_cache.set('event', user_event.event_id, current_user.id, user_event_json, generation)
+            return response_for_user_event(user_event_json)
         return response('failed', "Event not found", 404)
 
 
@@ -95,7 +141,7 @@ def edit_event(current_user, event_id):
                 int(event_id)
             except ValueError:
                 return response('failed', 'Please provide a valid Event Id', 400)
-            user_event = User.get_by_id(current_user.id).events.filter_by(event_id=event_id).first()
+            user_event = get_user_event(current_user, event_id)
             if user_event:
                 user_event.update(updated_event)
                 return response_for_created_event(user_event, 201)
@@ -117,7 +163,7 @@ def delete_event(current_user, event_id):
         int(event_id)
     except ValueError:
         return response('failed', 'Please provide a valid Event Id', 400)
-    user_event = User.get_by_id(current_user.id).events.filter_by(event_id=event_id).first()
+    user_event = get_user_event(current_user, event_id)
     if not user_event:
         abort(404)
     user_event.delete()
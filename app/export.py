@@ -0,0 +1,140 @@
+from flask import Response, request, stream_with_context
+from app import app
+from app.pagination import parse_datetime
+import csv
+import datetime
+import io
+import json
+import zlib
+
+# Media type of every export format
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson'
+}
+
+
+class InvalidExport(ValueError):
+    """
+    Raised when the export parameters of the query string are not valid.
+    """
+    pass
+
+
+def export_args():
+    """
+    Read the export format, gzip flag and creation time range sent in the query string.
+    :return: Format, whether to gzip the body, since and until times or None
+    """
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in EXPORT_FORMATS:
+        raise InvalidExport(export_format)
+    compress = request.args.get('gzip', 'false').lower() in ('true', '1')
+    times = []
+    for name in ('since', 'until'):
+        value = request.args.get(name)
+        time = parse_datetime(value) if value is not None else None
+        if value is not None and time is None:
+            raise InvalidExport(value)
+        times.append(time)
+    return export_format, compress, times[0], times[1]
+
+
+def created_between(query, column, since, until):
+    """
+    Restrict a query to the rows created in a time range.
+    :param query: Query
+    :param column: Creation time column
+    :param since: Earliest creation time included, or None
+    :param until: Creation time excluded, or None
+    :return: Filtered query
+    """
+    if since is not None:
+        query = query.filter(column >= since)
+    if until is not None:
+        query = query.filter(column < until)
+    return query
+
+
+def csv_value(value):
+    """
+    Text of a value in a CSV cell.
+    :param value: Column value
+    :return: Cell value
+    """
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+def json_value(value):
+    """
+    Json serializer of the values json cannot encode by itself.
+    :param value: Column value
+    :return: Serializable value
+    """
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError(repr(value))
+
+
+def encode_rows(rows, names, export_format):
+    """
+    Encode rows as text, a header line first for CSV. The rows are read in batches through
+    a server side cursor and every batch is handed on as one piece of text.
+    :param rows: Query of the exported columns
+    :param names: Column names
+    :param export_format: csv or ndjson
+    :return: Generator of text
+    """
+    batch_size = app.config['EXPORT_BATCH_SIZE']
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if export_format == 'csv':
+        writer.writerow(names)
+    for number, row in enumerate(rows.yield_per(batch_size), 1):
+        if export_format == 'csv':
+            writer.writerow([csv_value(value) for value in row])
+        else:
+            buffer.write(json.dumps(dict(zip(names, row)), default=json_value) + '\n')
+        if number % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def gzip_chunks(chunks):
+    """
+    Compress a stream of text into a single gzip member as it is produced.
+    :param chunks: Iterable of text
+    :return: Generator of gzip bytes
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_response(rows, names, export_format, compress, filename):
+    """
+    Streamed http response of an export. Rows are encoded while the response is sent, so the
+    memory used does not grow with the number of rows.
+    :param rows: Query of the exported columns
+    :param names: Column names
+    :param export_format: csv or ndjson
+    :param compress: Whether to gzip the body
+    :param filename: File name without extension
+    :return: Http Response
+    """
+    chunks = encode_rows(rows, names, export_format)
+    headers = {'Content-Disposition': 'attachment; filename=' + filename + '.' + export_format}
+    if compress:
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(stream_with_context(chunks), mimetype=EXPORT_FORMATS[export_format], headers=headers)
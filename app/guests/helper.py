@@ -1,6 +1,36 @@
 from flask import make_response, jsonify, url_for
 from app import app
 from app.models.guests import Guest
+from app.pagination import paginate, seek
+from app.search import GUEST_SEARCH_TEXT, contains_words, escape_like, search_text, similar, similarity, \
+    trigram_installed
+from sqlalchemy import case, literal_column, or_
+from app.export import created_between
+from app.autocomplete import guest_organizations
+import csv
+import json
+import re
+
+# Columns of an imported guest
+GUEST_FIELDS = ('first_name', 'last_name', 'organization', 'email')
+
+# Columns of the guest export by name
+GUEST_EXPORT_COLUMNS = (
+    ('guest_id', Guest.guest_id),
+    ('first_name', Guest.first_name),
+    ('last_name', Guest.last_name),
+    ('organization', Guest.organization),
+    ('email', Guest.email),
+    ('created_on', Guest.guest_created_on),
+    ('modified_on', Guest.guest_updated_on)
+)
+
+
+class InvalidImport(ValueError):
+    """
+    Raised when an imported CSV file has no header naming the guest columns.
+    """
+    pass
 
 
 def response_for_user_guest(user_guest):
@@ -77,34 +107,218 @@ def response_with_pagination(guests, previous, nex, count):
     })), 200
 
 
-def paginate_guests(user_id, page, q, user):
+def paginate_guests(user_id, page, q, user, cursor=None, per_page=None, count=True):
     """
     Get a user by Id, then get hold of their guests and also paginate the results.
-    There is also an option to search for a guest name if the query param is set.
+    There is also an option to search the guests by name, organization or email if the query
+    param is set, the best matches come first unless the guests are paged with a cursor.
     Generate previous and next pagination urls
+    When a cursor is given the guests are paged by creation time instead of page number
+    and no total count is returned.
     :param q: Query parameter
     :param user_id: User Id
     :param user: Current User
     :param page: Page number
-    :return: Pagination next url, previous url and the user guests.
+    :param cursor: Cursor from a previous page, an empty string for the first page
+    :param per_page: Page size requested by the client, defaults to the configured page size
+    :param count: Whether to count the total, the total is None otherwise
+    :return: Pagination next url, total, previous url and the user guests.
     """
+    relevance = []
     if q:
-        pagination = Guest.query.filter(Guest.last_name.like("%" + q.lower().strip() + "%")).filter_by(user_id=user_id) \
-            .paginate(page=page, per_page=app.config['EVENTS_AND_TICKETS_PER_PAGE'], error_out=False)
+        query, relevance = search_guests(Guest.query.filter_by(user_id=user_id), q)
     else:
-        pagination = user.guests.paginate(page=page, per_page=app.config['EVENTS_AND_TICKETS_PER_PAGE'],
-                                           error_out=False)
+        query = user.guests
+
+    page_size = per_page or app.config['EVENTS_AND_TICKETS_PER_PAGE']
+    # Parameters carried over to the previous and next urls
+    link_args = dict(per_page=per_page, count=None if count else 'false', _external=True)
+
+    if cursor is not None:
+        items, next_cursor, previous_cursor = seek(query, Guest.guest_created_on, Guest.guest_id, cursor, page_size)
+        nex = url_for('guests.guestlist', q=q, cursor=next_cursor, **link_args) if next_cursor else None
+        previous = url_for('guests.guestlist', q=q, cursor=previous_cursor, **link_args) if previous_cursor else None
+        return items, nex, None, previous
+
+    pagination = paginate(query.order_by(*relevance + [Guest.guest_created_on, Guest.guest_id]), page, page_size,
+                          count)
     previous = None
     if pagination.has_prev:
-        if q:
-            previous = url_for('guests.guestlist', q=q, page=page - 1, _external=True)
-        else:
-            previous = url_for('guests.guestlist', page=page - 1, _external=True)
+        previous = url_for('guests.guestlist', q=q, page=page - 1, **link_args)
     nex = None
     if pagination.has_next:
-        if q:
-            nex = url_for('guests.guestlist', q=q, page=page + 1, _external=True)
-        else:
-            nex = url_for('guests.guestlist', page=page + 1, _external=True)
-    items = pagination.items
-    return items, nex, pagination, previous
\ No newline at end of file
+        nex = url_for('guests.guestlist', q=q, page=page + 1, **link_args)
+    return pagination.items, nex, pagination.total, previous
+
+
+def search_guests(query, q):
+    """
+    Restrict a guest query to the guests whose first name, last name, organization and email
+    contain every word of the search string, all four being searched as one text through a
+    single trigram index. With pg_trgm installed, guests with fields similar to the search
+    string are found too, so misspelled names still match.
+    The guests with a name, organization or email starting with the search string rank first,
+    then the closest matches when the fuzzy search is available.
+    :param query: Guest query
+    :param q: Search string
+    :return: Filtered query and the relevance order
+    """
+    fields = search_text(GUEST_SEARCH_TEXT)
+    prefix = escape_like(q.strip()) + '%'
+    full_name = Guest.first_name.op('||')(literal_column("' '")).op('||')(Guest.last_name)
+    starts = or_(*[column.ilike(prefix, escape='\\') for column in
+                   (Guest.first_name, Guest.last_name, full_name, Guest.organization, Guest.email)])
+    relevance = [case([(starts, 0)], else_=1)]
+    if trigram_installed():
+        query = query.filter(or_(contains_words(fields, q), similar(GUEST_SEARCH_TEXT, q)))
+        relevance.append(similarity(GUEST_SEARCH_TEXT, q).desc())
+    else:
+        query = query.filter(contains_words(fields, q))
+    return query, relevance
+
+
+def read_csv_guests(stream):
+    """
+    Read the rows of a CSV body one line at a time. The first line is a header naming the columns.
+    Undecodable bytes are kept as surrogates so the row is reported instead of failing the import.
+    :param stream: Request body stream
+    :return: Generator of row dicts and error messages
+    """
+    reader = csv.DictReader(line.decode('utf-8', 'surrogateescape') for line in stream)
+    if reader.fieldnames is None:
+        raise InvalidImport()
+    reader.fieldnames = [name.strip().lstrip('\ufeff').lower() for name in reader.fieldnames]
+    if not set(GUEST_FIELDS) <= set(reader.fieldnames):
+        raise InvalidImport()
+    for row in reader:
+        yield row, None
+
+
+def read_ndjson_guests(stream):
+    """
+    Read the JSON objects of a newline delimited JSON body one line at a time. Blank lines are skipped.
+    :param stream: Request body stream
+    :return: Generator of row dicts and error messages
+    """
+    for line in stream:
+        line = line.decode('utf-8', 'surrogateescape').strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield None, 'Invalid JSON'
+            continue
+        if not isinstance(row, dict):
+            yield None, 'Row must be a JSON object'
+            continue
+        yield row, None
+
+
+def validate_guest_row(row):
+    """
+    Check that an imported row has every guest field and a well formed email.
+    :param row: Row dict
+    :return: Guest dict and None, or None and the error message
+    """
+    guest = {}
+    for field in GUEST_FIELDS:
+        value = row.get(field)
+        if not isinstance(value, str) or not value.strip():
+            return None, 'Missing ' + field
+        try:
+            value.encode('utf-8')
+        except UnicodeEncodeError:
+            return None, 'Not UTF-8 encoded'
+        guest[field] = value.strip()
+    if len(guest['email']) > 255 or not re.match(r"[^@]+@[^@]+\.[^@]+", guest['email']):
+        return None, 'Wrong email format'
+    return guest, None
+
+
+def import_guest_rows(user_id, rows):
+    """
+    Import streamed rows as guests of the user. Valid rows are inserted and committed in chunks,
+    so neither the body nor the guests are ever held in memory all at once.
+    :param user_id: User Id
+    :param rows: Iterable of row dicts and error messages
+    :return: Dict with the number of rows read, imported and failed and the error of every failed row
+    """
+    chunk_size = app.config['GUEST_IMPORT_CHUNK_SIZE']
+    errors = []
+    emails = set()
+    chunk = []
+    imported = 0
+    number = 0
+    for number, (row, error) in enumerate(rows, 1):
+        guest = None
+        if error is None:
+            guest, error = validate_guest_row(row)
+        if guest is not None and guest['email'] in emails:
+            error = 'Duplicate email in the import'
+        if error is not None:
+            errors.append({'row': number, 'error': error})
+            continue
+        emails.add(guest['email'])
+        chunk.append((number, guest))
+        if len(chunk) == chunk_size:
+            imported += insert_guest_chunk(user_id, chunk, errors)
+            chunk = []
+    if chunk:
+        imported += insert_guest_chunk(user_id, chunk, errors)
+    if imported:
+        # The guests were inserted outside of the session, the organizations are read again on the next request
+        guest_organizations.evict(user_id)
+    errors.sort(key=lambda error: error['row'])
+    return {'rows': number, 'imported': imported, 'failed': len(errors), 'errors': errors}
+
+
+def insert_guest_chunk(user_id, chunk, errors):
+    """
+    Insert a chunk of validated guests and report the ones whose email is already used.
+    :param user_id: User Id
+    :param chunk: List of row numbers and guest dicts
+    :param errors: List the errors are appended to
+    :return: Number of guests inserted
+    """
+    inserted = Guest.insert_many(user_id, [guest for _, guest in chunk])
+    for number, guest in chunk:
+        if guest['email'] not in inserted:
+            errors.append({'row': number, 'error': 'Email already used'})
+    return len(inserted)
+
+
+def response_with_import_report(report):
+    """
+    Http response for a guest import.
+    :param report: Dict of the import outcome
+    :return: Http Json response
+    """
+    return make_response(jsonify(dict(report, status='success'))), 200
+
+
+def export_user_guests(user_id, since, until):
+    """
+    Query the columns of the user's guests created in a time range, in the order they were created.
+    :param user_id: User Id
+    :param since: Earliest creation time, or None
+    :param until: Latest creation time excluded, or None
+    :return: Query and column names
+    """
+    query = Guest.query.filter_by(user_id=user_id) \
+        .with_entities(*[column for _, column in GUEST_EXPORT_COLUMNS]) \
+        .order_by(Guest.guest_created_on, Guest.guest_id)
+    query = created_between(query, Guest.guest_created_on, since, until)
+    return query, [name for name, _ in GUEST_EXPORT_COLUMNS]
+
+
+def response_with_suggestions(suggestions):
+    """
+    Http response for autocomplete suggestions.
+    :param suggestions: List of values and the number of times they are used
+    :return: Http Json response
+    """
+    return make_response(jsonify({
+        'status': 'success',
+        'suggestions': [{'value': value, 'count': count} for value, count in suggestions]
+    })), 200
@@ -1,8 +1,14 @@
 from flask import Blueprint, request, abort
 from app.auth.helper import token_required
 from app.guests.helper import response, response_for_created_guest, response_for_user_guest, response_with_pagination, \
-    get_user_guests_json_list, paginate_guests
-from app.models.users import User
+    get_user_guests_json_list, paginate_guests, InvalidImport, read_csv_guests, read_ndjson_guests, import_guest_rows, \
+    response_with_import_report, export_user_guests, response_with_suggestions
+from app.context import get_user_guest
+from app import app
+from app.pagination import InvalidCursor, per_page_arg, count_arg
+from app.export import InvalidExport, export_args, export_response
+from app.autocomplete import guest_organizations, suggestion_limit_arg
+from app.cache import response_cache
 from app.models.guests import Guest
 import re
 
@@ -19,15 +25,20 @@ def guestlist(current_user):
     :param current_user:
     :return:
     """
-    user = User.get_by_id(current_user.id)
     page = request.args.get('page', 1, type=int)
     q = request.args.get('q', None, type=str)
+    cursor = request.args.get('cursor', None, type=str)
+    per_page = per_page_arg(app.config['GUESTS_MAX_PER_PAGE'])
+    count = count_arg()
 
-    items, nex, pagination, previous = paginate_guests(current_user.id, page, q, user)
+    try:
+        items, nex, total, previous = paginate_guests(current_user.id, page, q, current_user, cursor, per_page, count)
+    except InvalidCursor:
+        return response('failed', 'Please provide a valid cursor', 400)
 
     if items:
-        return response_with_pagination(get_user_guests_json_list(items), previous, nex, pagination.total)
-    return response_with_pagination([], previous, nex, 0)
+        return response_with_pagination(get_user_guests_json_list(items), previous, nex, total)
+    return response_with_pagination([], previous, nex, 0 if cursor is None and count else None)
 
 
 @guests.route('/guests', methods=['POST'])
@@ -54,11 +65,65 @@ def create_guest(current_user):
     return response('failed', 'Content-type must be json', 202)
 
 
+@guests.route('/guests/import', methods=['POST'])
+@token_required
+def import_guests(current_user):
+    """
+    Create many guests from a CSV or newline delimited JSON body. The body is read as it
+    arrives and the guests are inserted in chunks. Invalid rows and rows whose email is
+    already used are skipped and reported with their row number.
+    :param current_user: Current User
+    :return: Import report
+    """
+    if request.mimetype == 'text/csv':
+        rows = read_csv_guests(request.stream)
+    elif request.mimetype in ('application/x-ndjson', 'application/ndjson'):
+        rows = read_ndjson_guests(request.stream)
+    else:
+        return response('failed', 'Content-type must be text/csv or application/x-ndjson', 202)
+
+    try:
+        report = import_guest_rows(current_user.id, rows)
+    except InvalidImport:
+        return response('failed', 'The CSV header must name the first_name, last_name, organization and email columns', 400)
+    return response_with_import_report(report)
+
+
+@guests.route('/guests/export', methods=['GET'])
+@token_required
+def export_guests(current_user):
+    """
+    Stream all the user's guests as CSV or newline delimited JSON, optionally gzipped and
+    limited to the guests created in a time range.
+    :param current_user: Current User
+    :return: Streamed Http response
+    """
+    try:
+        export_format, compress, since, until = export_args()
+    except InvalidExport:
+        return response('failed', 'Provide a valid format, csv or ndjson, and valid since and until times', 400)
+    query, names = export_user_guests(current_user.id, since, until)
+    return export_response(query, names, export_format, compress, 'guests')
+
+
+@guests.route('/guests/organizations', methods=['GET'])
+@token_required
+def organizations(current_user):
+    """
+    Suggest the organizations of the user's guests starting with the prefix query param,
+    the organizations of most guests first.
+    :param current_user: Current User
+    :return: Http Json response
+    """
+    prefix = request.args.get('prefix', '', type=str)
+    return response_with_suggestions(guest_organizations.suggest(current_user.id, prefix, suggestion_limit_arg()))
+
+
 @guests.route('/guests/<guest_id>', methods=['GET'])
 @token_required
 def get_guest(current_user, guest_id):
     """
-    Return a user guest with the supplied user Id.
+    Return a user guest with the supplied user Id, from the response cache when it was read recently.
     :param current_user: User
     :param guest_id: guest Id
     :return:
@@ -68,9 +133,15 @@ def get_guest(current_user, guest_id):
     except ValueError:
         return response('failed', 'Please provide a valid Guest Id', 400)
     else:
-        user_guest = User.get_by_id(current_user.id).guests.filter_by(guest_id=guest_id).first()
+        cached = response_cache.get('guest', guest_id, current_user.id)
+        if cached is not None:
+            return response_for_user_guest(cached)
+        generation = response_cache.generation('guest', guest_id)
+        user_guest = get_user_guest(current_user, guest_id)
         if user_guest:
-            return response_for_user_guest(user_guest.json())
+            user_guest_json = user_guest.json()
+            response_cache.set('guest', user_guest.guest_id, current_user.id, user_guest_json, generation)
+            return response_for_user_guest(user_guest_json)
         return response('failed', "Guest not found", 404)
 
 
@@ -101,7 +172,7 @@ def edit_guest(current_user, guest_id):
                 int(guest_id)
             except ValueError:
                 return response('failed', 'Please provide a valid Guest Id', 400)
-            user_guest = User.get_by_id(current_user.id).guests.filter_by(guest_id=guest_id).first()
+            user_guest = get_user_guest(current_user, guest_id)
             if user_guest:
                 user_guest.update(updated_guest)
                 return response_for_created_guest(user_guest, 201)
@@ -123,7 +194,7 @@ def delete_guest(current_user, guest_id):
         int(guest_id)
     except ValueError:
         return response('failed', 'Please provide a valid Guest Id', 400)
-    user_guest = User.get_by_id(current_user.id).guests.filter_by(guest_id=guest_id).first()
+    user_guest = get_user_guest(current_user, guest_id)
     if not user_guest:
         abort(404)
     user_guest.delete()
@@ -1,19 +1,25 @@
 from app import app, db
 import datetime
+import hashlib
+import jwt
 
 class BlackListToken(db.Model):
     """
-    Table to store blacklisted/invalid auth tokens
+    Table to store blacklisted/invalid auth tokens.
+    Only a digest of the token is kept along with the time the token expires, after which
+    the row can be pruned.
     """
     __tablename__ = 'blacklist_token'
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    token = db.Column(db.String(255), unique=True, nullable=False)
+    token_digest = db.Column(db.String(64), unique=True, nullable=False)
     blacklisted_on = db.Column(db.DateTime, nullable=False)
+    expires_on = db.Column(db.DateTime, nullable=False, index=True)
 
     def __init__(self, token):
-        self.token = token
+        self.token_digest = BlackListToken.digest(token)
         self.blacklisted_on = datetime.datetime.now()
+        self.expires_on = BlackListToken.token_expiry(token)
 
     def blacklist(self):
         """
@@ -23,6 +29,32 @@ class BlackListToken(db.Model):
         db.session.add(self)
         db.session.commit()
 
+    @staticmethod
+    def digest(token):
+        """
+        Fixed size digest under which a token is stored.
+        :param token: Authorization token
+        :return: Hex encoded SHA-256 digest
+        """
+        if isinstance(token, str):
+            token = token.encode('utf-8')
+        return hashlib.sha256(token).hexdigest()
+
+    @staticmethod
+    def token_expiry(token):
+        """
+        Read the expiry time of a token, falling back to the longest token lifetime
+        when the token cannot be decoded.
+        :param token: Authorization token
+        :return: UTC datetime
+        """
+        try:
+            payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms='HS256', options={'verify_exp': False})
+            return datetime.datetime.utcfromtimestamp(payload['exp'])
+        except (jwt.InvalidTokenError, KeyError):
+            return datetime.datetime.utcnow() + datetime.timedelta(days=app.config.get('AUTH_TOKEN_EXPIRY_DAYS'),
+                                                                   seconds=app.config.get('AUTH_TOKEN_EXPIRY_SECONDS'))
+
     @staticmethod
     def check_blacklist(token):
         """
@@ -30,7 +62,26 @@ class BlackListToken(db.Model):
         :param token: Authorization token
         :return:
         """
-        response = BlackListToken.query.filter_by(token=token).first()
+        response = BlackListToken.query.filter_by(token_digest=BlackListToken.digest(token)).first()
         if response:
             return True
-        return False
\ No newline at end of file
+        return False
+
+    @staticmethod
+    def prune_expired(batch_size=1000):
+        """
+        Delete the blacklisted tokens that have expired, batch_size rows per transaction.
+        :param batch_size: Number of rows deleted per batch
+        :return: Number of deleted rows
+        """
+        deleted = 0
+        while True:
+            expired_ids = [row.id for row in db.session.query(BlackListToken.id)
+                           .filter(BlackListToken.expires_on < datetime.datetime.utcnow())
+                           .limit(batch_size)]
+            if expired_ids:
+                BlackListToken.query.filter(BlackListToken.id.in_(expired_ids)).delete(synchronize_session=False)
+                db.session.commit()
+            deleted += len(expired_ids)
+            if len(expired_ids) < batch_size:
+                return deleted
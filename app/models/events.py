@@ -1,4 +1,7 @@
 from app import app, db
+from app.cache import response_cache
+from sqlalchemy import event, text
+from sqlalchemy.orm import object_session
 import datetime
 
 class Event(db.Model):
@@ -6,6 +9,10 @@ class Event(db.Model):
     Class to represent the Event model
     """
     __tablename__ = 'events'
+    __table_args__ = (
+        # Event list of a user, in the order it is paginated
+        db.Index('ix_events_user_id_created_on', 'user_id', 'event_created_on', 'event_id'),
+    )
 
     event_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     event_name = db.Column(db.Text, nullable=False)
@@ -15,6 +22,11 @@ class Event(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     event_created_on = db.Column(db.DateTime, nullable=False)
     event_updated_on = db.Column(db.DateTime, nullable=False)
+    tickets_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    tickets_total = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    tickets_accepted = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    tickets_vvip = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    tickets_checked_in = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     tickets = db.relationship('Ticket', backref='event_tickets', lazy='dynamic')
 
     def __init__(self, name, location, time, user_id):
@@ -24,6 +36,11 @@ class Event(db.Model):
         self.event_time = time
         self.event_created_on = datetime.datetime.utcnow()
         self.event_updated_on = datetime.datetime.utcnow()
+        self.tickets_version = 0
+        self.tickets_total = 0
+        self.tickets_accepted = 0
+        self.tickets_vvip = 0
+        self.tickets_checked_in = 0
 
     def save(self):
         """
@@ -48,6 +65,67 @@ class Event(db.Model):
 
         db.session.commit()
 
+    @staticmethod
+    def apply_ticket_delta(connection, event_id, total=0, accepted=0, vvip=0, checked_in=0, manifest_changed=True,
+                           session=None):
+        """
+        Every change to the tickets of an event goes through here. The ticket counters of the
+        event are incremented by the database, in the transaction that changed the tickets, so
+        concurrent changes are never lost. When the QR codes or VVIP flags changed the tickets
+        version moves forward too, so that the cached manifests of the event are replaced.
+        The cached event, whose ticket counts changed, is evicted once the transaction commits.
+        :param connection: Connection or session running the statement
+        :param event_id: Event Id
+        :param total: Change in the number of tickets
+        :param accepted: Change in the number of accepted tickets
+        :param vvip: Change in the number of VVIP tickets
+        :param checked_in: Change in the number of tickets scanned at least once
+        :param manifest_changed: Whether the tickets version should move forward
+        :param session: Session whose commit evicts the event, db.session by default
+        :return:
+        """
+        if event_id is None or not (total or accepted or vvip or checked_in or manifest_changed):
+            return
+        events = Event.__table__
+        values = {
+            'tickets_total': events.c.tickets_total + total,
+            'tickets_accepted': events.c.tickets_accepted + accepted,
+            'tickets_vvip': events.c.tickets_vvip + vvip,
+            'tickets_checked_in': events.c.tickets_checked_in + checked_in
+        }
+        if manifest_changed:
+            values['tickets_version'] = events.c.tickets_version + 1
+        connection.execute(events.update().where(events.c.event_id == event_id).values(**values))
+        response_cache.invalidate(session or db.session, 'event', event_id)
+
+    @staticmethod
+    def recount_tickets():
+        """
+        Recompute the ticket counters of every event from the tickets table, in case they drifted.
+        :return: Number of events whose counters were repaired
+        """
+        result = db.session.execute(text("""
+            UPDATE events SET tickets_total = counts.total, tickets_accepted = counts.accepted,
+                tickets_vvip = counts.vvip, tickets_checked_in = counts.checked_in
+            FROM (
+                SELECT events.event_id,
+                    count(tickets.ticket_id) AS total,
+                    count(tickets.ticket_id) FILTER (WHERE tickets.accepted) AS accepted,
+                    count(tickets.ticket_id) FILTER (WHERE tickets.vvip) AS vvip,
+                    count(tickets.ticket_id) FILTER (WHERE tickets.scanned > 0) AS checked_in
+                FROM events LEFT JOIN tickets ON tickets.event_id = events.event_id
+                GROUP BY events.event_id
+            ) AS counts
+            WHERE events.event_id = counts.event_id
+                AND (events.tickets_total, events.tickets_accepted, events.tickets_vvip, events.tickets_checked_in)
+                    IS DISTINCT FROM (counts.total, counts.accepted, counts.vvip, counts.checked_in)
+            RETURNING events.event_id
+        """))
+        for event_id, in result:
+            response_cache.invalidate(db.session, 'event', event_id)
+        db.session.commit()
+        return result.rowcount
+
     def delete(self):
         """
         Delete an event from the database
@@ -68,5 +146,20 @@ class Event(db.Model):
             'event_eval_link': self.event_eval_link,
             'event_time': self.event_time.isoformat(),
             'created_on': self.event_created_on.isoformat(),
-            'modified_on': self.event_updated_on.isoformat()
-        }
\ No newline at end of file
+            'modified_on': self.event_updated_on.isoformat(),
+            'ticket_counts': {
+                'total': self.tickets_total,
+                'accepted': self.tickets_accepted,
+                'vvip': self.tickets_vvip,
+                'checked_in': self.tickets_checked_in
+            }
+        }
+
+
+@event.listens_for(Event, 'after_update')
+@event.listens_for(Event, 'after_delete')
+def event_changed(mapper, connection, target):
+    """
+    Evict an event changed through the session from the response cache once the transaction commits.
+    """
+    response_cache.invalidate(object_session(target), 'event', target.event_id)
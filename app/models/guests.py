@@ -1,11 +1,19 @@
 from app import app, db
+from app.cache import response_cache
+from sqlalchemy import event, text
+from sqlalchemy.orm import object_session
 import datetime
+import json
 
 class Guest(db.Model):
     """
     Class to represent the Guest model
     """
     __tablename__ = 'guests'
+    __table_args__ = (
+        # Guest list of a user, in the order it is paginated
+        db.Index('ix_guests_user_id_created_on', 'user_id', 'guest_created_on', 'guest_id'),
+    )
 
     guest_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
@@ -35,6 +43,28 @@ class Guest(db.Model):
         db.session.add(self)
         db.session.commit()
 
+    @staticmethod
+    def insert_many(user_id, guests):
+        """
+        Insert a chunk of guests with a single INSERT and commit it. The chunk is sent as one
+        JSON parameter, which keeps the statement small whatever the chunk size. Guests whose
+        email is already used are skipped by the unique constraint instead of failing the whole chunk.
+        :param user_id: User Id
+        :param guests: List of dicts with a first_name, last_name, organization and email
+        :return: Set of the emails of the guests inserted
+        """
+        rows = db.session.execute(text("""
+            INSERT INTO guests (user_id, first_name, last_name, organization, email, guest_created_on, guest_updated_on)
+            SELECT :user_id, first_name, last_name, organization, email, :now, :now
+            FROM json_to_recordset(CAST(:guests AS json))
+                AS chunk(first_name text, last_name text, organization text, email varchar)
+            ON CONFLICT (email) DO NOTHING
+            RETURNING email
+        """), {'guests': json.dumps(guests), 'user_id': user_id, 'now': datetime.datetime.utcnow()})
+        inserted = set(email for email, in rows)
+        db.session.commit()
+        return inserted
+
     def update(self, guest):
         """
         Update some guest data
@@ -71,4 +101,13 @@ class Guest(db.Model):
             'email': self.email,
             'created_on': self.guest_created_on.isoformat(),
             'modified_on': self.guest_updated_on.isoformat()
-        }
\ No newline at end of file
+        }
+
+
+@event.listens_for(Guest, 'after_update')
+@event.listens_for(Guest, 'after_delete')
+def guest_changed(mapper, connection, target):
+    """
+    Evict a guest changed through the session from the response cache once the transaction commits.
+    """
+    response_cache.invalidate(object_session(target), 'guest', target.guest_id)
@@ -0,0 +1,82 @@
+from app import db
+from app.cache import response_cache
+from app.models.events import Event
+from sqlalchemy import text
+import datetime
+import json
+
+
+class TicketScan(db.Model):
+    """
+    A scan of a ticket uploaded by a door scanner. The scan Id is generated by the scanner,
+    so uploading the same scan again is recognised and not counted twice.
+    """
+
+    __tablename__ = 'ticket_scans'
+    __table_args__ = (
+        db.UniqueConstraint('event_id', 'scan_id', name='uq_ticket_scans_event_id_scan_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    scan_id = db.Column(db.String(64), nullable=False)
+    event_id = db.Column(db.Integer, db.ForeignKey('events.event_id', ondelete='CASCADE'), nullable=False)
+    ticket_id = db.Column(db.Integer, db.ForeignKey('tickets.ticket_id', ondelete='CASCADE'), nullable=False,
+                          index=True)
+    device_id = db.Column(db.String(64), nullable=True)
+    scanned_at = db.Column(db.DateTime, nullable=False)
+    received_on = db.Column(db.DateTime, nullable=False)
+
+    @staticmethod
+    def apply(event_id, scans):
+        """
+        Record a batch of scans of an event's tickets in a single statement and transaction.
+        Scans of unknown QR codes are left out, scans already recorded are skipped and the
+        scan count of each ticket is incremented by the number of new scans it got, as is the
+        checked in counter of the event for the tickets scanned for the first time. Those
+        tickets are checked in at the time of their earliest scan.
+        :param event_id: Event Id
+        :param scans: List of dicts with a scan_id, qr_code, scanned_at and device_id
+        :return: Dict of the outcome of each scan Id, 'applied', 'duplicate' or 'not_found', and the ticket Id
+        """
+        rows = db.session.execute(text("""
+            WITH batch AS (
+                SELECT * FROM json_to_recordset(CAST(:scans AS json))
+                    AS b(scan_id varchar, qr_code text, scanned_at timestamp, device_id varchar)
+            ), matched AS (
+                SELECT batch.scan_id, batch.scanned_at, batch.device_id, tickets.ticket_id
+                FROM batch JOIN tickets ON tickets.event_id = :event_id AND tickets.qr_code_text = batch.qr_code
+            ), inserted AS (
+                INSERT INTO ticket_scans (scan_id, event_id, ticket_id, device_id, scanned_at, received_on)
+                SELECT scan_id, :event_id, ticket_id, device_id, scanned_at, :now FROM matched
+                ON CONFLICT (event_id, scan_id) DO NOTHING
+                RETURNING scan_id, ticket_id, scanned_at
+            ), counted AS (
+                UPDATE tickets SET scanned = tickets.scanned + new_scans.total,
+                    checked_in_on = coalesce(tickets.checked_in_on, new_scans.first_scanned_at),
+                    ticket_updated_on = :now
+                FROM (SELECT ticket_id, count(*) AS total, min(scanned_at) AS first_scanned_at
+                      FROM inserted GROUP BY ticket_id) AS new_scans
+                WHERE tickets.ticket_id = new_scans.ticket_id
+                RETURNING tickets.ticket_id, tickets.scanned, new_scans.total
+            )
+            SELECT batch.scan_id, matched.ticket_id, inserted.scan_id IS NOT NULL AS applied,
+                (SELECT count(*) FROM counted WHERE counted.scanned = counted.total) AS checked_in
+            FROM batch
+            LEFT JOIN matched ON matched.scan_id = batch.scan_id
+            LEFT JOIN inserted ON inserted.scan_id = batch.scan_id
+        """), {'scans': json.dumps(scans), 'event_id': event_id, 'now': datetime.datetime.utcnow()})
+
+        outcomes = {}
+        checked_in = 0
+        for scan_id, ticket_id, applied, checked_in in rows:
+            if ticket_id is None:
+                outcome = 'not_found'
+            else:
+                outcome = 'applied' if applied else 'duplicate'
+            outcomes[scan_id] = (outcome, ticket_id)
+            if applied:
+                response_cache.invalidate(db.session, 'ticket', ticket_id)
+        # Tickets whose scan count is their number of new scans were not checked in before
+        Event.apply_ticket_delta(db.session, event_id, checked_in=checked_in, manifest_changed=False)
+        db.session.commit()
+        return outcomes
@@ -1,5 +1,12 @@
 from app import app, db
+from app.cache import response_cache
+from app.models.events import Event
+from app.models.guests import Guest
+from sqlalchemy import event, func, literal, select, cast, String, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import object_session
 import datetime
+import secrets
 
 class Ticket(db.Model):
     """
@@ -7,6 +14,19 @@ class Ticket(db.Model):
     """
 
     __tablename__ = 'tickets'
+    __table_args__ = (
+        # Ticket list of an event, newest first through a backward index scan
+        db.Index('ix_tickets_event_id_created_on', 'event_id', 'ticket_created_on', 'ticket_id'),
+        # Filtered ticket lists of the VVIPs and of the guests not scanned yet
+        db.Index('ix_tickets_event_id_created_on_vvip', 'event_id', 'ticket_created_on', 'ticket_id',
+                 postgresql_where=text('vvip')),
+        db.Index('ix_tickets_event_id_created_on_unscanned', 'event_id', 'ticket_created_on', 'ticket_id',
+                 postgresql_where=text('scanned = 0')),
+        # A guest has at most one ticket per event, the index also serves the guest's tickets
+        db.UniqueConstraint('guest_id', 'event_id', name='uq_tickets_guest_id_event_id'),
+        # Ticket check in by QR code, a QR code identifies a single ticket of an event
+        db.Index('ix_tickets_event_id_qr_code_text', 'event_id', 'qr_code_text', unique=True),
+    )
 
     ticket_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     event_id = db.Column(db.Integer, db.ForeignKey('events.event_id'))
@@ -16,6 +36,7 @@ class Ticket(db.Model):
     accepted = db.Column(db.Boolean, nullable=False)
     scanned = db.Column(db.Integer, nullable=False)
     comments = db.Column(db.Text, nullable=True)
+    checked_in_on = db.Column(db.DateTime, nullable=True)
     ticket_created_on = db.Column(db.DateTime, nullable=False)
     ticket_updated_on = db.Column(db.DateTime, nullable=False)
 
@@ -28,6 +49,7 @@ class Ticket(db.Model):
         self.scanned = scanned
         self.ticket_created_on = datetime.datetime.utcnow()
         self.ticket_updated_on = datetime.datetime.utcnow()
+        self.checked_in_on = self.ticket_created_on if int(scanned or 0) > 0 else None
 
     def save(self):
         """
@@ -37,6 +59,33 @@ class Ticket(db.Model):
         db.session.add(self)
         db.session.commit()
 
+    def save_for_user(self, user_id):
+        """
+        Persist the ticket if its event and guest belong to the user and the guest has no
+        ticket for the event yet. Ownership and uniqueness are checked by the INSERT itself.
+        :param user_id: User Id
+        :return: True if the ticket was saved
+        """
+        tickets = Ticket.__table__
+        rows = select([Event.event_id, Guest.guest_id, literal(self.qr_code_text), literal(self.vvip),
+                       literal(self.accepted), literal(self.scanned), literal(self.comments),
+                       literal(self.checked_in_on), literal(self.ticket_created_on),
+                       literal(self.ticket_updated_on)]) \
+            .where(Event.event_id == self.event_id) \
+            .where(Event.user_id == user_id) \
+            .where(Guest.guest_id == self.guest_id) \
+            .where(Guest.user_id == user_id)
+        statement = insert(tickets) \
+            .from_select(['event_id', 'guest_id', 'qr_code_text', 'vvip', 'accepted', 'scanned', 'comments',
+                          'checked_in_on', 'ticket_created_on', 'ticket_updated_on'], rows) \
+            .on_conflict_do_nothing() \
+            .returning(tickets.c.ticket_id)
+        self.ticket_id = db.session.execute(statement).scalar()
+        if self.ticket_id is not None:
+            Event.apply_ticket_delta(db.session, self.event_id, **ticket_counts(self.vvip, self.accepted, self.scanned))
+        db.session.commit()
+        return self.ticket_id is not None
+
     def update(self, scanned, accepted, vvip, comments):
         """
         Update data in the ticket
@@ -45,13 +94,81 @@ class Ticket(db.Model):
         :return:
         """
 
-        self.scanned = scanned if scanned else self.scanned
-        self.accepted = accepted if accepted else self.accepted
-        self.vvip = vvip if vvip else self.vvip
+        self.scanned = scanned if scanned is not None else self.scanned
+        self.accepted = accepted if accepted is not None else self.accepted
+        self.vvip = vvip if vvip is not None else self.vvip
         self.comments = comments if comments else self.comments
         
         db.session.commit()
 
+    @staticmethod
+    def issue(event_id, guest_ids, vvip, accepted):
+        """
+        Issue tickets of an event to many guests with a single INSERT ... SELECT. Guests who
+        already have a ticket for the event are skipped by the unique constraint. The QR codes
+        are generated by the database from a secret drawn for the request, so they cannot be guessed.
+        :param event_id: Event Id
+        :param guest_ids: Select of the Ids of the guests to invite
+        :param vvip: VVIP flag of the new tickets
+        :param accepted: Accepted flag of the new tickets
+        :return: Number of guests invited and number of tickets created
+        """
+        tickets = Ticket.__table__
+        now = datetime.datetime.utcnow()
+        candidates = guest_ids.cte('candidates')
+        qr_code = func.md5(literal(secrets.token_hex(16)) + cast(candidates.c.guest_id, String))
+        rows = select([literal(event_id), candidates.c.guest_id, qr_code, literal(vvip), literal(accepted),
+                       literal(0), literal(now), literal(now)])
+        statement = insert(tickets) \
+            .from_select(['event_id', 'guest_id', 'qr_code_text', 'vvip', 'accepted', 'scanned',
+                          'ticket_created_on', 'ticket_updated_on'], rows) \
+            .on_conflict_do_nothing() \
+            .returning(tickets.c.ticket_id) \
+            .cte('inserted')
+        invited, created = db.session.execute(select([
+            select([func.count()]).select_from(candidates).as_scalar(),
+            select([func.count()]).select_from(statement).as_scalar()
+        ])).first()
+        if created:
+            Event.apply_ticket_delta(db.session, event_id, total=created, accepted=created if accepted else 0,
+                                     vvip=created if vvip else 0)
+        db.session.commit()
+        return invited, created
+
+    @staticmethod
+    def check_in(user_id, event_id, qr_code):
+        """
+        Record a scan of the ticket with the QR code in one of the user's events.
+        The scan count is incremented by the database in a single UPDATE, so concurrent
+        scans are never lost, and the guest names are returned by the same statement. A ticket
+        whose guest was deleted is checked in too, like the manifest and scan uploads do, and
+        has no names. The time of the first scan is kept as the check in time.
+        :param user_id: User Id
+        :param event_id: Event Id
+        :param qr_code: QR code text
+        :return: Ticket Id, guest Id, scan count, VVIP, accepted and guest names, or None if there is no such ticket
+        """
+        tickets = Ticket.__table__
+        now = datetime.datetime.utcnow()
+        first_name = select([Guest.first_name]).where(Guest.guest_id == tickets.c.guest_id).as_scalar()
+        last_name = select([Guest.last_name]).where(Guest.guest_id == tickets.c.guest_id).as_scalar()
+        statement = tickets.update() \
+            .values(scanned=tickets.c.scanned + 1, checked_in_on=func.coalesce(tickets.c.checked_in_on, now),
+                    ticket_updated_on=now) \
+            .where(tickets.c.event_id == event_id) \
+            .where(tickets.c.qr_code_text == qr_code) \
+            .where(Event.event_id == tickets.c.event_id) \
+            .where(Event.user_id == user_id) \
+            .returning(tickets.c.ticket_id, tickets.c.guest_id, tickets.c.scanned, tickets.c.vvip,
+                       tickets.c.accepted, first_name.label('first_name'), last_name.label('last_name'))
+        row = db.session.execute(statement).first()
+        if row is not None:
+            response_cache.invalidate(db.session, 'ticket', row.ticket_id)
+        if row is not None and row.scanned == 1:
+            Event.apply_ticket_delta(db.session, event_id, checked_in=1, manifest_changed=False)
+        db.session.commit()
+        return row
+
     def delete(self):
         """
         Delete a ticket
@@ -60,12 +177,13 @@ class Ticket(db.Model):
         db.session.delete(self)
         db.session.commit()
 
-    def json(self):
+    def json(self, include_guest=False):
         """
         Json representation of the ticket model
+        :param include_guest: Whether to embed the json representation of the guest, null once the guest is deleted
         :return:
         """
-        return {
+        ticket = {
             'ticket_id': self.ticket_id,
             'event_id': self.event_id,
             'guest_id': self.guest_id,
@@ -76,4 +194,84 @@ class Ticket(db.Model):
             'comments' : self.comments,
             'created_on': self.ticket_created_on.isoformat(),
             'modified_on': self.ticket_updated_on.isoformat()
-        }
\ No newline at end of file
+        }
+        if include_guest:
+            ticket['guest'] = self.guest_tickets.json() if self.guest_tickets is not None else None
+        return ticket
+
+
+def ticket_counts(vvip, accepted, scanned, sign=1):
+    """
+    Contribution of a ticket to the ticket counters of its event.
+    :param vvip: VVIP flag
+    :param accepted: Accepted flag
+    :param scanned: Scan count
+    :param sign: -1 to remove the ticket from the counters
+    :return: Dict of counter changes for Event.apply_ticket_delta
+    """
+    return {
+        'total': sign,
+        'accepted': sign if accepted else 0,
+        'vvip': sign if vvip else 0,
+        'checked_in': sign if int(scanned or 0) > 0 else 0
+    }
+
+
+@event.listens_for(Ticket, 'before_update')
+def stamp_check_in(mapper, connection, target):
+    """
+    Set the check in time of a ticket whose scan count is raised from zero through the session,
+    and clear it when the scan count is reset.
+    """
+    if int(target.scanned or 0) == 0:
+        target.checked_in_on = None
+    elif target.checked_in_on is None:
+        target.checked_in_on = datetime.datetime.utcnow()
+
+
+@event.listens_for(Ticket, 'after_insert')
+def ticket_inserted(mapper, connection, target):
+    """
+    Count a ticket saved through the session in its event.
+    """
+    Event.apply_ticket_delta(connection, target.event_id, session=object_session(target),
+                             **ticket_counts(target.vvip, target.accepted, target.scanned))
+
+
+@event.listens_for(Ticket, 'after_delete')
+def ticket_deleted(mapper, connection, target):
+    """
+    Remove a ticket deleted through the session from the counters of its event and from the response cache.
+    """
+    session = object_session(target)
+    response_cache.invalidate(session, 'ticket', target.ticket_id)
+    Event.apply_ticket_delta(connection, target.event_id, session=session,
+                             **ticket_counts(target.vvip, target.accepted, target.scanned, sign=-1))
+
+
+@event.listens_for(Ticket, 'after_update')
+def ticket_updated(mapper, connection, target):
+    """
+    Move a ticket updated through the session from its old values to its new ones in the counters,
+    and evict it from the response cache.
+    """
+    session = object_session(target)
+    response_cache.invalidate(session, 'ticket', target.ticket_id)
+    state = db.inspect(target)
+
+    def old(name):
+        history = state.attrs[name].history
+        return history.deleted[0] if history.deleted else getattr(target, name)
+
+    old_event_id = old('event_id')
+    old_counts = ticket_counts(old('vvip'), old('accepted'), old('scanned'), sign=-1)
+    new_counts = ticket_counts(target.vvip, target.accepted, target.scanned)
+    manifest_changed = old_event_id != target.event_id or old('qr_code_text') != target.qr_code_text \
+        or bool(old('vvip')) != bool(target.vvip)
+    if old_event_id != target.event_id:
+        Event.apply_ticket_delta(connection, old_event_id, session=session, **old_counts)
+        Event.apply_ticket_delta(connection, target.event_id, session=session, **new_counts)
+    else:
+        delta = {name: old_counts[name] + new_counts[name] for name in new_counts}
+        Event.apply_ticket_delta(connection, target.event_id, manifest_changed=manifest_changed, session=session,
+                                 **delta)
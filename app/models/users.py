@@ -1,5 +1,6 @@
-from app import app, db, bcrypt
-from app.models.blacklist_token import BlackListToken
+from app import app, db
+from app.auth.hashing import hasher, HashingBusy
+from app.auth.revocation import revocations
 import datetime
 import jwt
 
@@ -13,14 +14,15 @@ class User(db.Model):
     email = db.Column(db.String(255), unique=True, nullable=False)
     password = db.Column(db.String(255), nullable=False)
     registered_on = db.Column(db.DateTime, nullable=False)
+    token_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     events = db.relationship('Event', backref='event', lazy='dynamic')
     guests = db.relationship('Guest', backref='guest', lazy='dynamic')
 
     def __init__(self, email, password):
         self.email = email
-        self.password = bcrypt.generate_password_hash(password, app.config.get('BCRYPT_LOG_ROUNDS')) \
-            .decode('utf-8')
+        self.password = hasher.generate_password_hash(password)
         self.registered_on = datetime.datetime.now()
+        self.token_version = 0
 
     def save(self):
         """
@@ -44,7 +46,8 @@ class User(db.Model):
                                                                        seconds=app.config.get(
                                                                            'AUTH_TOKEN_EXPIRY_SECONDS')),
                 'iat': datetime.datetime.utcnow(),
-                'sub': user_id
+                'sub': user_id,
+                'ver': self.token_version
             }
             return jwt.encode(
                 payload,
@@ -61,12 +64,24 @@ class User(db.Model):
         :param token: Auth Token
         :return:
         """
+        payload = User.decode_auth_payload(token)
+        if isinstance(payload, str):
+            return payload
+        return payload['sub']
+
+    @staticmethod
+    def decode_auth_payload(token):
+        """
+        Verify the token and return its whole payload, or an error message if the token
+        is invalid, expired or blacklisted.
+        :param token: Auth Token
+        :return: Payload dict or error message
+        """
         try:
             payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms='HS256')
-            is_token_blacklisted = BlackListToken.check_blacklist(token)
-            if is_token_blacklisted:
+            if revocations.is_revoked(token):
                 return 'Token was Blacklisted, Please login In'
-            return payload['sub']
+            return payload
         except jwt.ExpiredSignatureError:
             return 'Signature expired, Please sign in again'
         except jwt.InvalidTokenError:
@@ -96,6 +111,38 @@ class User(db.Model):
         :param new_password: New User Password
         :return:
         """
-        self.password = bcrypt.generate_password_hash(new_password, app.config.get('BCRYPT_LOG_ROUNDS')) \
-            .decode('utf-8')
-        db.session.commit()
\ No newline at end of file
+        self.password = hasher.generate_password_hash(new_password)
+        self.token_version = User.token_version + 1
+        db.session.commit()
+
+    def rehash_password(self, password):
+        """
+        Hash the password again if the stored hash does not use the current bcrypt cost.
+        Called after a successful login, it is skipped while the hashing pool is saturated.
+        :param password: The user's verified plain text password
+        :return:
+        """
+        if not hasher.needs_rehash(self.password):
+            return
+        try:
+            self.password = hasher.generate_password_hash(password)
+        except HashingBusy:
+            return
+        db.session.commit()
+
+    def revoke_tokens(self):
+        """
+        Invalidate every auth token issued to the user so far by bumping their token version.
+        :return:
+        """
+        User.query.filter_by(id=self.id).update({User.token_version: User.token_version + 1},
+                                                synchronize_session=False)
+        db.session.commit()
+
+    def is_token_current(self, payload):
+        """
+        Check that a decoded auth token was issued for the user's current token version.
+        :param payload: Decoded token payload
+        :return:
+        """
+        return payload.get('ver', 0) == self.token_version
\ No newline at end of file
@@ -0,0 +1,164 @@
+from flask import request
+from sqlalchemy import and_, or_
+import base64
+import datetime
+import json
+
+
+class InvalidCursor(ValueError):
+    """
+    Raised when a pagination cursor cannot be decoded.
+    """
+    pass
+
+
+class Page:
+    """
+    A page of results from an OFFSET query.
+    """
+
+    def __init__(self, items, page, has_next, total):
+        self.items = items
+        self.page = page
+        self.has_prev = page > 1
+        self.has_next = has_next
+        self.total = total
+
+
+def paginate(query, page, per_page, count=True):
+    """
+    Read a page of a query. One extra row is fetched to know whether a next page exists,
+    so the COUNT(*) query only runs when the total is asked for.
+    :param query: Query to paginate
+    :param page: Page number, starting at 1
+    :param per_page: Number of items per page
+    :param count: Whether to count the total number of items
+    :return: Page
+    """
+    page = max(page, 1)
+    items = query.limit(per_page + 1).offset((page - 1) * per_page).all()
+    has_next = len(items) > per_page
+    items = items[:per_page]
+    total = None
+    if count:
+        if page == 1 and not has_next:
+            total = len(items)
+        else:
+            total = query.order_by(None).count()
+    return Page(items, page, has_next, total)
+
+
+def per_page_arg(max_per_page):
+    """
+    Read the per_page query parameter, bounded by the server maximum of the resource.
+    :param max_per_page: Largest page size allowed
+    :return: Page size or None if the parameter is missing
+    """
+    per_page = request.args.get('per_page', None, type=int)
+    if per_page is None:
+        return None
+    return min(max(per_page, 1), max_per_page)
+
+
+def count_arg():
+    """
+    Read the count query parameter, count=false skips the total count query.
+    :return: Whether the total should be counted
+    """
+    return request.args.get('count', 'true').lower() != 'false'
+
+
+def parse_datetime(value):
+    """
+    Read an ISO 8601 UTC time, such as 2019-05-22T15:00:00.123Z
+    :param value: Time string
+    :return: Datetime or None if the time is not valid
+    """
+    if not isinstance(value, str):
+        return None
+    value = value.rstrip('Z')
+    for time_format in ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S'):
+        try:
+            return datetime.datetime.strptime(value, time_format)
+        except ValueError:
+            pass
+    return None
+
+
+def encode_cursor(created_on, row_id, direction):
+    """
+    Make an opaque cursor pointing at a row.
+    :param created_on: Creation time of the row
+    :param row_id: Id of the row
+    :param direction: 'next' to page after the row, 'prev' to page before it
+    :return: Url safe cursor string
+    """
+    raw = json.dumps([created_on.isoformat(), row_id, direction]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('utf-8').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Read the row position and direction out of a cursor.
+    :param cursor: Cursor string
+    :return: Creation time, row Id and direction
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_on, row_id, direction = json.loads(raw.decode('utf-8'))
+        created_on = datetime.datetime.strptime(created_on, '%Y-%m-%dT%H:%M:%S.%f' if '.' in created_on
+                                                else '%Y-%m-%dT%H:%M:%S')
+    except (ValueError, TypeError):
+        raise InvalidCursor(cursor)
+    if direction not in ('next', 'prev') or not isinstance(row_id, int):
+        raise InvalidCursor(cursor)
+    return created_on, row_id, direction
+
+
+def seek(query, created_column, id_column, cursor, per_page, descending=False):
+    """
+    Page through a query by (created_on, id) seek predicates instead of an OFFSET.
+    No count query is run, the page after or before the cursor is read with a single query.
+    An empty cursor returns the first page.
+    :param query: Query to paginate
+    :param created_column: Creation time column
+    :param id_column: Primary key column
+    :param cursor: Cursor string from a previous page or an empty string
+    :param per_page: Number of items per page
+    :param descending: Whether the rows are listed newest first
+    :return: Items, next page cursor and previous page cursor
+    """
+    direction = 'next'
+    if cursor:
+        created_on, row_id, direction = decode_cursor(cursor)
+        # Walking backwards compares and orders the opposite way and reverses the rows afterwards
+        after = descending == (direction == 'prev')
+        if after:
+            query = query.filter(or_(created_column > created_on,
+                                     and_(created_column == created_on, id_column > row_id)))
+        else:
+            query = query.filter(or_(created_column < created_on,
+                                     and_(created_column == created_on, id_column < row_id)))
+    if descending == (direction == 'prev'):
+        query = query.order_by(created_column.asc(), id_column.asc())
+    else:
+        query = query.order_by(created_column.desc(), id_column.desc())
+
+    items = query.limit(per_page + 1).all()
+    has_more = len(items) > per_page
+    items = items[:per_page]
+    if direction == 'prev':
+        items.reverse()
+    if not items:
+        return items, None, None
+
+    first, last = items[0], items[-1]
+    first_key = (getattr(first, created_column.key), getattr(first, id_column.key))
+    last_key = (getattr(last, created_column.key), getattr(last, id_column.key))
+    if direction == 'next':
+        nex = encode_cursor(last_key[0], last_key[1], 'next') if has_more else None
+        previous = encode_cursor(first_key[0], first_key[1], 'prev') if cursor else None
+    else:
+        nex = encode_cursor(last_key[0], last_key[1], 'next')
+        previous = encode_cursor(first_key[0], first_key[1], 'prev') if has_more else None
+    return items, nex, previous
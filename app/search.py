@@ -0,0 +1,141 @@
+from app import db
+from sqlalchemy import Text, and_, event, func, literal_column, text, type_coerce
+
+# Fields of a guest the guest search looks into, as a single text
+GUEST_SEARCH_TEXT = "(first_name || ' ' || last_name || ' ' || organization || ' ' || email)"
+
+# Trigram indexes serving the substring searches, as (index name, table, column or expression)
+TRIGRAM_INDEXES = (
+    ('ix_events_event_name_trgm', 'events', 'event_name'),
+    ('ix_guests_last_name_trgm', 'guests', 'last_name'),
+    ('ix_guests_search_trgm', 'guests', GUEST_SEARCH_TEXT),
+    ('ix_tickets_qr_code_text_trgm', 'tickets', 'qr_code_text'),
+)
+
+# Whether pg_trgm is installed, by database url
+trigram_installed_on = {}
+
+
+def escape_like(q):
+    """
+    Escape the LIKE wildcards in a search string so they are matched literally.
+    :param q: Search string
+    :return: Escaped search string
+    """
+    return q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def contains(column, q):
+    """
+    Case insensitive substring match of a column against a search string.
+    On Postgres the ILIKE is served by the trigram index of the column.
+    :param column: Column to search
+    :param q: Search string
+    :return: SQL expression
+    """
+    return column.ilike('%' + escape_like(q.strip()) + '%', escape='\\')
+
+
+def search_text(expression):
+    """
+    Use the SQL text of an expression, such as the one of an expression index, in a query.
+    :param expression: SQL text
+    :return: SQL expression
+    """
+    return type_coerce(literal_column(expression), Text)
+
+
+def contains_words(expression, q):
+    """
+    Case insensitive match of an expression containing every word of a search string, in any order.
+    :param expression: Text expression to search
+    :param q: Search string
+    :return: SQL expression
+    """
+    return and_(*[contains(expression, word) for word in q.split() or [q]])
+
+
+def similar(expression, q):
+    """
+    Fuzzy match of a search string against the words of an expression, served by a trigram index
+    of the expression. Only available when pg_trgm is installed.
+    :param expression: SQL text of the expression, as written in its trigram index
+    :param q: Search string
+    :return: SQL expression
+    """
+    return text(expression + ' %> :similar_q').bindparams(similar_q=q.strip())
+
+
+def similarity(expression, q):
+    """
+    How closely a search string matches the most similar words of an expression, from 0 to 1.
+    Only available when pg_trgm is installed.
+    :param expression: SQL text of the expression
+    :param q: Search string
+    :return: SQL expression
+    """
+    return func.word_similarity(q.strip(), search_text(expression))
+
+
+def trigram_installed():
+    """
+    Check once per database whether pg_trgm is installed, so the fuzzy searches can be used.
+    :return: True if the extension is installed
+    """
+    url = str(db.engine.url)
+    if url not in trigram_installed_on:
+        trigram_installed_on[url] = db.engine.dialect.name == 'postgresql' and db.session.execute(
+            "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'").first() is not None
+    return trigram_installed_on[url]
+
+
+def search(query, column, q):
+    """
+    Restrict a query to the rows whose column contains the search string.
+    :param query: Query
+    :param column: Column to search
+    :param q: Search string
+    :return: Filtered query
+    """
+    return query.filter(contains(column, q))
+
+
+def trigram_available(connection):
+    """
+    Check whether the pg_trgm extension can be used on the database.
+    :param connection: Database connection
+    :return: True if the extension is installed or can be installed
+    """
+    if connection.dialect.name != 'postgresql':
+        return False
+    return connection.execute(
+        "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'").first() is not None
+
+
+def create_trigram_indexes(connection):
+    """
+    Install pg_trgm and create the trigram indexes. Databases without the extension keep
+    working, the searches then fall back to a sequential scan.
+    :param connection: Database connection
+    :return: True if the indexes were created
+    """
+    if not trigram_available(connection):
+        return False
+    connection.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table, column in TRIGRAM_INDEXES:
+        connection.execute('CREATE INDEX IF NOT EXISTS ' + name + ' ON ' + table +
+                           ' USING gin (' + column + ' gin_trgm_ops)')
+    return True
+
+
+def include_object(obj, name, type_, reflected, compare_to):
+    """
+    Keep the trigram indexes, which are created outside of the models, out of autogenerated migrations.
+    :return: False for a trigram index
+    """
+    return not (type_ == 'index' and name in [index[0] for index in TRIGRAM_INDEXES])
+
+
+@event.listens_for(db.metadata, 'after_create')
+def after_create(target, connection, **kw):
+    create_trigram_indexes(connection)
@@ -1,8 +1,33 @@
 from flask import jsonify, make_response, request, url_for
 from app import app
 from functools import wraps
-from app.models.users import User
+from app import context
 from app.models.tickets import Ticket
+from app.models.guests import Guest
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+from app.pagination import paginate, seek, parse_datetime
+from app.search import search
+from app.export import created_between
+from app.guests.helper import search_guests
+
+# Columns of the ticket export by name, with the fields of the guest so the export is an attendance sheet
+TICKET_EXPORT_COLUMNS = (
+    ('ticket_id', Ticket.ticket_id),
+    ('qr_code', Ticket.qr_code_text),
+    ('vvip', Ticket.vvip),
+    ('accepted', Ticket.accepted),
+    ('scanned', Ticket.scanned),
+    ('checked_in_on', Ticket.checked_in_on),
+    ('comments', Ticket.comments),
+    ('created_on', Ticket.ticket_created_on),
+    ('modified_on', Ticket.ticket_updated_on),
+    ('guest_id', Ticket.guest_id),
+    ('first_name', Guest.first_name),
+    ('last_name', Guest.last_name),
+    ('organization', Guest.organization),
+    ('email', Guest.email)
+)
 
 
 def event_required(f):
@@ -56,20 +81,33 @@ def response(status, message, status_code):
     })), status_code
 
 
-def response_with_event_ticket(status, ticket, status_code):
+def response_with_event_ticket(status, ticket, status_code, include_guest=False):
     """
     Http response for response with an event ticket.
     :param status: Status Message
     :param ticket: event ticket
     :param status_code: Http Status Code
+    :param include_guest: Whether to embed the guest of the ticket
     :return:
     """
     return make_response(jsonify({
         'status': status,
-        'ticket': ticket.json()
+        'ticket': ticket.json(include_guest)
     })), status_code
 
 
+def response_with_ticket_json(ticket):
+    """
+    Http response with the json representation of a ticket.
+    :param ticket: Json representation of the ticket
+    :return:
+    """
+    return make_response(jsonify({
+        'status': 'success',
+        'ticket': ticket
+    })), 200
+
+
 def response_with_pagination(tickets, previous, nex, count):
     """
     Get the Event tickets with the result paginated
@@ -88,6 +126,209 @@ def response_with_pagination(tickets, previous, nex, count):
     })), 200
 
 
+def guest_name(first_name, last_name):
+    """
+    Full name of a guest.
+    :param first_name: First name or None
+    :param last_name: Last name or None
+    :return: Names joined by a space, or None when the ticket has no guest
+    """
+    names = [name for name in (first_name, last_name) if name]
+    return ' '.join(names) if names else None
+
+
+def response_with_check_in(checked_in):
+    """
+    Http response for a ticket check in.
+    :param checked_in: Ticket row returned by the check in
+    :return: Http Json response
+    """
+    return make_response(jsonify({
+        'status': 'success',
+        'ticket': {
+            'ticket_id': checked_in.ticket_id,
+            'guest_id': checked_in.guest_id,
+            'guest_name': guest_name(checked_in.first_name, checked_in.last_name),
+            'vvip': checked_in.vvip,
+            'accepted': checked_in.accepted,
+            'scanned': checked_in.scanned
+        }
+    })), 200
+
+
+def response_with_stats(stats):
+    """
+    Http response for the statistics of an event.
+    :param stats: Dict of statistics
+    :return: Http Json response
+    """
+    return make_response(jsonify({
+        'status': 'success',
+        'stats': stats
+    })), 200
+
+
+def response_with_issued_tickets(created, skipped):
+    """
+    Http response for a bulk ticket issuance.
+    :param created: Number of tickets created
+    :param skipped: Number of guests that got no new ticket
+    :return: Http Json response
+    """
+    return make_response(jsonify({
+        'status': 'success',
+        'created': created,
+        'skipped': skipped
+    })), 200
+
+
+def parse_bool(value, default=False):
+    """
+    Read a boolean sent as true/false, 1/0 or their string forms.
+    :param value: Sent value
+    :param default: Value used when nothing was sent
+    :return: Boolean
+    """
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in ('1', 'true', 'yes'):
+        return True
+    if isinstance(value, str) and value.strip().lower() in ('0', 'false', 'no'):
+        return False
+    raise ValueError(value)
+
+
+def select_invited_guests(current_user, data):
+    """
+    Select the user's guests a bulk ticket issuance is for: a list of guest Ids, the guests
+    matching a search query as the guest list finds them, or all the guests.
+    :param current_user: User
+    :param data: Request data with guest_ids, q or all
+    :return: Select of guest Ids, None when no guests were specified
+    """
+    query = select([Guest.guest_id]).where(Guest.user_id == current_user.id)
+    guest_ids = data.get('guest_ids')
+    if guest_ids is not None:
+        if not isinstance(guest_ids, list) or \
+                not all(isinstance(guest_id, int) and not isinstance(guest_id, bool) for guest_id in guest_ids):
+            raise ValueError(guest_ids)
+        return query.where(Guest.guest_id.in_(set(guest_ids))) if guest_ids else None
+    if data.get('q'):
+        if not isinstance(data.get('q'), str):
+            raise ValueError(data.get('q'))
+        guests, relevance = search_guests(Guest.query.filter_by(user_id=current_user.id), data.get('q'))
+        return guests.with_entities(Guest.guest_id).statement
+    if parse_bool(data.get('all')):
+        return query
+    return None
+
+
+def include_guest_arg():
+    """
+    Read the include query parameter, include=guest embeds the guest in each ticket.
+    :return: Whether to include the guests
+    """
+    return 'guest' in request.args.get('include', '').split(',')
+
+
+def ticket_filter_args():
+    """
+    Read the ticket list filters sent in the query string.
+    :return: Dict of the filter values by name
+    """
+    return {name: request.args.get(name) for name in ('vvip', 'accepted', 'scanned', 'created_since')
+            if request.args.get(name) is not None}
+
+
+def filter_tickets(query, filters):
+    """
+    Restrict a ticket query by VVIP and accepted flags, scan count and creation time.
+    The scanned filter is a number of scans or >0 for the tickets scanned at least once.
+    :param query: Ticket query
+    :param filters: Dict of the filter values by name
+    :return: Filtered query
+    :raises ValueError: When a filter value is not valid
+    """
+    if 'vvip' in filters:
+        query = query.filter(Ticket.vvip == parse_bool(filters['vvip']))
+    if 'accepted' in filters:
+        query = query.filter(Ticket.accepted == parse_bool(filters['accepted']))
+    if 'scanned' in filters:
+        scanned = filters['scanned'].strip()
+        if scanned == '>0':
+            query = query.filter(Ticket.scanned > 0)
+        else:
+            query = query.filter(Ticket.scanned == int(scanned))
+    if 'created_since' in filters:
+        created_since = parse_datetime(filters['created_since'])
+        if created_since is None:
+            raise ValueError(filters['created_since'])
+        query = query.filter(Ticket.ticket_created_on >= created_since)
+    return query
+
+
+def validate_scans(records):
+    """
+    Check the uploaded scans. A scan needs a scan Id, a QR code and a scan time, a scan Id
+    repeated within the batch is a duplicate of its first occurrence.
+    :param records: List of uploaded scans
+    :return: Valid scans and the outcome of the rejected ones by their position in the batch
+    """
+    scans = []
+    rejected = {}
+    seen = set()
+    for position, record in enumerate(records):
+        if not isinstance(record, dict):
+            rejected[position] = 'invalid'
+            continue
+        scan_id = record.get('scan_id')
+        qr_code = record.get('qr_code')
+        device_id = record.get('device_id')
+        scanned_at = parse_datetime(record.get('scanned_at'))
+        if not (isinstance(scan_id, str) and 0 < len(scan_id) <= 64 and isinstance(qr_code, str) and qr_code
+                and scanned_at and (device_id is None or isinstance(device_id, str) and len(device_id) <= 64)):
+            rejected[position] = 'invalid'
+        elif scan_id in seen:
+            rejected[position] = 'duplicate'
+        else:
+            seen.add(scan_id)
+            scans.append({'scan_id': scan_id, 'qr_code': qr_code, 'scanned_at': scanned_at.isoformat(),
+                          'device_id': device_id})
+    return scans, rejected
+
+
+def response_with_scan_outcomes(records, outcomes, rejected):
+    """
+    Http response listing the outcome of every uploaded scan, in the order they were sent.
+    :param records: List of uploaded scans
+    :param outcomes: Outcome and ticket Id of the recorded scans by scan Id
+    :param rejected: Outcome of the rejected scans by position
+    :return: Http Json response
+    """
+    results = []
+    totals = {'applied': 0, 'duplicate': 0, 'not_found': 0, 'invalid': 0}
+    for position, record in enumerate(records):
+        if position in rejected:
+            outcome, ticket_id = rejected[position], None
+        else:
+            outcome, ticket_id = outcomes[record['scan_id']]
+        totals[outcome] += 1
+        results.append({
+            'scan_id': record.get('scan_id') if isinstance(record, dict) else None,
+            'outcome': outcome,
+            'ticket_id': ticket_id
+        })
+    return make_response(jsonify({
+        'status': 'success',
+        'totals': totals,
+        'scans': results
+    })), 200
+
+
 def get_user_event(current_user, event_id):
     """
     Query the user to find and return the event specified by the event Id
@@ -95,8 +336,7 @@ def get_user_event(current_user, event_id):
     :param current_user: User
     :return:
     """
-    user_event = User.get_by_id(current_user.id).events.filter_by(event_id=event_id).first()
-    return user_event
+    return context.get_user_event(current_user, event_id)
 
 def get_user_guest(current_user, guest_id):
     """
@@ -105,8 +345,7 @@ def get_user_guest(current_user, guest_id):
     :param current_user: User
     :return:
     """
-    user_guest = User.get_by_id(current_user.id).guests.filter_by(guest_id=guest_id).first()
-    return user_guest
+    return context.get_user_guest(current_user, guest_id)
 
 def get_user_ticket(current_user, event_id, guest_id):
     """
@@ -116,41 +355,75 @@ def get_user_ticket(current_user, event_id, guest_id):
     :param current_user: User
     :return:
     """
-    user_ticket = User.get_by_id(current_user.id).guests.filter_by(guest_id=guest_id).first().tickets.filter_by(event_id=event_id).first()
-    return user_ticket
+    user_guest = get_user_guest(current_user, guest_id)
+    if user_guest is None:
+        return None
+    return user_guest.tickets.filter_by(event_id=event_id).first()
 
 
-def get_paginated_tickets(event, event_id, page, q):
+def get_paginated_tickets(event, event_id, page, q, cursor=None, per_page=None, count=True, filters=None,
+                          include_guest=False):
     """
     Get the tickets from the event and then paginate the results.
     Tickets can also be search when the query parameter is set.
     Construct the previous and next urls.
+    When a cursor is given the tickets are paged by creation time instead of page number
+    and no total count is returned.
     :param q: Query parameter
     :param event: Event
     :param event_id: Event Id
     :param page: Page number
+    :param cursor: Cursor from a previous page, an empty string for the first page
+    :param per_page: Page size requested by the client, defaults to the configured page size
+    :param count: Whether to count the total, the total is None otherwise
+    :param filters: Ticket filters by name, see filter_tickets
+    :param include_guest: Whether to load the guest of each ticket in the same query
     :return:
     """
-
+    filters = filters or {}
     if q:
-        pagination = Ticket.query.filter(Ticket.qr_code_text.like("%" + q.lower().strip() + "%")) \
-            .order_by(Ticket.ticket_created_on.desc()) \
-            .filter_by(event_id=event_id) \
-            .paginate(page=page, per_page=app.config['EVENTS_AND_TICKETS_PER_PAGE'], error_out=False)
+        query = search(Ticket.query.filter_by(event_id=event_id), Ticket.qr_code_text, q)
     else:
-        pagination = event.tickets.order_by(Ticket.ticket_created_on.desc()).paginate(page=page, per_page=app.config[
-            'EVENTS_AND_TICKETS_PER_PAGE'], error_out=False)
+        query = event.tickets
+    query = filter_tickets(query, filters)
+    if include_guest:
+        query = query.options(joinedload(Ticket.guest_tickets))
+
+    page_size = per_page or app.config['EVENTS_AND_TICKETS_PER_PAGE']
+    # Parameters carried over to the previous and next urls
+    link_args = dict(per_page=per_page, count=None if count else 'false', event_id=event_id, _external=True,
+                     include='guest' if include_guest else None, **filters)
+
+    if cursor is not None:
+        items, next_cursor, previous_cursor = seek(query, Ticket.ticket_created_on, Ticket.ticket_id, cursor, page_size,
+                                                   descending=True)
+        nex = url_for('tickets.get_tickets', q=q, cursor=next_cursor, **link_args) if next_cursor else None
+        previous = url_for('tickets.get_tickets', q=q, cursor=previous_cursor, **link_args) if previous_cursor else None
+        return items, nex, None, previous
 
+    pagination = paginate(query.order_by(Ticket.ticket_created_on.desc(), Ticket.ticket_id.desc()), page, page_size,
+                          count)
     previous = None
     if pagination.has_prev:
-        if q:
-            previous = url_for('tickets.get_tickets', q=q, event_id=event_id, page=page - 1, _external=True)
-        else:
-            previous = url_for('tickets.get_tickets', event_id=event_id, page=page - 1, _external=True)
+        previous = url_for('tickets.get_tickets', q=q, page=page - 1, **link_args)
     nex = None
     if pagination.has_next:
-        if q:
-            nex = url_for('tickets.get_tickets', q=q, event_id=event_id, page=page + 1, _external=True)
-        else:
-            nex = url_for('tickets.get_tickets', event_id=event_id, page=page + 1, _external=True)
-    return pagination.items, nex, pagination, previous
+        nex = url_for('tickets.get_tickets', q=q, page=page + 1, **link_args)
+    return pagination.items, nex, pagination.total, previous
+
+
+def export_event_tickets(event, since, until):
+    """
+    Query the columns of the event's tickets and their guests for the tickets created in a time
+    range, in the order they were created.
+    :param event: Event
+    :param since: Earliest creation time, or None
+    :param until: Latest creation time excluded, or None
+    :return: Query and column names
+    """
+    query = Ticket.query.filter_by(event_id=event.event_id) \
+        .outerjoin(Guest, Guest.guest_id == Ticket.guest_id) \
+        .with_entities(*[column for _, column in TICKET_EXPORT_COLUMNS]) \
+        .order_by(Ticket.ticket_created_on, Ticket.ticket_id)
+    query = created_between(query, Ticket.ticket_created_on, since, until)
+    return query, [name for name, _ in TICKET_EXPORT_COLUMNS]
@@ -0,0 +1,112 @@
+from app import app
+from app.cache import TTLCache
+from app.models.tickets import Ticket
+import hashlib
+import struct
+
+# Full manifest: magic, event Id, version, ticket count, digest size, then the sorted digests and the VVIP bitmap
+MANIFEST_MAGIC = b'EPM1'
+# Delta manifest: magic, event Id, from version, to version, added and removed counts, digest size,
+# then the added digests, their VVIP bitmap and the removed digests
+DELTA_MAGIC = b'EPD1'
+DIGEST_SIZE = 16
+
+# Manifests by event Id and tickets version. A new version is built when a ticket of the event changes
+manifest_cache = TTLCache(app.config['MANIFEST_CACHE_SIZE'])
+
+
+def qr_digest(qr_code):
+    """
+    Fixed width digest of a QR code, the first bytes of its SHA-256.
+    :param qr_code: QR code text
+    :return: Digest bytes
+    """
+    return hashlib.sha256(qr_code.encode('utf-8')).digest()[:DIGEST_SIZE]
+
+
+def pack_bitmap(flags):
+    """
+    Pack a list of booleans into bytes, the first flag being the lowest bit of the first byte.
+    :param flags: List of booleans
+    :return: Bitmap bytes
+    """
+    bitmap = bytearray((len(flags) + 7) // 8)
+    for position, flag in enumerate(flags):
+        if flag:
+            bitmap[position // 8] |= 1 << (position % 8)
+    return bytes(bitmap)
+
+
+class Manifest:
+    """
+    Sorted QR code digests of the tickets of an event along with their VVIP flag.
+    """
+
+    def __init__(self, event_id, version, tickets):
+        """
+        :param event_id: Event Id
+        :param version: Tickets version of the event the manifest was built at
+        :param tickets: Dict of VVIP flags by QR code digest
+        """
+        self.event_id = event_id
+        self.version = version
+        self.tickets = tickets
+        self.digests = sorted(tickets)
+
+    def to_bytes(self):
+        """
+        Binary form of the manifest.
+        :return: Bytes
+        """
+        header = struct.pack('>4sIIIB', MANIFEST_MAGIC, self.event_id, self.version, len(self.digests), DIGEST_SIZE)
+        return header + b''.join(self.digests) + pack_bitmap([self.tickets[digest] for digest in self.digests])
+
+    def delta(self, older):
+        """
+        Binary form of the changes from an older manifest of the event. A ticket whose VVIP flag
+        changed is both removed and added.
+        :param older: Older manifest
+        :return: Bytes
+        """
+        added = [digest for digest in self.digests if older.tickets.get(digest) != self.tickets[digest]]
+        removed = [digest for digest in older.digests if self.tickets.get(digest) != older.tickets[digest]]
+        header = struct.pack('>4sIIIIIB', DELTA_MAGIC, self.event_id, older.version, self.version, len(added),
+                             len(removed), DIGEST_SIZE)
+        return header + b''.join(added) + pack_bitmap([self.tickets[digest] for digest in added]) + b''.join(removed)
+
+
+def build_manifest(event):
+    """
+    Build the manifest of an event by streaming its tickets' QR codes and VVIP flags.
+    :param event: Event
+    :return: Manifest
+    """
+    tickets = {}
+    query = Ticket.query.with_entities(Ticket.qr_code_text, Ticket.vvip).filter_by(event_id=event.event_id)
+    for qr_code, vvip in query.yield_per(app.config['MANIFEST_BATCH_SIZE']):
+        tickets[qr_digest(qr_code)] = bool(vvip)
+    return Manifest(event.event_id, event.tickets_version, tickets)
+
+
+def get_manifest(event):
+    """
+    Return the manifest of the event's current tickets version, from the cache when it was built already.
+    :param event: Event
+    :return: Manifest
+    """
+    key = (event.event_id, event.tickets_version)
+    manifest = manifest_cache.get(key)
+    if manifest is None:
+        manifest = build_manifest(event)
+        manifest_cache.set(key, manifest)
+    return manifest
+
+
+def get_cached_manifest(event_id, version):
+    """
+    Return an older manifest of an event if it is still cached.
+    :param event_id: Event Id
+    :param version: Tickets version
+    :return: Manifest or None
+    """
+    return manifest_cache.get((event_id, version))
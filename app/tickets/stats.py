@@ -0,0 +1,98 @@
+from app import app, db
+from app.cache import TTLCache
+from sqlalchemy import text
+
+# Bits of GROUPING(guests.organization, minute) telling which grouping set a row belongs to
+EVENT_TOTALS = 3
+BY_ORGANIZATION = 1
+BY_MINUTE = 2
+
+# Statistics by event Id and ticket counters. Any ticket change moves the counters of its event
+# to a new key, guest changes such as a new organization show up once the entry expires
+stats_cache = TTLCache(app.config['STATS_CACHE_SIZE'], app.config['STATS_CACHE_SECONDS'])
+
+STATS_QUERY = text("""
+    SELECT GROUPING(guests.organization, date_trunc('minute', tickets.checked_in_on)) AS grouping_set,
+        guests.organization, date_trunc('minute', tickets.checked_in_on) AS minute,
+        count(*) AS total,
+        count(*) FILTER (WHERE tickets.accepted) AS accepted,
+        count(*) FILTER (WHERE tickets.vvip) AS vvip,
+        count(*) FILTER (WHERE tickets.scanned > 0) AS checked_in,
+        count(*) FILTER (WHERE tickets.vvip AND tickets.scanned > 0) AS vvip_checked_in
+    FROM tickets LEFT JOIN guests ON guests.guest_id = tickets.guest_id
+    WHERE tickets.event_id = :event_id
+    GROUP BY GROUPING SETS ((), (guests.organization), (date_trunc('minute', tickets.checked_in_on)))
+""")
+
+
+def rate(part, whole):
+    """
+    Share of a total, rounded to four decimals.
+    :param part: Count
+    :param whole: Total count
+    :return: Rate between 0 and 1, 0 for an empty total
+    """
+    return round(float(part) / whole, 4) if whole else 0.0
+
+
+def compute_stats(event_id):
+    """
+    Compute the attendance statistics of an event with a single grouped query over its
+    tickets joined to their guests.
+    :param event_id: Event Id
+    :return: Dict of statistics
+    """
+    totals = None
+    organizations = []
+    minutes = []
+    for row in db.session.execute(STATS_QUERY, {'event_id': event_id}):
+        if row.grouping_set == EVENT_TOTALS:
+            totals = row
+        elif row.grouping_set == BY_ORGANIZATION:
+            organizations.append({
+                'organization': row.organization,
+                'total': row.total,
+                'accepted': row.accepted,
+                'vvip': row.vvip,
+                'checked_in': row.checked_in
+            })
+        elif row.minute is not None:
+            minutes.append({'minute': row.minute.isoformat(), 'check_ins': row.checked_in})
+
+    total = totals.total if totals is not None else 0
+    accepted = totals.accepted if totals is not None else 0
+    vvip = totals.vvip if totals is not None else 0
+    checked_in = totals.checked_in if totals is not None else 0
+    vvip_checked_in = totals.vvip_checked_in if totals is not None else 0
+    organizations.sort(key=lambda organization: (-organization['total'], organization['organization'] or ''))
+    minutes.sort(key=lambda minute: minute['minute'])
+    return {
+        'event_id': event_id,
+        'tickets': total,
+        'accepted': accepted,
+        'acceptance_rate': rate(accepted, total),
+        'checked_in': checked_in,
+        'check_in_rate': rate(checked_in, total),
+        'vvip': {
+            'total': vvip,
+            'checked_in': vvip_checked_in,
+            'attendance_rate': rate(vvip_checked_in, vvip)
+        },
+        'organizations': organizations,
+        'check_ins_per_minute': minutes
+    }
+
+
+def get_stats(event):
+    """
+    Return the statistics of an event, from the cache while its tickets are unchanged.
+    :param event: Event
+    :return: Dict of statistics
+    """
+    key = (event.event_id, event.tickets_version, event.tickets_total, event.tickets_accepted,
+           event.tickets_vvip, event.tickets_checked_in)
+    stats = stats_cache.get(key)
+    if stats is None:
+        stats = compute_stats(event.event_id)
+        stats_cache.set(key, stats)
+    return stats
@@ -1,9 +1,19 @@
-from flask import Blueprint, request, abort
+from flask import Blueprint, request, abort, make_response
 from app.auth.helper import token_required
 from app.tickets.helper import event_required, guest_required, response, get_user_event, get_user_ticket, get_user_guest, response_with_event_ticket, \
-    response_with_pagination, get_paginated_tickets
+    response_with_pagination, get_paginated_tickets, response_with_check_in, validate_scans, response_with_scan_outcomes, \
+    parse_bool, select_invited_guests, response_with_issued_tickets, ticket_filter_args, include_guest_arg, \
+    response_with_stats, export_event_tickets, response_with_ticket_json
 from sqlalchemy import exc
+from sqlalchemy.orm import joinedload
 from app.models.tickets import Ticket
+from app.models.ticket_scans import TicketScan
+from app import app
+from app.pagination import InvalidCursor, per_page_arg, count_arg
+from app.export import InvalidExport, export_args, export_response
+from app.tickets.manifest import get_manifest, get_cached_manifest
+from app.tickets.stats import get_stats
+from app.cache import response_cache
 
 tickets = Blueprint('tickets', __name__)
 
@@ -28,15 +38,26 @@ def get_tickets(current_user, event_id):
     # Get tickets in the event
     page = request.args.get('page', 1, type=int)
     q = request.args.get('q', None, type=str)
-    tickets, nex, pagination, previous = get_paginated_tickets(event, event_id, page, q)
+    cursor = request.args.get('cursor', None, type=str)
+    per_page = per_page_arg(app.config['TICKETS_MAX_PER_PAGE'])
+    count = count_arg()
+    filters = ticket_filter_args()
+    include_guest = include_guest_arg()
+    try:
+        tickets, nex, total, previous = get_paginated_tickets(event, event_id, page, q, cursor, per_page, count,
+                                                              filters, include_guest)
+    except InvalidCursor:
+        return response('failed', 'Provide a valid cursor', 400)
+    except ValueError:
+        return response('failed', 'Provide valid vvip, accepted, scanned and created_since filters', 400)
 
     # Make a list of tickets
     if tickets:
         result = []
         for ticket in tickets:
-            result.append(ticket.json())
-        return response_with_pagination(result, previous, nex, pagination.total)
-    return response_with_pagination([], previous, nex, 0)
+            result.append(ticket.json(include_guest))
+        return response_with_pagination(result, previous, nex, total)
+    return response_with_pagination([], previous, nex, 0 if cursor is None and count else None)
 
 
 @tickets.route('/events/<event_id>/tickets/<ticket_id>', methods=['GET'])
@@ -45,7 +66,8 @@ def get_tickets(current_user, event_id):
 def get_ticket(current_user, event_id, ticket_id):
     """
     A ticket can be returned from the Event if the ticket and Event exist and below to the user.
-    The event and ticket Ids must be valid.
+    The event and ticket Ids must be valid. Tickets without their guest are served from the
+    response cache when they were read recently.
     :param current_user: User
     :param event_id: event Id
     :param ticket_id: ticket Id
@@ -57,16 +79,30 @@ def get_ticket(current_user, event_id, ticket_id):
     except ValueError:
         return response('failed', 'Provide a valid ticket Id', 202)
 
+    include_guest = include_guest_arg()
+    if not include_guest:
+        cached = response_cache.get('ticket', ticket_id, current_user.id)
+        if cached is not None and cached['event_id'] == int(event_id):
+            return response_with_ticket_json(cached)
+        generation = response_cache.generation('ticket', ticket_id)
+
     # Get the user event
     event = get_user_event(current_user, event_id)
     if event is None:
         return response('failed', 'User has no event with Id ' + event_id, 404)
 
-    # Get the ticket from the event
-    ticket = event.tickets.filter_by(ticket_id=ticket_id).first()
+    # Get the ticket from the event, along with its guest when asked for
+    query = event.tickets.filter_by(ticket_id=ticket_id)
+    if include_guest:
+        query = query.options(joinedload(Ticket.guest_tickets))
+    ticket = query.first()
     if not ticket:
         abort(404)
-    return response_with_event_ticket('success', ticket, 200)
+    if include_guest:
+        return response_with_event_ticket('success', ticket, 200, include_guest)
+    ticket_json = ticket.json()
+    response_cache.set('ticket', ticket.ticket_id, current_user.id, ticket_json, generation)
+    return response_with_ticket_json(ticket_json)
 
 @tickets.route('/events/<event_id>/tickets/<guest_id>', methods=['POST'])
 @token_required
@@ -92,26 +128,193 @@ def post(current_user, event_id, guest_id):
     if not(event_id and guest_id and ticket_qr_code and ticket_vvip and ticket_scanned and ticket_accepted):
         return response('failed', 'Missing some ticket attribute(s), nothing has changed.', 401)
 
+    try:
+        ticket = Ticket(int(event_id), int(guest_id), ticket_qr_code, parse_bool(ticket_vvip),
+                        parse_bool(ticket_accepted), int(ticket_scanned))
+    except ValueError:
+        return response('failed', 'Provide valid vvip, accepted and scanned values', 400)
+    ticket.comments = ticket_comments
+
+    # Save the event ticket into the Database, unless the event or guest is not the user's or the ticket exists
+    if ticket.save_for_user(current_user.id):
+        return response_with_event_ticket('success', ticket, 200)
+
+    # Find out why the ticket was not saved
+    if get_user_event(current_user, event_id) is None:
+        return response('failed', 'User has no event with Id ' + event_id, 202)
+    if get_user_guest(current_user, guest_id) is None:
+        return response('failed', 'User has no guest with Id ' + guest_id, 202)
+    if get_user_ticket(current_user, event_id, guest_id) is not None:
+        return response('failed', 'Ticket exists already for guest id ' + guest_id + ' participating at event id ' + event_id, 202)
+    return response('failed', 'QR code is already used by another ticket of event id ' + event_id, 202)
+
+
+@tickets.route('/events/<event_id>/tickets/export', methods=['GET'])
+@token_required
+@event_required
+def export_tickets(current_user, event_id):
+    """
+    Stream the tickets of an event with the names, organization and email of their guests
+    as CSV or newline delimited JSON, optionally gzipped and limited to the tickets created
+    in a time range.
+    :param current_user: User
+    :param event_id: Event Id
+    :return: Streamed Http response
+    """
+    try:
+        export_format, compress, since, until = export_args()
+    except InvalidExport:
+        return response('failed', 'Provide a valid format, csv or ndjson, and valid since and until times', 400)
+
+    event = get_user_event(current_user, event_id)
+    if event is None:
+        return response('failed', 'User has no event with Id ' + event_id, 404)
+    query, names = export_event_tickets(event, since, until)
+    return export_response(query, names, export_format, compress, 'event-' + str(event.event_id) + '-tickets')
+
+
+@tickets.route('/events/<event_id>/checkin', methods=['POST'])
+@token_required
+@event_required
+def check_in(current_user, event_id):
+    """
+    Record a scan of the ticket with the sent QR code. The event must belong to the user.
+    The guest name and VVIP flag are returned with the new scan count.
+    :param current_user: User
+    :param event_id: Event Id
+    :return: Http Response
+    """
+    if not request.content_type == 'application/json':
+        return response('failed', 'Content-type must be application/json', 401)
+
+    data = request.get_json()
+    qr_code = data.get('qr_code') if isinstance(data, dict) else None
+    if not qr_code or not isinstance(qr_code, str):
+        return response('failed', 'Provide a QR code', 400)
+
+    checked_in = Ticket.check_in(current_user.id, event_id, qr_code)
+    if checked_in is None:
+        return response('failed', 'No ticket with this QR code in event with Id ' + event_id, 404)
+    return response_with_check_in(checked_in)
+
+
+@tickets.route('/events/<event_id>/manifest', methods=['GET'])
+@token_required
+@event_required
+def manifest(current_user, event_id):
+    """
+    Binary manifest of the event's tickets for scanners to validate QR codes offline.
+    The ETag is the tickets version of the event. With the since parameter the changes from
+    that version are returned instead, when that version is still known to the server.
+    :param current_user: User
+    :param event_id: Event Id
+    :return: Manifest bytes
+    """
+    event = get_user_event(current_user, event_id)
+    if event is None:
+        return response('failed', 'User has no event with Id ' + event_id, 404)
+
+    etag = str(event.event_id) + '-' + str(event.tickets_version)
+    since = request.args.get('since', None, type=int)
+    if since is None and etag in request.if_none_match:
+        return make_response('', 304, {'ETag': '"' + etag + '"'})
+
+    current = get_manifest(event)
+    older = get_cached_manifest(event.event_id, since) if since is not None else None
+    if older is not None:
+        http_response = make_response(current.delta(older))
+        http_response.headers['X-Manifest-Delta-From'] = str(since)
+    else:
+        http_response = make_response(current.to_bytes())
+        http_response.set_etag(etag)
+    http_response.headers['Content-Type'] = 'application/octet-stream'
+    http_response.headers['X-Manifest-Version'] = str(current.version)
+    return http_response
+
+
+@tickets.route('/events/<event_id>/stats', methods=['GET'])
+@token_required
+@event_required
+def stats(current_user, event_id):
+    """
+    Attendance statistics of an event for the dashboard: acceptance and check in rates,
+    VVIP attendance, a breakdown by guest organization and the check ins of every minute.
+    :param current_user: User
+    :param event_id: Event Id
+    :return: Http Json response
+    """
+    event = get_user_event(current_user, event_id)
+    if event is None:
+        return response('failed', 'User has no event with Id ' + event_id, 404)
+    return response_with_stats(get_stats(event))
+
+
+@tickets.route('/events/<event_id>/scans', methods=['POST'])
+@token_required
+@event_required
+def upload_scans(current_user, event_id):
+    """
+    Record a batch of scans queued by a scanner while it was offline. Every scan carries a
+    scan Id generated by the scanner, so a batch can be uploaded again after a failure
+    without counting its scans twice.
+    :param current_user: User
+    :param event_id: Event Id
+    :return: Outcome of every scan
+    """
+    if not request.content_type == 'application/json':
+        return response('failed', 'Content-type must be application/json', 401)
+
+    records = request.get_json().get('scans')
+    if not isinstance(records, list) or not records:
+        return response('failed', 'Provide a list of scans', 400)
+    if len(records) > app.config['SCANS_MAX_BATCH_SIZE']:
+        return response('failed', 'Send at most ' + str(app.config['SCANS_MAX_BATCH_SIZE']) + ' scans at a time', 400)
+
     # Get the user event
     event = get_user_event(current_user, event_id)
     if event is None:
-        return response('failed', 'User has no event with Id ' + event_id, 202)
+        return response('failed', 'User has no event with Id ' + event_id, 404)
 
-    # Get the user guest
-    guest = get_user_guest(current_user, guest_id)
-    if guest is None:
-        return response('failed', 'User has no guest with Id ' + guest_id, 202)
+    scans, rejected = validate_scans(records)
+    outcomes = TicketScan.apply(event.event_id, scans) if scans else {}
+    return response_with_scan_outcomes(records, outcomes, rejected)
 
-    # Check if ticket exists already
-    ticket = get_user_ticket(current_user, event_id, guest_id)
-    if ticket is not None:
-        return response('failed', 'Ticket exists already for guest id ' + guest_id + ' participating at event id ' + event_id, 202)
 
-    # Save the event ticket into the Database
-    ticket = Ticket(event_id, guest_id, ticket_qr_code, ticket_vvip, ticket_accepted, ticket_scanned)
-    ticket.comments = ticket_comments
-    ticket.save()
-    return response_with_event_ticket('success', ticket, 200)
+@tickets.route('/events/<event_id>/tickets/bulk', methods=['POST'])
+@token_required
+@event_required
+def issue_tickets(current_user, event_id):
+    """
+    Issue tickets of an event to many of the user's guests at once, chosen by a list of
+    guest Ids, a last name search or all of them. The QR codes are generated by the server
+    and guests who already have a ticket for the event are skipped.
+    :param current_user: User
+    :param event_id: Event Id
+    :return: Number of tickets created and skipped
+    """
+    if not request.content_type == 'application/json':
+        return response('failed', 'Content-type must be application/json', 401)
+
+    data = request.get_json().get('tickets')
+    if not isinstance(data, dict):
+        return response('failed', 'Missing some ticket attribute(s), nothing has changed.', 401)
+    try:
+        guest_ids = select_invited_guests(current_user, data)
+        vvip = parse_bool(data.get('vvip'))
+        accepted = parse_bool(data.get('accepted'))
+    except ValueError:
+        return response('failed', 'Provide valid guest_ids, vvip and accepted values', 400)
+    if guest_ids is None:
+        return response('failed', 'Provide guest_ids, q or all', 400)
+
+    # Get the user event
+    event = get_user_event(current_user, event_id)
+    if event is None:
+        return response('failed', 'User has no event with Id ' + event_id, 404)
+
+    invited, created = Ticket.issue(event.event_id, guest_ids, vvip, accepted)
+    requested = len(set(data['guest_ids'])) if data.get('guest_ids') is not None else invited
+    return response_with_issued_tickets(created, requested - created)
 
 
 @tickets.route('/events/<event_id>/tickets/<ticket_id>', methods=['PUT'])
@@ -140,8 +343,8 @@ def edit_ticket(current_user, event_id, ticket_id):
     if event is None:
         return response('failed', 'User has no event with Id ' + event_id, 202)
 
-    # Get the ticket
-    ticket = event.tickets.filter_by(ticket_id=ticket_id).first()
+    # Get the ticket, locked so that concurrent edits count its old flags once in the event counters
+    ticket = event.tickets.filter_by(ticket_id=ticket_id).with_for_update().populate_existing().first()
     if not ticket:
         abort(404)
 
@@ -155,6 +358,11 @@ def edit_ticket(current_user, event_id, ticket_id):
     if not(scanned and accepted and vvip):
         return response('failed', 'Missing some ticket attribute(s), nothing has changed.', 401)
 
+    try:
+        scanned, accepted, vvip = int(scanned), parse_bool(accepted), parse_bool(vvip)
+    except ValueError:
+        return response('failed', 'Provide valid vvip, accepted and scanned values', 400)
+
     # Update the ticket record
     ticket.update(scanned, accepted, vvip, comments)
     return response_with_event_ticket('success', ticket, 200)
@@ -182,8 +390,8 @@ def delete(current_user, event_id, ticket_id):
     if event is None:
         return response('failed', 'User has no event with Id ' + event_id, 202)
 
-    # Delete the ticket from the event
-    ticket = event.tickets.filter_by(ticket_id=ticket_id).first()
+    # Delete the ticket from the event, locked so that a concurrent delete finds it gone
+    ticket = event.tickets.filter_by(ticket_id=ticket_id).with_for_update().populate_existing().first()
     if not ticket:
         abort(404)
     ticket.delete()
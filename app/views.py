@@ -1,5 +1,8 @@
 from app import app
-from app.auth.helper import response
+from flask import jsonify, make_response
+from app.auth.helper import response, token_required
+from app.auth.hashing import HashingBusy, hasher
+from app.cache import response_cache
 
 
 @app.errorhandler(404)
@@ -30,3 +33,33 @@ def internal_server_error(e):
     :return:
     """
     return response('failed', 'Internal server error', 500)
+
+
+@app.errorhandler(HashingBusy)
+def password_hashing_busy(e):
+    """
+    Return a fast 503 response telling the client when to retry while the password
+    hashing pool is saturated.
+    :param e: Exception
+    :return:
+    """
+    busy_response, status_code = response('failed', 'Server is busy, please retry later', 503)
+    busy_response.headers['Retry-After'] = str(app.config['PASSWORD_HASH_RETRY_AFTER_SECONDS'])
+    return busy_response, status_code
+
+
+@app.route('/v1/metrics', methods=['GET'])
+@token_required
+def metrics(current_user):
+    """
+    Return the runtime metrics of this worker.
+    :param current_user: User
+    :return:
+    """
+    return make_response(jsonify({
+        'status': 'success',
+        'metrics': {
+            'password_hashing': hasher.stats(),
+            'response_cache': response_cache.stats()
+        }
+    })), 200
@@ -5,7 +5,10 @@ from app.models.users import User
 from app.models.events import Event
 from app.models.guests import Guest
 from app.models.tickets import Ticket
+from app.models.blacklist_token import BlackListToken
+from app.search import create_trigram_indexes as create_indexes
 import unittest
+import time
 import coverage
 import os
 import forgery_py as faker
@@ -44,6 +47,48 @@ def test():
     return 1
 
 
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=1000,
+                help='Number of rows deleted per transaction')
+@manager.option('-i', '--interval', dest='interval', type=int, default=0,
+                help='Keep sweeping every given number of seconds instead of running once')
+def prune_blacklist(batch_size, interval):
+    """
+    Delete the blacklisted tokens that have already expired.
+    :return:
+    """
+    while True:
+        deleted = BlackListToken.prune_expired(batch_size)
+        print('Pruned {} expired blacklisted token(s)'.format(deleted))
+        if not interval:
+            return
+        time.sleep(interval)
+
+
+@manager.command
+def repair_ticket_counters():
+    """
+    Recompute the ticket counters of the events from the tickets table.
+    :return:
+    """
+    repaired = Event.recount_tickets()
+    print('Repaired the ticket counters of {} event(s)'.format(repaired))
+
+
+@manager.command
+def create_trigram_indexes():
+    """
+    Install pg_trgm and create the trigram search indexes, for databases migrated before the
+    extension was available. Restart the workers afterwards so they use the fuzzy guest search.
+    :return:
+    """
+    with db.engine.begin() as connection:
+        created = create_indexes(connection)
+    if not created:
+        print('pg_trgm is not available on the database, no index was created')
+        return 1
+    print('Created the trigram search indexes')
+
+
 @manager.command
 def dummy():
     # Create a user if they do not exist.
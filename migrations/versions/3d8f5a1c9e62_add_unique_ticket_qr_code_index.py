@@ -0,0 +1,30 @@
+"""add unique ticket qr code index
+
+Revision ID: 3d8f5a1c9e62
+Revises: 9b6e2f0a4c17
+Create Date: 2026-10-18 19:12:36.085214
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3d8f5a1c9e62'
+down_revision = '9b6e2f0a4c17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    duplicates = op.get_bind().execute(sa.text(
+        'SELECT count(*) FROM (SELECT 1 FROM tickets WHERE event_id IS NOT NULL '
+        'GROUP BY event_id, qr_code_text HAVING count(*) > 1) AS d')).scalar()
+    if duplicates:
+        raise RuntimeError(str(duplicates) + ' QR codes are used by more than one ticket of an event, '
+                           'change the QR codes of the extra tickets before upgrading')
+    op.create_index('ix_tickets_event_id_qr_code_text', 'tickets', ['event_id', 'qr_code_text'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_tickets_event_id_qr_code_text', table_name='tickets')
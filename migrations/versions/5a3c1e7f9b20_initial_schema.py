@@ -0,0 +1,82 @@
+"""initial schema
+
+Revision ID: 5a3c1e7f9b20
+Revises: 
+Create Date: 2026-10-18 15:40:12.417359
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a3c1e7f9b20'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('blacklist_token',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('token', sa.String(length=255), nullable=False),
+    sa.Column('blacklisted_on', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('token')
+    )
+    op.create_table('users',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('email', sa.String(length=255), nullable=False),
+    sa.Column('password', sa.String(length=255), nullable=False),
+    sa.Column('registered_on', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('email')
+    )
+    op.create_table('events',
+    sa.Column('event_id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('event_name', sa.Text(), nullable=False),
+    sa.Column('event_location', sa.Text(), nullable=False),
+    sa.Column('event_eval_link', sa.Text(), nullable=True),
+    sa.Column('event_time', sa.DateTime(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('event_created_on', sa.DateTime(), nullable=False),
+    sa.Column('event_updated_on', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('event_id')
+    )
+    op.create_table('guests',
+    sa.Column('guest_id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('first_name', sa.Text(), nullable=False),
+    sa.Column('last_name', sa.Text(), nullable=False),
+    sa.Column('organization', sa.Text(), nullable=False),
+    sa.Column('email', sa.String(length=255), nullable=False),
+    sa.Column('guest_created_on', sa.DateTime(), nullable=False),
+    sa.Column('guest_updated_on', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('guest_id'),
+    sa.UniqueConstraint('email')
+    )
+    op.create_table('tickets',
+    sa.Column('ticket_id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('event_id', sa.Integer(), nullable=True),
+    sa.Column('guest_id', sa.Integer(), nullable=True),
+    sa.Column('qr_code_text', sa.Text(), nullable=False),
+    sa.Column('vvip', sa.Boolean(), nullable=False),
+    sa.Column('accepted', sa.Boolean(), nullable=False),
+    sa.Column('scanned', sa.Integer(), nullable=False),
+    sa.Column('comments', sa.Text(), nullable=True),
+    sa.Column('ticket_created_on', sa.DateTime(), nullable=False),
+    sa.Column('ticket_updated_on', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['event_id'], ['events.event_id'], ),
+    sa.ForeignKeyConstraint(['guest_id'], ['guests.guest_id'], ),
+    sa.PrimaryKeyConstraint('ticket_id')
+    )
+
+
+def downgrade():
+    op.drop_table('tickets')
+    op.drop_table('guests')
+    op.drop_table('events')
+    op.drop_table('users')
+    op.drop_table('blacklist_token')
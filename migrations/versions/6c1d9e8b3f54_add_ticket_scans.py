@@ -0,0 +1,38 @@
+"""add ticket scans
+
+Revision ID: 6c1d9e8b3f54
+Revises: 3d8f5a1c9e62
+Create Date: 2026-10-18 19:48:52.730461
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6c1d9e8b3f54'
+down_revision = '3d8f5a1c9e62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ticket_scans',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('scan_id', sa.String(length=64), nullable=False),
+    sa.Column('event_id', sa.Integer(), nullable=False),
+    sa.Column('ticket_id', sa.Integer(), nullable=False),
+    sa.Column('device_id', sa.String(length=64), nullable=True),
+    sa.Column('scanned_at', sa.DateTime(), nullable=False),
+    sa.Column('received_on', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['event_id'], ['events.event_id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['ticket_id'], ['tickets.ticket_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('event_id', 'scan_id', name='uq_ticket_scans_event_id_scan_id')
+    )
+    op.create_index(op.f('ix_ticket_scans_ticket_id'), 'ticket_scans', ['ticket_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_ticket_scans_ticket_id'), table_name='ticket_scans')
+    op.drop_table('ticket_scans')
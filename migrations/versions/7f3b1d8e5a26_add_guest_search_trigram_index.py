@@ -0,0 +1,36 @@
+"""add guest search trigram index
+
+Revision ID: 7f3b1d8e5a26
+Revises: d6e2a9c4f783
+Create Date: 2026-10-19 00:04:18.661209
+
+"""
+from alembic import op
+import logging
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7f3b1d8e5a26'
+down_revision = 'd6e2a9c4f783'
+branch_labels = None
+depends_on = None
+
+log = logging.getLogger('alembic.runtime.migration')
+
+
+def upgrade():
+    # Without pg_trgm the guest search still works, through the guests of the user
+    available = op.get_bind().execute(
+        sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")).first()
+    if available is None:
+        log.warning('pg_trgm is not available, the guest search trigram index was not created and guest searches '
+                    'scan the guests of the user. Install the extension, then run python manage.py create_trigram_indexes')
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute("CREATE INDEX IF NOT EXISTS ix_guests_search_trgm ON guests "
+               "USING gin ((first_name || ' ' || last_name || ' ' || organization || ' ' || email) gin_trgm_ops)")
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS ix_guests_search_trgm')
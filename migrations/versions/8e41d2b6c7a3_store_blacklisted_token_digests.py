@@ -0,0 +1,63 @@
+"""store blacklisted token digests and expiry
+
+Revision ID: 8e41d2b6c7a3
+Revises: 5a3c1e7f9b20
+Create Date: 2026-10-18 15:52:40.108244
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import datetime
+import hashlib
+import jwt
+
+
+# revision identifiers, used by Alembic.
+revision = '8e41d2b6c7a3'
+down_revision = '5a3c1e7f9b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('blacklist_token', sa.Column('token_digest', sa.String(length=64), nullable=True))
+    op.add_column('blacklist_token', sa.Column('expires_on', sa.DateTime(), nullable=True))
+
+    # Tokens that have already expired are dropped, the others are converted to a digest
+    connection = op.get_bind()
+    blacklist_token = sa.table('blacklist_token',
+                               sa.column('id', sa.Integer),
+                               sa.column('token', sa.String),
+                               sa.column('token_digest', sa.String),
+                               sa.column('expires_on', sa.DateTime))
+    now = datetime.datetime.utcnow()
+    for row in connection.execute(sa.select([blacklist_token.c.id, blacklist_token.c.token])).fetchall():
+        try:
+            payload = jwt.decode(row.token, verify=False)
+            expires_on = datetime.datetime.utcfromtimestamp(payload['exp'])
+        except (jwt.InvalidTokenError, KeyError):
+            expires_on = now
+        if expires_on <= now:
+            connection.execute(blacklist_token.delete().where(blacklist_token.c.id == row.id))
+            continue
+        connection.execute(blacklist_token.update().where(blacklist_token.c.id == row.id).values(
+            token_digest=hashlib.sha256(row.token.encode('utf-8')).hexdigest(),
+            expires_on=expires_on))
+
+    op.alter_column('blacklist_token', 'token_digest', nullable=False)
+    op.alter_column('blacklist_token', 'expires_on', nullable=False)
+    op.drop_constraint('blacklist_token_token_key', 'blacklist_token', type_='unique')
+    op.drop_column('blacklist_token', 'token')
+    op.create_unique_constraint(None, 'blacklist_token', ['token_digest'])
+    op.create_index(op.f('ix_blacklist_token_expires_on'), 'blacklist_token', ['expires_on'], unique=False)
+
+
+def downgrade():
+    # Digests cannot be turned back into tokens, the blacklist starts empty again
+    op.execute('DELETE FROM blacklist_token')
+    op.drop_index(op.f('ix_blacklist_token_expires_on'), table_name='blacklist_token')
+    op.drop_constraint('blacklist_token_token_digest_key', 'blacklist_token', type_='unique')
+    op.drop_column('blacklist_token', 'expires_on')
+    op.drop_column('blacklist_token', 'token_digest')
+    op.add_column('blacklist_token', sa.Column('token', sa.String(length=255), nullable=False))
+    op.create_unique_constraint(None, 'blacklist_token', ['token'])
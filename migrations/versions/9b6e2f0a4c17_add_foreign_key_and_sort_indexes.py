@@ -0,0 +1,31 @@
+"""add foreign key and sort indexes
+
+Revision ID: 9b6e2f0a4c17
+Revises: f4a9c3d7e215
+Create Date: 2026-10-18 18:41:09.663120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b6e2f0a4c17'
+down_revision = 'f4a9c3d7e215'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_events_user_id_created_on', 'events', ['user_id', 'event_created_on', 'event_id'], unique=False)
+    op.create_index('ix_guests_user_id_created_on', 'guests', ['user_id', 'guest_created_on', 'guest_id'], unique=False)
+    op.create_index('ix_tickets_event_id_created_on', 'tickets', ['event_id', 'ticket_created_on', 'ticket_id'],
+                    unique=False)
+    op.create_index('ix_tickets_guest_id_event_id', 'tickets', ['guest_id', 'event_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_tickets_guest_id_event_id', table_name='tickets')
+    op.drop_index('ix_tickets_event_id_created_on', table_name='tickets')
+    op.drop_index('ix_guests_user_id_created_on', table_name='guests')
+    op.drop_index('ix_events_user_id_created_on', table_name='events')
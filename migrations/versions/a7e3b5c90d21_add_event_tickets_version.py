@@ -0,0 +1,24 @@
+"""add event tickets version
+
+Revision ID: a7e3b5c90d21
+Revises: 6c1d9e8b3f54
+Create Date: 2026-10-18 20:27:14.559802
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7e3b5c90d21'
+down_revision = '6c1d9e8b3f54'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('events', sa.Column('tickets_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    op.drop_column('events', 'tickets_version')
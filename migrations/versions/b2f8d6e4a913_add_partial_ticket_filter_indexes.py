@@ -0,0 +1,29 @@
+"""add partial ticket filter indexes
+
+Revision ID: b2f8d6e4a913
+Revises: e5b0c4f71a38
+Create Date: 2026-10-18 21:38:20.917533
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2f8d6e4a913'
+down_revision = 'e5b0c4f71a38'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_tickets_event_id_created_on_vvip', 'tickets', ['event_id', 'ticket_created_on', 'ticket_id'],
+                    unique=False, postgresql_where=sa.text('vvip'))
+    op.create_index('ix_tickets_event_id_created_on_unscanned', 'tickets',
+                    ['event_id', 'ticket_created_on', 'ticket_id'], unique=False,
+                    postgresql_where=sa.text('scanned = 0'))
+
+
+def downgrade():
+    op.drop_index('ix_tickets_event_id_created_on_unscanned', table_name='tickets')
+    op.drop_index('ix_tickets_event_id_created_on_vvip', table_name='tickets')
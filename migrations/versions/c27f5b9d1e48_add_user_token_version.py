@@ -0,0 +1,24 @@
+"""add user token version
+
+Revision ID: c27f5b9d1e48
+Revises: 8e41d2b6c7a3
+Create Date: 2026-10-18 16:21:07.553912
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c27f5b9d1e48'
+down_revision = '8e41d2b6c7a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('token_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    op.drop_column('users', 'token_version')
@@ -0,0 +1,40 @@
+"""add event ticket counters
+
+Revision ID: c9a4e7f2b650
+Revises: b2f8d6e4a913
+Create Date: 2026-10-18 22:24:03.184657
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9a4e7f2b650'
+down_revision = 'b2f8d6e4a913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('events', sa.Column('tickets_total', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('events', sa.Column('tickets_accepted', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('events', sa.Column('tickets_vvip', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('events', sa.Column('tickets_checked_in', sa.Integer(), server_default='0', nullable=False))
+    op.execute("""
+        UPDATE events SET tickets_total = counts.total, tickets_accepted = counts.accepted,
+            tickets_vvip = counts.vvip, tickets_checked_in = counts.checked_in
+        FROM (
+            SELECT event_id, count(*) AS total, count(*) FILTER (WHERE accepted) AS accepted,
+                count(*) FILTER (WHERE vvip) AS vvip, count(*) FILTER (WHERE scanned > 0) AS checked_in
+            FROM tickets GROUP BY event_id
+        ) AS counts
+        WHERE events.event_id = counts.event_id
+    """)
+
+
+def downgrade():
+    op.drop_column('events', 'tickets_checked_in')
+    op.drop_column('events', 'tickets_vvip')
+    op.drop_column('events', 'tickets_accepted')
+    op.drop_column('events', 'tickets_total')
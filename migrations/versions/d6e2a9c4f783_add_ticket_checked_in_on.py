@@ -0,0 +1,32 @@
+"""add ticket checked in on
+
+Revision ID: d6e2a9c4f783
+Revises: c9a4e7f2b650
+Create Date: 2026-10-18 23:10:37.512804
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd6e2a9c4f783'
+down_revision = 'c9a4e7f2b650'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('tickets', sa.Column('checked_in_on', sa.DateTime(), nullable=True))
+    # Tickets scanned before the column existed are checked in at their first recorded scan,
+    # or at their last update when the scans were made through check in
+    op.execute("""
+        UPDATE tickets SET checked_in_on = coalesce(
+            (SELECT min(scanned_at) FROM ticket_scans WHERE ticket_scans.ticket_id = tickets.ticket_id),
+            ticket_updated_on)
+        WHERE scanned > 0
+    """)
+
+
+def downgrade():
+    op.drop_column('tickets', 'checked_in_on')
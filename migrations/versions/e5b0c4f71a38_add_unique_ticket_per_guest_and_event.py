@@ -0,0 +1,32 @@
+"""add unique ticket per guest and event
+
+Revision ID: e5b0c4f71a38
+Revises: a7e3b5c90d21
+Create Date: 2026-10-18 21:05:47.341902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b0c4f71a38'
+down_revision = 'a7e3b5c90d21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    duplicates = op.get_bind().execute(sa.text(
+        'SELECT count(*) FROM (SELECT 1 FROM tickets WHERE guest_id IS NOT NULL AND event_id IS NOT NULL '
+        'GROUP BY guest_id, event_id HAVING count(*) > 1) AS d')).scalar()
+    if duplicates:
+        raise RuntimeError(str(duplicates) + ' guests have more than one ticket for an event, '
+                           'remove the extra tickets before upgrading')
+    op.drop_index('ix_tickets_guest_id_event_id', table_name='tickets')
+    op.create_unique_constraint('uq_tickets_guest_id_event_id', 'tickets', ['guest_id', 'event_id'])
+
+
+def downgrade():
+    op.drop_constraint('uq_tickets_guest_id_event_id', 'tickets', type_='unique')
+    op.create_index('ix_tickets_guest_id_event_id', 'tickets', ['guest_id', 'event_id'], unique=False)
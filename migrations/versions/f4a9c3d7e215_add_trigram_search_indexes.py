@@ -0,0 +1,43 @@
+"""add trigram search indexes
+
+Revision ID: f4a9c3d7e215
+Revises: c27f5b9d1e48
+Create Date: 2026-10-18 18:02:41.218350
+
+"""
+from alembic import op
+import logging
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4a9c3d7e215'
+down_revision = 'c27f5b9d1e48'
+branch_labels = None
+depends_on = None
+
+log = logging.getLogger('alembic.runtime.migration')
+
+indexes = (
+    ('ix_events_event_name_trgm', 'events', 'event_name'),
+    ('ix_guests_last_name_trgm', 'guests', 'last_name'),
+    ('ix_tickets_qr_code_text_trgm', 'tickets', 'qr_code_text'),
+)
+
+
+def upgrade():
+    # Without pg_trgm the searches still work, through a sequential scan
+    available = op.get_bind().execute(
+        sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")).first()
+    if available is None:
+        log.warning('pg_trgm is not available, the trigram search indexes were not created and searches '
+                    'scan the tables. Install the extension, then run python manage.py create_trigram_indexes')
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table, column in indexes:
+        op.execute('CREATE INDEX IF NOT EXISTS ' + name + ' ON ' + table + ' USING gin (' + column + ' gin_trgm_ops)')
+
+
+def downgrade():
+    for name, table, column in indexes:
+        op.execute('DROP INDEX IF EXISTS ' + name)
@@ -1,5 +1,13 @@
 from app import app, db
+from app.auth.helper import token_cache
+from app.auth.revocation import revocations
+from app.tickets.manifest import manifest_cache
+from app.tickets.stats import stats_cache
+from app.autocomplete import guest_organizations, event_locations
+from app.cache import response_cache
 from flask_testing import TestCase
+from contextlib import contextmanager
+from sqlalchemy import event as sa_event
 import json
 
 
@@ -19,6 +27,13 @@ class BaseTestCase(TestCase):
         """
         db.create_all()
         db.session.commit()
+        token_cache.clear()
+        revocations.reset()
+        manifest_cache.clear()
+        stats_cache.clear()
+        guest_organizations.indexes.clear()
+        event_locations.indexes.clear()
+        response_cache.clear()
 
     def tearDown(self):
         """
@@ -28,6 +43,23 @@ class BaseTestCase(TestCase):
         db.session.remove()
         db.drop_all()
 
+    @contextmanager
+    def count_queries(self):
+        """
+        Count the SQL statements sent to the database inside the with block
+        :return: List the executed statements are appended to
+        """
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        sa_event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            sa_event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
     def register_user(self, email, password):
         """
         Helper method for registering a user with dummy data
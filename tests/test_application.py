@@ -30,6 +30,21 @@ class TestMainAppCase(BaseTestCase):
             self.assertTrue(data['status'] == 'failed')
             self.assertTrue(data['message'] == 'The method is not allowed for the requested URL')
 
+    def test_metrics_are_returned(self):
+        """
+        Test that the worker metrics include the password hashing pool
+        :return:
+        """
+        with self.client:
+            response = self.client.get(
+                'v1/metrics',
+                headers=dict(Authorization='Bearer ' + self.get_user_token()))
+            data = json.loads(response.data.decode())
+            self.assert200(response)
+            self.assertTrue(data['status'] == 'success')
+            self.assertIn('queued', data['metrics']['password_hashing'])
+            self.assertTrue(data['metrics']['password_hashing']['completed'] >= 1)
+
     def test_docs_page(self):
         """
         Test that the homepage returns a 200 response status code
@@ -1,9 +1,18 @@
 from tests.base import BaseTestCase
 from app.models.users import User
+from app.auth.helper import token_cache
+from app.auth.revocation import revocations
+from app.models.blacklist_token import BlackListToken
+from app.auth.hashing import hasher, HashingBusy, PasswordHasher
 from app import db
+from contextlib import contextmanager
+import subprocess
+import sys
+import tempfile
 import unittest
 import json
 import time
+import datetime
 
 
 class TestAuthBluePrint(BaseTestCase):
@@ -288,6 +297,195 @@ class TestAuthBluePrint(BaseTestCase):
             self.assertTrue(data['status'] == 'failed')
             self.assertTrue(data['message'] == 'Signature expired, Please sign in again')
 
+    def test_token_required_caches_the_token_user(self):
+        """
+        Test that a verified token is cached and evicted again when the user logs out
+        :return:
+        """
+        with self.client:
+            token = self.register_and_login_in_user()['auth_token']
+            response = self.client.get(
+                'v1/events',
+                headers=dict(Authorization='Bearer ' + token)
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(token_cache.get(token)['sub'], 1)
+            self.logout_user(token)
+            self.assertIsNone(token_cache.get(token))
+
+    def test_cached_token_blacklisted_by_another_worker_is_refused(self):
+        """
+        Test that a cached token is refused once another worker's blacklisting reaches the revocation set
+        :return:
+        """
+        with self.client:
+            token = self.register_and_login_in_user()['auth_token']
+            headers = dict(Authorization='Bearer ' + token)
+            self.assertEqual(self.client.get('v1/events', headers=headers).status_code, 200)
+            self.assertIsNotNone(token_cache.get(token))
+            BlackListToken(token).blacklist()
+            revocations.refresh(force=True)
+            response = self.client.get('v1/events', headers=headers)
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 401)
+            self.assertEqual(data['message'], 'Token was Blacklisted, Please login In')
+            self.assertIsNone(token_cache.get(token))
+
+    def test_tokens_blacklisted_by_another_worker_are_loaded_on_refresh(self):
+        """
+        Test that the revocation set picks up tokens blacklisted directly in the database
+        :return:
+        """
+        with self.client:
+            token = self.register_and_login_in_user()['auth_token']
+            self.assertFalse(revocations.is_revoked(token))
+            BlackListToken(token).blacklist()
+            revocations.refresh(force=True)
+            self.assertTrue(revocations.is_revoked(token))
+
+    def test_tokens_committed_out_of_order_are_loaded_on_refresh(self):
+        """
+        Test that a token stamped before the latest loaded one but committed after it is still loaded
+        :return:
+        """
+        with self.client:
+            stamped_first = BlackListToken('token-stamped-first')
+            stamped_first.blacklisted_on -= datetime.timedelta(seconds=2)
+            BlackListToken('token-stamped-second').blacklist()
+            revocations.refresh(force=True)
+            self.assertTrue(revocations.is_revoked('token-stamped-second'))
+            stamped_first.blacklist()
+            revocations.refresh(force=True)
+            self.assertTrue(revocations.is_revoked('token-stamped-first'))
+
+    def test_expired_blacklisted_tokens_are_pruned(self):
+        """
+        Test that only the expired tokens are removed from the blacklist
+        :return:
+        """
+        with self.client:
+            token = self.register_and_login_in_user()['auth_token']
+            self.logout_user(token)
+            expired = BlackListToken('expired.token')
+            expired.expires_on = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+            expired.blacklist()
+            self.assertEqual(BlackListToken.prune_expired(batch_size=1), 1)
+            self.assertEqual(BlackListToken.query.count(), 1)
+            self.assertTrue(BlackListToken.check_blacklist(token))
+
+    def test_login_is_rejected_when_password_hashing_is_saturated(self):
+        """
+        Test that a 503 response with a Retry-After header is returned when no hashing slot is free
+        :return:
+        """
+        with self.client:
+            self.register_user('john@gmail.com', '123456')
+            slots = hasher.workers + hasher.queue_depth
+            for _ in range(slots):
+                hasher._slots.acquire()
+            try:
+                response = self.login_user('john@gmail.com', '123456')
+            finally:
+                for _ in range(slots):
+                    hasher._slots.release()
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 503)
+            self.assertTrue(data['status'] == 'failed')
+            self.assertEqual(response.headers['Retry-After'], '1')
+            self.assertEqual(self.login_user('john@gmail.com', '123456').status_code, 200)
+            self.assertTrue(hasher.stats()['rejected'] >= 1)
+
+    @contextmanager
+    def slots_taken_by_another_process(self, directory, count):
+        """
+        Hold the host hashing slots from a separate process, like sync workers busy hashing
+        """
+        holder = subprocess.Popen([sys.executable, '-c', (
+            'import fcntl, os, sys\n'
+            'fds = [os.open(os.path.join(sys.argv[1], "slot-" + str(n)), os.O_RDWR | os.O_CREAT) for n in range(int(sys.argv[2]))]\n'
+            'for fd in fds: fcntl.flock(fd, fcntl.LOCK_EX)\n'
+            'print("ready", flush=True)\n'
+            'sys.stdin.read()\n'
+        ), directory, str(count)], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        try:
+            self.assertEqual(holder.stdout.readline().strip(), b'ready')
+            yield
+        finally:
+            holder.stdin.close()
+            holder.wait()
+
+    def test_hashing_slots_are_shared_by_sync_workers(self):
+        """
+        Test that a sync worker, which serves one request at a time and so never fills its own
+        slots, is rejected while the other workers of the machine hold every hashing slot
+        :return:
+        """
+        directory = tempfile.mkdtemp()
+        sync_worker = PasswordHasher(1, 0, 2, directory)
+        pw_hash = sync_worker.generate_password_hash('123456')
+        with self.slots_taken_by_another_process(directory, 2):
+            with self.assertRaises(HashingBusy):
+                sync_worker.check_password_hash(pw_hash, '123456')
+        self.assertTrue(sync_worker.check_password_hash(pw_hash, '123456'))
+        self.assertEqual(sync_worker.stats()['rejected'], 1)
+
+    def test_login_is_rejected_when_other_workers_hold_the_hashing_slots(self):
+        """
+        Test that login returns a 503 response while other worker processes hold the host hashing slots
+        :return:
+        """
+        with self.client:
+            self.register_user('john@gmail.com', '123456')
+            with self.slots_taken_by_another_process(self.app.config['PASSWORD_HASH_SLOTS_DIR'],
+                                                     self.app.config['PASSWORD_HASH_HOST_SLOTS']):
+                response = self.login_user('john@gmail.com', '123456')
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers['Retry-After'], '1')
+            self.assertEqual(self.login_user('john@gmail.com', '123456').status_code, 200)
+
+    def test_password_is_rehashed_on_login_when_cost_changes(self):
+        """
+        Test that logging in upgrades a password hash made with an outdated bcrypt cost
+        :return:
+        """
+        with self.client:
+            self.register_user('john@gmail.com', '123456')
+            self.assertTrue(User.get_by_email('john@gmail.com').password.startswith('$2b$04$'))
+            self.app.config['BCRYPT_LOG_ROUNDS'] = 5
+            try:
+                response = self.login_user('john@gmail.com', '123456')
+            finally:
+                self.app.config['BCRYPT_LOG_ROUNDS'] = 4
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(User.get_by_email('john@gmail.com').password.startswith('$2b$05$'))
+            self.assertEqual(self.login_user('john@gmail.com', '123456').status_code, 200)
+
+    def test_calibrated_rounds_only_upgrade_hashes(self):
+        """
+        Test that with a target hash time a hash is only made again when its cost is below the measured rounds,
+        so workers that measured different rounds do not rehash a password back and forth
+        :return:
+        """
+        self.app.config['BCRYPT_TARGET_HASH_MS'] = 1
+        hasher._calibrated[1] = 12
+        try:
+            self.assertTrue(hasher.needs_rehash('$2b$11$' + 'a' * 53))
+            self.assertFalse(hasher.needs_rehash('$2b$12$' + 'a' * 53))
+            self.assertFalse(hasher.needs_rehash('$2b$13$' + 'a' * 53))
+        finally:
+            self.app.config['BCRYPT_TARGET_HASH_MS'] = None
+            del hasher._calibrated[1]
+        self.assertTrue(hasher.needs_rehash('$2b$13$' + 'a' * 53))
+
+    def test_bcrypt_rounds_are_calibrated_to_a_target_time(self):
+        """
+        Test that a higher target hash time never yields fewer bcrypt rounds
+        :return:
+        """
+        self.assertEqual(hasher.calibrate(0.0001), 4)
+        self.assertTrue(hasher.calibrate(10000) >= hasher.calibrate(1))
+        self.assertTrue(hasher.calibrate(10 ** 12) <= 31)
+
     def register_and_login_in_user(self):
         """
         Helper method to sign up and login a user
@@ -369,6 +567,44 @@ class TestAuthBluePrint(BaseTestCase):
             self.assertTrue(res['status'] == 'success')
             self.assertTrue(res['message'] == 'Password reset successfully')
 
+    def test_password_reset_revokes_previous_tokens(self):
+        """
+        Test that a password reset invalidates the tokens issued before it and returns a new one
+        :return:
+        """
+        with self.client:
+            token = self.register_and_login_in_user()['auth_token']
+            response = self.client.post(
+                'v1/auth/reset/password',
+                headers=dict(Authorization='Bearer ' + token),
+                content_type='application/json',
+                data=json.dumps(dict(oldPassword='123456', newPassword='098765',
+                                     passwordConfirmation='098765')))
+            new_token = json.loads(response.data.decode())['auth_token']
+            response = self.client.get('v1/events', headers=dict(Authorization='Bearer ' + token))
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 401)
+            self.assertTrue(data['message'] == 'Token was revoked, Please login In')
+            response = self.client.get('v1/events', headers=dict(Authorization='Bearer ' + new_token))
+            self.assertEqual(response.status_code, 200)
+
+    def test_user_can_log_out_everywhere(self):
+        """
+        Test that logging out everywhere invalidates every token of the user
+        :return:
+        """
+        with self.client:
+            token = self.register_and_login_in_user()['auth_token']
+            response = self.client.post('v1/auth/logout/all', headers=dict(Authorization='Bearer ' + token))
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(data['message'] == 'Successfully logged out of all sessions')
+            self.assertEqual(User.get_by_email('john@gmail.com').token_version, 1)
+            response = self.client.get('v1/events', headers=dict(Authorization='Bearer ' + token))
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 401)
+            self.assertTrue(data['message'] == 'Token was revoked, Please login In')
+
     def test_request_fails_if_content_type_not_json(self):
         """
         Test a request fails if content type is not json
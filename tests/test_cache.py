@@ -0,0 +1,343 @@
+from tests.base import BaseTestCase
+from app import db
+from app.cache import RedisBackend, ResponseCache, response_cache
+from app.models.events import Event
+from sqlalchemy.orm import Session
+import unittest
+import json
+
+
+class FakeRedis:
+    """
+    In memory stand in for a Redis client, storing values as bytes like the server does
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.expiries = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value.encode('utf-8')
+        self.expiries[key] = ex
+
+    def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+    def incr(self, key):
+        self.values[key] = str(int(self.values.get(key, 0)) + 1).encode('utf-8')
+
+    def expire(self, key, ttl):
+        self.expiries[key] = ttl
+
+    def scan_iter(self, pattern):
+        return [key for key in self.values if key.startswith(pattern.rstrip('*'))]
+
+
+class TestResponseCache(BaseTestCase):
+    """
+    Test that single events, guests and tickets are served from the response cache until they change
+    """
+
+    def get_json(self, url, token):
+        """
+        Get a url and decode its json body
+        :return: Status code and data
+        """
+        response = self.client.get(url, headers=dict(Authorization='Bearer ' + token))
+        return response.status_code, json.loads(response.data.decode())
+
+    def create_ticket(self, token):
+        """
+        Create a ticket for the first event and guest
+        :return:
+        """
+        response = self.client.post(
+            'v1/events/1/tickets/1',
+            data=json.dumps(dict(ticket=dict(qr_code='qrcodetext', vvip=1, accepted=1, scanned='0'))),
+            content_type='application/json',
+            headers=dict(Authorization='Bearer ' + token)
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_event_is_read_from_the_cache(self):
+        """
+        Test that an event read twice is only loaded from the database once
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            status, first = self.get_json('v1/events/1', token)
+            self.assertEqual(status, 200)
+            with self.count_queries() as statements:
+                status, second = self.get_json('v1/events/1', token)
+            self.assertEqual(status, 200)
+            self.assertEqual(first, second)
+            self.assertFalse([s for s in statements if 'FROM events' in s])
+            self.assertEqual(response_cache.stats()['hits'], 1)
+
+    def test_event_is_evicted_when_edited_or_deleted(self):
+        """
+        Test that editing or deleting an event evicts its cached response
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            self.get_json('v1/events/1', token)
+            response = self.client.put(
+                'v1/events/1',
+                headers=dict(Authorization='Bearer ' + token),
+                data=json.dumps(dict(event=dict(name='Renamed'))),
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 201)
+            status, data = self.get_json('v1/events/1', token)
+            self.assertEqual(data['event']['event_name'], 'Renamed')
+
+            response = self.client.delete('v1/events/1', headers=dict(Authorization='Bearer ' + token))
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(response_cache.backend.get(response_cache.key('event', 1)))
+
+    def test_event_is_evicted_when_its_tickets_change(self):
+        """
+        Test that the ticket counters of a cached event follow its tickets
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            self.create_guest(token)
+            self.get_json('v1/events/1', token)
+            self.create_ticket(token)
+            status, data = self.get_json('v1/events/1', token)
+            self.assertEqual(data['event']['ticket_counts']['total'], 1)
+
+    def test_cached_record_is_not_served_to_another_user(self):
+        """
+        Test that a record cached for its owner is not found by another user
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            self.create_guest(token)
+            self.get_json('v1/events/1', token)
+            self.get_json('v1/guests/1', token)
+            other = json.loads(self.register_user('other@example.com', '123456').data.decode())['auth_token']
+            status, data = self.get_json('v1/events/1', other)
+            self.assertEqual(status, 404)
+            status, data = self.get_json('v1/guests/1', other)
+            self.assertEqual(status, 404)
+
+    def test_guest_is_evicted_when_edited_or_deleted(self):
+        """
+        Test that editing or deleting a guest evicts its cached response
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_guest(token)
+            self.get_json('v1/guests/1', token)
+            response = self.client.put(
+                'v1/guests/1',
+                headers=dict(Authorization='Bearer ' + token),
+                data=json.dumps(dict(guest=dict(first_name='John'))),
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 201)
+            status, data = self.get_json('v1/guests/1', token)
+            self.assertEqual(data['guest']['first_name'], 'John')
+
+            response = self.client.delete('v1/guests/1', headers=dict(Authorization='Bearer ' + token))
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(response_cache.backend.get(response_cache.key('guest', 1)))
+
+    def test_ticket_is_evicted_when_scanned_or_edited(self):
+        """
+        Test that checking in, uploading scans and editing a ticket evict its cached response
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            self.create_guest(token)
+            self.create_ticket(token)
+            headers = dict(Authorization='Bearer ' + token)
+            status, data = self.get_json('v1/events/1/tickets/1', token)
+            self.assertEqual(data['ticket']['scanned'], 0)
+
+            self.client.post('v1/events/1/checkin', headers=headers, content_type='application/json',
+                             data=json.dumps(dict(qr_code='qrcodetext')))
+            status, data = self.get_json('v1/events/1/tickets/1', token)
+            self.assertEqual(data['ticket']['scanned'], 1)
+
+            self.client.post('v1/events/1/scans', headers=headers, content_type='application/json',
+                             data=json.dumps(dict(scans=[{'scan_id': 'a1', 'qr_code': 'qrcodetext',
+                                                          'scanned_at': '2019-05-22T15:00:00Z'}])))
+            status, data = self.get_json('v1/events/1/tickets/1', token)
+            self.assertEqual(data['ticket']['scanned'], 2)
+
+            self.client.put('v1/events/1/tickets/1', headers=headers, content_type='application/json',
+                            data=json.dumps(dict(ticket=dict(scanned='2', accepted='true', vvip='false'))))
+            status, data = self.get_json('v1/events/1/tickets/1', token)
+            self.assertFalse(data['ticket']['vvip'])
+
+            response = self.client.delete('v1/events/1/tickets/1', headers=headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(response_cache.backend.get(response_cache.key('ticket', 1)))
+
+    def test_cached_ticket_is_only_served_for_its_event(self):
+        """
+        Test that a cached ticket is not returned under another event of the user
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            self.create_event(token)
+            self.create_guest(token)
+            self.create_ticket(token)
+            self.get_json('v1/events/1/tickets/1', token)
+            status, data = self.get_json('v1/events/2/tickets/1', token)
+            self.assertEqual(status, 404)
+
+    def test_rolled_back_changes_do_not_evict(self):
+        """
+        Test that records changed in a transaction that rolls back stay cached
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            self.get_json('v1/events/1', token)
+            event = Event.query.get(1)
+            event.event_name = 'Not saved'
+            db.session.flush()
+            db.session.rollback()
+            self.assertEqual(response_cache.stats()['invalidations'], 0)
+            with self.count_queries() as statements:
+                status, data = self.get_json('v1/events/1', token)
+            self.assertEqual(data['event']['event_name'], 'Some Event')
+            self.assertFalse([s for s in statements if 'FROM events' in s])
+
+    def test_changes_committed_by_another_session_evict(self):
+        """
+        Test that a record changed through a session other than the application's is evicted when that session commits
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            self.get_json('v1/events/1', token)
+            session = Session(bind=db.engine)
+            try:
+                session.query(Event).get(1).event_name = 'Renamed elsewhere'
+                session.commit()
+            finally:
+                session.close()
+            self.assertIsNone(response_cache.backend.get(response_cache.key('event', 1)))
+            self.assertNotIn('response_cache_keys', db.session.info)
+
+    def test_read_racing_with_a_write_is_not_cached(self):
+        """
+        Test that an event read before a concurrent edit commits is not cached once the edit evicted it
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            # A read loads the event, then an edit commits before the read stores it
+            generation = response_cache.generation('event', 1)
+            outdated = Event.query.get(1).json()
+            response = self.client.put(
+                'v1/events/1',
+                headers=dict(Authorization='Bearer ' + token),
+                data=json.dumps(dict(event=dict(name='Renamed'))),
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 201)
+            response_cache.set('event', 1, 1, outdated, generation)
+            self.assertIsNone(response_cache.get('event', 1, 1))
+            status, data = self.get_json('v1/events/1', token)
+            self.assertEqual(data['event']['event_name'], 'Renamed')
+
+    def test_entry_stored_during_an_eviction_is_removed(self):
+        """
+        Test that an entry whose generation moved while it was stored, by an eviction that has not
+        deleted the entries yet, is removed by the read that stored it
+        :return:
+        """
+        client = FakeRedis()
+        cache = ResponseCache(RedisBackend(client), 60)
+        generation = cache.generation('guest', 3)
+        store = client.set
+
+        def store_during_eviction(key, value, ex=None):
+            store(key, value, ex)
+            client.incr('eplanner:generation:guest:3')
+
+        client.set = store_during_eviction
+        cache.set('guest', 3, 7, {'guest_id': 3}, generation)
+        self.assertIsNone(client.get('eplanner:guest:3'))
+
+    def test_redis_backend(self):
+        """
+        Test that entries are shared through a Redis client with an expiry and evicted from it
+        :return:
+        """
+        client = FakeRedis()
+        cache = ResponseCache(RedisBackend(client), 60)
+        cache.set('event', 1, 7, {'event_id': 1}, cache.generation('event', 1))
+        self.assertEqual(client.expiries['eplanner:event:1'], 60)
+        self.assertEqual(cache.get('event', 1, 7), {'event_id': 1})
+        self.assertIsNone(cache.get('event', 1, 8))
+        cache.evict(['event:1'])
+        self.assertIsNone(cache.get('event', 1, 7))
+        self.assertEqual(client.expiries['eplanner:generation:event:1'], 60)
+        cache.set('guest', 2, 7, {'guest_id': 2}, cache.generation('guest', 2))
+        cache.clear()
+        self.assertEqual(client.values, {})
+        self.assertEqual(cache.stats()['backend'], 'redis')
+
+    def test_unreachable_redis_is_a_miss(self):
+        """
+        Test that a Redis server that cannot be reached is treated as an empty cache
+        :return:
+        """
+        class DownRedis(FakeRedis):
+            def get(self, key):
+                raise ConnectionError(key)
+
+            def set(self, key, value, ex=None):
+                raise ConnectionError(key)
+
+        cache = ResponseCache(RedisBackend(DownRedis()), 60)
+        cache.set('event', 1, 7, {'event_id': 1}, cache.generation('event', 1))
+        self.assertIsNone(cache.get('event', 1, 7))
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_metrics_include_the_response_cache(self):
+        """
+        Test that the worker metrics report the cache hits, misses and invalidations
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            self.get_json('v1/events/1', token)
+            self.get_json('v1/events/1', token)
+            status, data = self.get_json('v1/metrics', token)
+            metrics = data['metrics']['response_cache']
+            self.assertEqual(metrics['backend'], 'local')
+            self.assertEqual(metrics['hits'], 1)
+            self.assertEqual(metrics['misses'], 1)
+            self.assertEqual(metrics['hit_rate'], 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -444,6 +444,166 @@ class TestEventBluePrint(BaseTestCase):
             self.assertEqual(data['previous'], 'http://localhost/v1/events?q=T&page=1')
             self.assertEqual(response.status_code, 200)
 
+    def test_event_search_is_case_insensitive(self):
+        """
+        Test that the search matches event names whatever the case of the query
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_events(token)
+            response = self.client.get(
+                'v1/events?q=WORKSHOP',
+                headers=dict(Authorization='Bearer ' + token)
+            )
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(data['count'], 1)
+            self.assertEqual(data['events'][0]['event_name'], 'Public Service Orientation Workshop')
+
+    def test_event_search_matches_wildcards_literally(self):
+        """
+        Test that % and _ in the search query are not used as wildcards
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_events(token)
+            response = self.client.get(
+                'v1/events?q=%25',
+                headers=dict(Authorization='Bearer ' + token)
+            )
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(data['count'], 0)
+            self.assertEqual(data['events'], [])
+
+    def test_events_are_paged_with_a_cursor(self):
+        """
+        Test that the events can be paged forwards and backwards with cursors and that no count is returned
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_events(token)
+            response = self.client.get(
+                'v1/events?cursor=',
+                headers=dict(Authorization='Bearer ' + token)
+            )
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([event['event_id'] for event in data['events']], [1, 2, 3, 4])
+            self.assertEqual(data['count'], None)
+            self.assertEqual(data['previous'], None)
+            self.assertTrue(data['next'].startswith('http://localhost/v1/events?cursor='))
+
+            response = self.client.get(data['next'], headers=dict(Authorization='Bearer ' + token))
+            data = json.loads(response.data.decode())
+            self.assertEqual([event['event_id'] for event in data['events']], [5, 6])
+            self.assertEqual(data['next'], None)
+
+            response = self.client.get(data['previous'], headers=dict(Authorization='Bearer ' + token))
+            data = json.loads(response.data.decode())
+            self.assertEqual([event['event_id'] for event in data['events']], [1, 2, 3, 4])
+            self.assertEqual(data['previous'], None)
+
+    def test_events_request_with_an_invalid_cursor(self):
+        """
+        Test that a cursor that cannot be decoded returns a 400 response
+        :return:
+        """
+        with self.client:
+            response = self.client.get(
+                'v1/events?cursor=notacursor',
+                headers=dict(Authorization='Bearer ' + self.get_user_token())
+            )
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 400)
+            self.assertTrue(data['message'] == 'Please provide a valid cursor')
+
+    def test_events_page_size_and_count_parameters(self):
+        """
+        Test that per_page sets the page size, count=false skips the total and both are kept in the urls
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_events(token)
+            response = self.client.get(
+                'v1/events?per_page=2&count=false',
+                headers=dict(Authorization='Bearer ' + token)
+            )
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(data['events']), 2)
+            self.assertEqual(data['count'], None)
+            self.assertEqual(data['next'], 'http://localhost/v1/events?page=2&per_page=2&count=false')
+            self.assertEqual(data['previous'], None)
+
+    def test_events_page_size_is_capped(self):
+        """
+        Test that a page size above the server maximum is reduced to the maximum
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_events(token)
+            self.app.config['EVENTS_MAX_PER_PAGE'] = 5
+            try:
+                response = self.client.get(
+                    'v1/events?per_page=1000',
+                    headers=dict(Authorization='Bearer ' + token)
+                )
+            finally:
+                self.app.config['EVENTS_MAX_PER_PAGE'] = 100
+            data = json.loads(response.data.decode())
+            self.assertEqual(len(data['events']), 5)
+            self.assertEqual(data['count'], 6)
+            self.assertEqual(data['next'], 'http://localhost/v1/events?page=2&per_page=5')
+
+    def test_events_are_exported(self):
+        """
+        Test that the events of the user are streamed with their ticket counters
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_events(token)
+            other = self.register_user('other@example.com', '123456')
+            self.create_event(json.loads(other.data.decode())['auth_token'])
+            response = self.client.get('v1/events/export?format=ndjson',
+                                       headers=dict(Authorization='Bearer ' + token))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, 'application/x-ndjson')
+            rows = [json.loads(line) for line in response.data.decode().splitlines()]
+            self.assertEqual([row['event_id'] for row in rows], [1, 2, 3, 4, 5, 6])
+            self.assertEqual(rows[1]['event_eval_link'], 'http://youtube.com')
+            self.assertEqual(rows[1]['event_time'], '2019-05-23T15:00:00')
+            self.assertEqual(rows[1]['tickets_total'], 0)
+
+    def test_locations_are_suggested(self):
+        """
+        Test that the locations of the user's events starting with the prefix are suggested
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_events(token)
+            self.create_event(token)
+            self.create_event(token)
+            headers = dict(Authorization='Bearer ' + token)
+            response = self.client.get('v1/events/locations?prefix=7%20b', headers=headers)
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(data['suggestions'], [{'value': '7 Bayview yards', 'count': 2}])
+
+            self.client.put('v1/events/1', data=json.dumps(dict(event=dict(location='Toronto'))),
+                            content_type='application/json', headers=headers)
+            response = self.client.get('v1/events/locations?prefix=&limit=2', headers=headers)
+            data = json.loads(response.data.decode())
+            self.assertEqual(data['suggestions'], [{'value': '7 Bayview yards', 'count': 2},
+                                                   {'value': 'Toronto', 'count': 2}])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,5 +1,10 @@
 from tests.base import BaseTestCase
+from app import app, db
+from app.models.guests import Guest
 import unittest
+import io
+import gzip
+import csv
 import json
 
 
@@ -413,9 +418,8 @@ class TestGuestBluePrint(BaseTestCase):
             data = json.loads(response.data.decode())
             self.assertTrue(data['status'] == 'success')
             self.assertIsInstance(data['guests'], list, 'Items must be a list')
-            self.assertEqual(len(data['guests']), 1)
-            self.assertEqual(data['guests'][0]['guest_id'], 2)
-            self.assertEqual(data['count'], 1)
+            self.assertEqual([guest['guest_id'] for guest in data['guests']], [2, 6])
+            self.assertEqual(data['count'], 2)
             self.assertEqual(data['next'], None)
             self.assertEqual(data['previous'], None)
             self.assertEqual(response.status_code, 200)
@@ -443,6 +447,238 @@ class TestGuestBluePrint(BaseTestCase):
             self.assertEqual(data['previous'], 'http://localhost/v1/guests?q=T&page=1')
             self.assertEqual(response.status_code, 200)
 
+    def test_guests_are_paged_with_a_cursor(self):
+        """
+        Test that the guests can be paged with cursors
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_guests(token)
+            response = self.client.get(
+                'v1/guests?cursor=',
+                headers=dict(Authorization='Bearer ' + token)
+            )
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([guest['guest_id'] for guest in data['guests']], [1, 2, 3, 4])
+            self.assertEqual(data['count'], None)
+            response = self.client.get(data['next'], headers=dict(Authorization='Bearer ' + token))
+            data = json.loads(response.data.decode())
+            self.assertEqual([guest['guest_id'] for guest in data['guests']], [5, 6, 7])
+            self.assertEqual(data['next'], None)
+            self.assertTrue(data['previous'].startswith('http://localhost/v1/guests?cursor='))
+
+    def import_guests(self, token, body, content_type='text/csv'):
+        """
+        Import guests from a CSV or NDJSON body
+        :return: Http response
+        """
+        return self.client.post(
+            'v1/guests/import',
+            data=body.encode('utf-8') if isinstance(body, str) else body,
+            content_type=content_type,
+            headers=dict(Authorization='Bearer ' + token)
+        )
+
+    def test_guests_are_imported_from_csv(self):
+        """
+        Test that valid CSV rows are imported and the invalid ones reported by row number
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_guest(token)
+            guest_email = Guest.query.first().email
+            body = '\ufeffFirst_Name,last_name,organization,email\r\n' \
+                   'Ada,Lovelace,"Analytical, Engines",ada@example.com\r\n' \
+                   'Alan,,Bletchley,alan@example.com\r\n' \
+                   'Grace,Hopper,Navy,not-an-email\r\n' \
+                   'Ada,Again,Engines,ada@example.com\r\n' \
+                   'Someone,Else,Org,' + guest_email + '\r\n' \
+                   '"Edsger ",Dijkstra,"Eindhoven\nUniversity",edsger@example.com\r\n'
+            response = self.import_guests(token, body)
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(data['status'], 'success')
+            self.assertEqual((data['rows'], data['imported'], data['failed']), (6, 2, 4))
+            self.assertEqual(data['errors'], [
+                {'row': 2, 'error': 'Missing last_name'},
+                {'row': 3, 'error': 'Wrong email format'},
+                {'row': 4, 'error': 'Duplicate email in the import'},
+                {'row': 5, 'error': 'Email already used'}
+            ])
+            edsger = Guest.query.filter_by(email='edsger@example.com').one()
+            self.assertEqual((edsger.first_name, edsger.organization), ('Edsger', 'Eindhoven\nUniversity'))
+            self.assertEqual(Guest.query.filter_by(email='ada@example.com').one().organization, 'Analytical, Engines')
+
+    def test_guests_are_imported_from_ndjson_in_chunks(self):
+        """
+        Test that NDJSON rows are imported in chunks and that bad lines are reported
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            lines = [json.dumps(dict(first_name='Guest', last_name=str(number), organization='Org',
+                                     email='guest' + str(number) + '@example.com')) for number in range(1, 8)]
+            lines[2] = '{"first_name": "Broken"'
+            lines[4] = '["not", "an", "object"]'
+            body = '\n'.join(lines[:4]) + '\n\n' + '\n'.join(lines[4:]) + '\n'
+            chunk_size = app.config['GUEST_IMPORT_CHUNK_SIZE']
+            app.config['GUEST_IMPORT_CHUNK_SIZE'] = 2
+            try:
+                with self.count_queries() as statements:
+                    response = self.import_guests(token, body, 'application/x-ndjson')
+            finally:
+                app.config['GUEST_IMPORT_CHUNK_SIZE'] = chunk_size
+            data = json.loads(response.data.decode())
+            self.assertEqual((data['rows'], data['imported'], data['failed']), (7, 5, 2))
+            self.assertEqual(data['errors'], [{'row': 3, 'error': 'Invalid JSON'},
+                                              {'row': 5, 'error': 'Row must be a JSON object'}])
+            self.assertEqual(len([statement for statement in statements if statement.strip().startswith('INSERT')]), 3)
+            self.assertEqual(Guest.query.count(), 5)
+
+    def test_guest_import_rejects_bad_bodies(self):
+        """
+        Test that an import needs a supported content type and a CSV header naming the guest columns
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            response = self.import_guests(token, 'first_name,last_name\nAda,Lovelace\n')
+            self.assertEqual(response.status_code, 400)
+            response = self.import_guests(token, '')
+            self.assertEqual(response.status_code, 400)
+            response = self.import_guests(token, '{}', 'application/json')
+            self.assertEqual(response.status_code, 202)
+            response = self.import_guests(token, b'first_name,last_name,organization,email\n'
+                                                 b'Ad\xe1,Lovelace,Org,ada@example.com\n')
+            data = json.loads(response.data.decode())
+            self.assertEqual(data['errors'], [{'row': 1, 'error': 'Not UTF-8 encoded'}])
+            self.assertEqual(Guest.query.count(), 0)
+
+    def test_guests_are_exported(self):
+        """
+        Test that the guests are streamed as CSV, as NDJSON, gzipped and within a time range
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_guests(token)
+            headers = dict(Authorization='Bearer ' + token)
+            response = self.client.get('v1/guests/export', headers=headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, 'text/csv')
+            self.assertTrue(response.is_streamed)
+            self.assertEqual(response.headers['Content-Disposition'], 'attachment; filename=guests.csv')
+            rows = list(csv.DictReader(io.StringIO(response.data.decode())))
+            self.assertEqual([row['guest_id'] for row in rows], ['1', '2', '3', '4', '5', '6', '7'])
+            self.assertEqual((rows[0]['first_name'], rows[0]['organization'], rows[0]['email']),
+                             ('John', 'CDS', 'email1@email.com'))
+
+            response = self.client.get('v1/guests/export?format=ndjson&gzip=true', headers=headers)
+            self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+            rows = [json.loads(line) for line in gzip.decompress(response.data).decode().splitlines()]
+            self.assertEqual(len(rows), 7)
+            self.assertEqual(rows[6]['last_name'], 'Jean')
+
+            since = Guest.query.get(3).guest_created_on.isoformat()
+            until = Guest.query.get(5).guest_created_on.isoformat()
+            response = self.client.get('v1/guests/export?format=ndjson&since=' + since + '&until=' + until,
+                                       headers=headers)
+            self.assertEqual([json.loads(line)['guest_id'] for line in response.data.decode().splitlines()], [3, 4])
+
+            for args in ('format=xml', 'since=yesterday'):
+                response = self.client.get('v1/guests/export?' + args, headers=headers)
+                self.assertEqual(response.status_code, 400)
+
+    def search_guests(self, token, q):
+        """
+        Search the guests of the user
+        :return: Ids of the guests found
+        """
+        response = self.client.get('v1/guests?per_page=10&q=' + q, headers=dict(Authorization='Bearer ' + token))
+        self.assertEqual(response.status_code, 200)
+        return [guest['guest_id'] for guest in json.loads(response.data.decode())['guests']]
+
+    def test_guests_are_searched_by_every_field(self):
+        """
+        Test that the guest search looks into the first and last names, the organization and the email
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_guests(token)
+            self.assertEqual(self.search_guests(token, 'cfa'), [6, 7])
+            self.assertEqual(self.search_guests(token, 'email3%40'), [3])
+            self.assertEqual(self.search_guests(token, 'randle'), [5])
+            self.assertEqual(self.search_guests(token, 'wick%20john'), [1])
+            self.assertEqual(self.search_guests(token, 'john%20cra'), [])
+            self.assertEqual(self.search_guests(token, '100%25'), [])
+
+    def test_guest_search_ranks_prefix_matches_first(self):
+        """
+        Test that guests with a field starting with the search string come before the other matches
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_guests(token)
+            self.assertEqual(self.search_guests(token, 'an'), [3, 5, 7])
+            self.assertEqual(self.search_guests(token, 'bradd%20p'), [2])
+
+    def suggest_organizations(self, token, args):
+        """
+        Get the organization suggestions of the user
+        :return: List of the suggested values and counts
+        """
+        response = self.client.get('v1/guests/organizations?' + args, headers=dict(Authorization='Bearer ' + token))
+        self.assertEqual(response.status_code, 200)
+        return [(suggestion['value'], suggestion['count'])
+                for suggestion in json.loads(response.data.decode())['suggestions']]
+
+    def test_organizations_are_suggested(self):
+        """
+        Test that organizations starting with the prefix are suggested, the most used first,
+        and that the suggestions follow the guests created, edited, imported and deleted
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_guests(token)
+            headers = dict(Authorization='Bearer ' + token)
+            self.assertEqual(self.suggest_organizations(token, 'prefix=c'),
+                             [('CFA', 2), ('CBSA', 1), ('CDS', 1), ('CRA', 1), ('CSE', 1), ('CSPS', 1)])
+            self.assertEqual(self.suggest_organizations(token, 'prefix=cs&limit=1'), [('CSE', 1)])
+
+            with self.count_queries() as statements:
+                self.client.put('v1/guests/1', data=json.dumps(dict(guest=dict(organization='CSPS'))),
+                                content_type='application/json', headers=headers)
+                self.client.delete('v1/guests/2', headers=headers)
+                self.create_guest(token)
+                self.assertEqual(self.suggest_organizations(token, 'prefix=cs'), [('CSPS', 2)])
+                self.assertEqual(self.suggest_organizations(token, 'prefix=cd'), [])
+            self.assertFalse([statement for statement in statements if 'GROUP BY guests.organization' in statement])
+
+            self.import_guests(token, 'first_name,last_name,organization,email\nAda,Lovelace,CDS,ada@example.com\n')
+            self.assertEqual(self.suggest_organizations(token, 'prefix=cd'), [('CDS', 1)])
+
+    def test_organization_suggestions_are_not_changed_by_a_rollback(self):
+        """
+        Test that a guest change that is rolled back does not reach the suggestions
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_guests(token)
+            self.suggest_organizations(token, '')
+            guest = Guest.query.get(1)
+            guest.organization = 'Rolled back'
+            db.session.flush()
+            db.session.rollback()
+            self.assertEqual(self.suggest_organizations(token, 'prefix=r'), [])
+            self.assertEqual(self.suggest_organizations(token, 'prefix=cds'), [('CDS', 1)])
+
 
 if __name__ == '__main__':
     unittest.main()
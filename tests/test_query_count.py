@@ -0,0 +1,88 @@
+from tests.base import BaseTestCase
+import unittest
+import json
+
+
+class TestQueryCount(BaseTestCase):
+    """
+    Test that the user, event and guest of a request are only loaded once
+    """
+
+    def test_ticket_creation_query_count(self):
+        """
+        Test that creating a ticket checks the event and guest in the insert statement
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            self.create_guest(token)
+            with self.count_queries() as statements:
+                response = self.client.post(
+                    'v1/events/1/tickets/1',
+                    data=json.dumps(dict(ticket=dict(qr_code='qrcodetext', vvip=1, accepted=1, scanned='0'))),
+                    content_type='application/json',
+                    headers=dict(Authorization='Bearer ' + token)
+                )
+            self.assertEqual(response.status_code, 200)
+            # user, insert checking the event and guest and tickets version of the event
+            self.assertLessEqual(len(statements), 3)
+            self.assertLessEqual(len([s for s in statements if 'FROM users' in s]), 1)
+
+    def test_single_event_query_count(self):
+        """
+        Test that getting, editing and deleting an event run a single ownership query
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            with self.count_queries() as statements:
+                response = self.client.get('v1/events/1', headers=dict(Authorization='Bearer ' + token))
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(statements), 2)
+            with self.count_queries() as statements:
+                response = self.client.delete('v1/events/1', headers=dict(Authorization='Bearer ' + token))
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len([s for s in statements if 'FROM users' in s]), 1)
+
+    def test_guest_list_query_count(self):
+        """
+        Test that listing the guests does not reload the user
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_guest(token)
+            with self.count_queries() as statements:
+                response = self.client.get('v1/guests', headers=dict(Authorization='Bearer ' + token))
+            self.assertEqual(response.status_code, 200)
+            # user, count and page of guests
+            self.assertLessEqual(len(statements), 3)
+
+    def test_ticket_list_with_guests_query_count(self):
+        """
+        Test that the guests of the listed tickets are loaded in the same query as the tickets
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            self.create_guests(token)
+            response = self.client.post(
+                'v1/events/1/tickets/bulk',
+                data=json.dumps(dict(tickets=dict(all=True))),
+                content_type='application/json',
+                headers=dict(Authorization='Bearer ' + token)
+            )
+            self.assertEqual(response.status_code, 200)
+            with self.count_queries() as statements:
+                response = self.client.get('v1/events/1/tickets?include=guest&per_page=10',
+                                           headers=dict(Authorization='Bearer ' + token))
+            self.assertEqual(len(json.loads(response.data.decode())['tickets']), 7)
+            # user, event and page of tickets joined to their guests
+            self.assertLessEqual(len(statements), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,195 @@
+from tests.base import BaseTestCase
+from app import db
+from app.search import trigram_installed
+from contextlib import contextmanager
+from sqlalchemy import event
+import unittest
+import json
+
+
+class TestQueryPlans(BaseTestCase):
+    """
+    Test that the queries run by the endpoints are served by indexes
+    """
+
+    @contextmanager
+    def capture_queries(self):
+        """
+        Record the SELECT, UPDATE and DELETE statements and their parameters sent inside the with block
+        :return: List the statements are appended to
+        """
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if not executemany and statement.lstrip().split(' ', 1)[0] in ('SELECT', 'UPDATE', 'DELETE'):
+                statements.append((statement, parameters))
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+    def assertNoSequentialScan(self, statements):
+        """
+        Explain every statement with sequential scans disabled. Postgres then falls back to
+        reading a whole index, or skipping through it, when no index matches the query, so an
+        index scan whose condition does not use the first column of the index fails too.
+        :param statements: List of statements and parameters
+        :return:
+        """
+        self.assertTrue(statements)
+        connection = db.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute('SET enable_seqscan = off')
+            for statement, parameters in statements:
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + statement, parameters)
+                plan = cursor.fetchone()[0][0]['Plan']
+                for node in self.plan_nodes(plan):
+                    if node['Node Type'] == 'Seq Scan':
+                        self.fail('Seq Scan on ' + node['Relation Name'] + ' for ' + statement)
+                    if 'Index Scan' in node['Node Type']:
+                        cursor.execute(
+                            'SELECT a.attname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid '
+                            'JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0] '
+                            'WHERE c.relname = %s', (node['Index Name'],))
+                        leading_column = cursor.fetchone()
+                        # Expression indexes, such as the guest search one, have no leading column
+                        if leading_column is not None and leading_column[0] + ' ' not in node.get('Index Cond', ''):
+                            self.fail('Full scan of ' + node['Index Name'] + ' for ' + statement)
+        finally:
+            connection.rollback()
+            connection.close()
+
+    def used_indexes(self, statements):
+        """
+        Names of the indexes read by the plans of the statements
+        :param statements: List of statements and parameters
+        :return: Set of index names
+        """
+        names = set()
+        connection = db.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute('SET enable_seqscan = off')
+            for statement, parameters in statements:
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + statement, parameters)
+                for node in self.plan_nodes(cursor.fetchone()[0][0]['Plan']):
+                    if 'Index Name' in node:
+                        names.add(node['Index Name'])
+        finally:
+            connection.rollback()
+            connection.close()
+        return names
+
+    def plan_nodes(self, plan):
+        """
+        List a query plan node and all the nodes below it
+        :param plan: Plan node
+        :return: List of plan nodes
+        """
+        nodes = [plan]
+        for child in plan.get('Plans', []):
+            nodes.extend(self.plan_nodes(child))
+        return nodes
+
+    def create_ticket(self, token):
+        """
+        Create a ticket for the first event and guest
+        :return:
+        """
+        response = self.client.post(
+            'v1/events/1/tickets/1',
+            data=json.dumps(dict(ticket=dict(qr_code='qrcodetext', vvip=1, accepted=1, scanned='1'))),
+            content_type='application/json',
+            headers=dict(Authorization='Bearer ' + token)
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_event_queries_use_indexes(self):
+        """
+        Test that listing, searching, exporting, reading, editing and deleting events use indexes
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_events(token)
+            headers = dict(Authorization='Bearer ' + token)
+            with self.capture_queries() as statements:
+                self.client.get('v1/events?page=2', headers=headers)
+                self.client.get('v1/events?cursor=', headers=headers)
+                self.client.get('v1/events?q=forum', headers=headers)
+                self.client.get('v1/events/export?since=2019-01-01T00:00:00', headers=headers).get_data()
+                self.client.get('v1/events/1', headers=headers)
+                self.client.put('v1/events/1', headers=headers, content_type='application/json',
+                                data=json.dumps(dict(event=dict(name='Renamed'))))
+                self.client.delete('v1/events/2', headers=headers)
+            self.assertNoSequentialScan(statements)
+
+    def test_guest_queries_use_indexes(self):
+        """
+        Test that listing, searching, exporting, reading and deleting guests use indexes
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_guest(token)
+            headers = dict(Authorization='Bearer ' + token)
+            with self.capture_queries() as statements:
+                self.client.get('v1/guests', headers=headers)
+                self.client.get('v1/guests?cursor=', headers=headers)
+                self.client.get('v1/guests?q=hort', headers=headers)
+                self.client.get('v1/guests/export', headers=headers).get_data()
+                self.client.get('v1/guests/1', headers=headers)
+                self.client.delete('v1/guests/1', headers=headers)
+            self.assertNoSequentialScan(statements)
+
+    def test_ticket_queries_use_indexes(self):
+        """
+        Test that creating, listing, exporting, reading, counting and deleting tickets use indexes
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            self.create_guest(token)
+            headers = dict(Authorization='Bearer ' + token)
+            with self.capture_queries() as statements:
+                self.create_ticket(token)
+                self.client.get('v1/events/1/tickets', headers=headers)
+                self.client.get('v1/events/1/tickets?cursor=', headers=headers)
+                self.client.get('v1/events/1/tickets?vvip=true', headers=headers)
+                self.client.get('v1/events/1/tickets?scanned=0&accepted=true', headers=headers)
+                self.client.get('v1/events/1/tickets/1', headers=headers)
+                self.client.get('v1/events/1/tickets/export', headers=headers).get_data()
+                self.client.post('v1/events/1/checkin', headers=headers, content_type='application/json',
+                                 data=json.dumps(dict(qr_code='qrcodetext')))
+                self.client.get('v1/events/1/stats', headers=headers)
+                self.client.delete('v1/events/1/tickets/1', headers=headers)
+            self.assertNoSequentialScan(statements)
+
+    def test_searches_use_trigram_indexes(self):
+        """
+        Test that the q= searches of events, guests and tickets are served by the trigram indexes
+        :return:
+        """
+        if not trigram_installed():
+            self.skipTest('pg_trgm is not installed on the test database')
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            self.create_guest(token)
+            self.create_ticket(token)
+            headers = dict(Authorization='Bearer ' + token)
+            with self.capture_queries() as statements:
+                self.client.get('v1/events?q=some&count=false', headers=headers)
+                self.client.get('v1/guests?q=hort&count=false', headers=headers)
+                self.client.get('v1/events/1/tickets?q=hort&count=false', headers=headers)
+            self.assertNoSequentialScan(statements)
+            self.assertTrue({'ix_events_event_name_trgm', 'ix_guests_search_trgm', 'ix_guests_last_name_trgm'}
+                            <= self.used_indexes(statements))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,17 @@
 from tests.base import BaseTestCase
+from app.models.tickets import Ticket
+from app.models.guests import Guest
+from app.models.events import Event
+from app import app, db
+from sqlalchemy.exc import IntegrityError
 import unittest
+import io
+import csv
 import json
+import hashlib
+import struct
+import threading
+import time
 
 class TestTicket(BaseTestCase):
 
@@ -418,6 +429,713 @@ class TestTicket(BaseTestCase):
             self.assertTrue(data['message'] == 'Successfully deleted the ticket from event with Id 1')
             self.assertEqual(response.status_code, 200)
 
+    def post_ticket(self, token, guest_id, qr_code):
+        """
+        Create a ticket for a guest in the first event
+        :return: Http response
+        """
+        return self.client.post(
+            'v1/events/1/tickets/' + str(guest_id),
+            data=json.dumps(dict(ticket=dict(qr_code=qr_code, vvip=1, accepted=1, scanned='0'))),
+            content_type='application/json',
+            headers=dict(Authorization='Bearer ' + token)
+        )
+
+    def check_in(self, token, qr_code, event_id=1):
+        """
+        Scan a QR code at the door of an event
+        :return: Http response
+        """
+        return self.client.post(
+            'v1/events/' + str(event_id) + '/checkin',
+            data=json.dumps(dict(qr_code=qr_code)),
+            content_type='application/json',
+            headers=dict(Authorization='Bearer ' + token)
+        )
+
+    def test_ticket_is_checked_in_by_qr_code(self):
+        """
+        Test that every scan increments the scan count and returns the guest
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            self.create_guest(token)
+            self.assertEqual(self.post_ticket(token, 1, 'qrcodetext').status_code, 200)
+            for scanned in range(1, 3):
+                response = self.check_in(token, 'qrcodetext')
+                data = json.loads(response.data.decode())
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(data['status'], 'success')
+                self.assertEqual(data['ticket']['ticket_id'], 1)
+                self.assertEqual(data['ticket']['guest_name'], 'Tim Hortons')
+                self.assertEqual(data['ticket']['vvip'], True)
+                self.assertEqual(data['ticket']['scanned'], scanned)
+
+    def test_ticket_of_a_deleted_guest_is_checked_in(self):
+        """
+        Test that a ticket whose guest was deleted is checked in at the door as it is by scan uploads
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            self.create_guest(token)
+            self.assertEqual(self.post_ticket(token, 1, 'qrcodetext').status_code, 200)
+            self.client.delete('v1/guests/1', headers=dict(Authorization='Bearer ' + token))
+            response = self.check_in(token, 'qrcodetext')
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(data['ticket']['ticket_id'], 1)
+            self.assertIsNone(data['ticket']['guest_id'])
+            self.assertIsNone(data['ticket']['guest_name'])
+            self.assertEqual(data['ticket']['scanned'], 1)
+
+    def test_check_in_with_unknown_qr_code(self):
+        """
+        Test that a QR code with no ticket in the event is not found
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            response = self.check_in(token, 'unknown')
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(data['message'], 'No ticket with this QR code in event with Id 1')
+            response = self.check_in(token, '')
+            self.assertEqual(response.status_code, 400)
+
+    def test_check_in_needs_a_qr_code_string(self):
+        """
+        Test that a check in without a QR code string in a json object is rejected
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            response = self.check_in(token, 12345)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(json.loads(response.data.decode())['message'], 'Provide a QR code')
+            for body in ([], 'x'):
+                response = self.client.post(
+                    'v1/events/1/checkin',
+                    data=json.dumps(body),
+                    content_type='application/json',
+                    headers=dict(Authorization='Bearer ' + token)
+                )
+                self.assertEqual(response.status_code, 400)
+
+    def test_check_in_of_another_users_event(self):
+        """
+        Test that a ticket of another user's event cannot be checked in
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            self.create_guest(token)
+            self.post_ticket(token, 1, 'qrcodetext')
+            other = json.loads(self.register_user('other@gmail.com', '123456').data.decode())['auth_token']
+            response = self.check_in(other, 'qrcodetext')
+            self.assertEqual(response.status_code, 404)
+
+    def test_qr_code_is_unique_within_an_event(self):
+        """
+        Test that two tickets of an event cannot share a QR code
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            self.create_guests(token)
+            self.assertEqual(self.post_ticket(token, 1, 'qrcodetext').status_code, 200)
+            response = self.post_ticket(token, 2, 'qrcodetext')
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(data['message'], 'QR code is already used by another ticket of event id 1')
+
+    def test_ticket_exists_already(self):
+        """
+        Test that a guest cannot get a second ticket for an event
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            self.create_guest(token)
+            self.assertEqual(self.post_ticket(token, 1, 'qrcodetext').status_code, 200)
+            response = self.post_ticket(token, 1, 'otherqrcode')
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(data['message'], 'Ticket exists already for guest id 1 participating at event id 1')
+            self.assertEqual(Ticket.query.count(), 1)
+            with self.assertRaises(IntegrityError):
+                Ticket(1, 1, 'thirdqrcode', True, True, 0).save()
+
+    def test_ticket_needs_the_users_event_and_guest(self):
+        """
+        Test that a ticket is not created for a guest or an event of another user
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            other = json.loads(self.register_user('other@gmail.com', '123456').data.decode())['auth_token']
+            self.create_guest(other)
+            response = self.post_ticket(token, 1, 'qrcodetext')
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(data['message'], 'User has no guest with Id 1')
+            response = self.post_ticket(other, 1, 'qrcodetext')
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(data['message'], 'User has no event with Id 1')
+            self.assertEqual(Ticket.query.count(), 0)
+
+    def upload_scans(self, token, scans):
+        """
+        Upload a batch of scans of the first event
+        :return: Http response
+        """
+        return self.client.post(
+            'v1/events/1/scans',
+            data=json.dumps(dict(scans=scans)),
+            content_type='application/json',
+            headers=dict(Authorization='Bearer ' + token)
+        )
+
+    def test_scan_batch_is_applied_once(self):
+        """
+        Test that a batch of scans is recorded with an outcome per scan and that uploading it again changes nothing
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            self.create_guests(token)
+            self.post_ticket(token, 1, 'qrcodetext')
+            self.post_ticket(token, 2, 'textqrcode')
+            scans = [
+                {'scan_id': 'a1', 'qr_code': 'qrcodetext', 'scanned_at': '2019-05-22T15:00:00Z', 'device_id': 'door'},
+                {'scan_id': 'a2', 'qr_code': 'qrcodetext', 'scanned_at': '2019-05-22T15:01:00.250Z'},
+                {'scan_id': 'a3', 'qr_code': 'textqrcode', 'scanned_at': '2019-05-22 15:02:00'},
+                {'scan_id': 'a4', 'qr_code': 'unknown', 'scanned_at': '2019-05-22T15:03:00'},
+                {'scan_id': 'a1', 'qr_code': 'qrcodetext', 'scanned_at': '2019-05-22T15:00:00Z'},
+                {'qr_code': 'qrcodetext', 'scanned_at': '2019-05-22T15:04:00'},
+                {'scan_id': 'a5', 'qr_code': 'qrcodetext', 'scanned_at': 'yesterday'}
+            ]
+            response = self.upload_scans(token, scans)
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([scan['outcome'] for scan in data['scans']],
+                             ['applied', 'applied', 'applied', 'not_found', 'duplicate', 'invalid', 'invalid'])
+            self.assertEqual(data['scans'][0]['ticket_id'], 1)
+            self.assertEqual(data['scans'][2]['ticket_id'], 2)
+            self.assertEqual(data['totals'], {'applied': 3, 'duplicate': 1, 'not_found': 1, 'invalid': 2})
+
+            response = self.upload_scans(token, scans)
+            data = json.loads(response.data.decode())
+            self.assertEqual(data['totals'], {'applied': 0, 'duplicate': 4, 'not_found': 1, 'invalid': 2})
+
+            response = self.client.get('v1/events/1/tickets', headers=dict(Authorization='Bearer ' + token))
+            scanned = {ticket['qr_code']: ticket['scanned'] for ticket in json.loads(response.data.decode())['tickets']}
+            self.assertEqual(scanned, {'qrcodetext': 2, 'textqrcode': 1})
+
+            # Tickets with scans can still be deleted
+            response = self.client.delete('v1/events/1/tickets/1', headers=dict(Authorization='Bearer ' + token))
+            self.assertEqual(response.status_code, 200)
+
+    def test_scan_batch_must_be_a_list(self):
+        """
+        Test that a missing or empty scan list is rejected
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            response = self.upload_scans(token, [])
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(data['message'], 'Provide a list of scans')
+
+    def test_event_manifest(self):
+        """
+        Test that the manifest lists the sorted QR code digests with a VVIP bitmap and is not sent again when unchanged
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            self.create_guests(token)
+            self.post_ticket(token, 1, 'qrcodetext')
+            Ticket(1, 2, 'textqrcode', False, True, 0).save()
+            response = self.client.get('v1/events/1/manifest', headers=dict(Authorization='Bearer ' + token))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content_type, 'application/octet-stream')
+            body = response.data
+            magic, event_id, version, count, size = struct.unpack('>4sIIIB', body[:17])
+            self.assertEqual((magic, event_id, count, size), (b'EPM1', 1, 2, 16))
+            digests = [body[17 + i * 16:17 + (i + 1) * 16] for i in range(count)]
+            expected = {hashlib.sha256(b'qrcodetext').digest()[:16]: True,
+                        hashlib.sha256(b'textqrcode').digest()[:16]: False}
+            self.assertEqual(digests, sorted(expected))
+            bitmap = body[17 + count * 16:]
+            self.assertEqual(len(bitmap), 1)
+            self.assertEqual([bool(bitmap[0] & (1 << i)) for i in range(count)], [expected[d] for d in digests])
+            self.assertEqual(response.headers['X-Manifest-Version'], str(version))
+
+            etag = response.headers['ETag']
+            response = self.client.get('v1/events/1/manifest',
+                                       headers={'Authorization': 'Bearer ' + token, 'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304)
+
+    def test_event_manifest_delta(self):
+        """
+        Test that a new ticket changes the manifest version and is sent alone as a delta
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            self.create_guests(token)
+            self.post_ticket(token, 1, 'qrcodetext')
+            response = self.client.get('v1/events/1/manifest', headers=dict(Authorization='Bearer ' + token))
+            old_version = response.headers['X-Manifest-Version']
+            etag = response.headers['ETag']
+            Ticket(1, 2, 'textqrcode', False, True, 0).save()
+
+            response = self.client.get('v1/events/1/manifest',
+                                       headers={'Authorization': 'Bearer ' + token, 'If-None-Match': etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response.headers['ETag'], etag)
+
+            response = self.client.get('v1/events/1/manifest?since=' + old_version,
+                                       headers=dict(Authorization='Bearer ' + token))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers['X-Manifest-Delta-From'], old_version)
+            body = response.data
+            magic, event_id, from_version, to_version, added, removed, size = struct.unpack('>4sIIIIIB', body[:25])
+            self.assertEqual((magic, from_version, added, removed), (b'EPD1', int(old_version), 1, 0))
+            self.assertEqual(body[25:41], hashlib.sha256(b'textqrcode').digest()[:16])
+            self.assertEqual(body[41:], b'\x00')
+
+    def create_varied_tickets(self, token):
+        """
+        Create tickets of the first event with different flags and scan counts
+        :return:
+        """
+        self.create_event(token)
+        self.create_guests(token)
+        for guest_id, vvip, accepted, scanned in [(1, True, True, 0), (2, True, True, 2), (3, False, True, 0),
+                                                   (4, True, False, 0), (5, False, False, 1), (6, True, True, 0)]:
+            Ticket(1, guest_id, 'qrcode' + str(guest_id), vvip, accepted, scanned).save()
+
+    def test_tickets_are_filtered(self):
+        """
+        Test that the ticket list can be filtered by VVIP, accepted and scanned and that the urls keep the filters
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_varied_tickets(token)
+            headers = dict(Authorization='Bearer ' + token)
+            cases = [
+                ('vvip=true&scanned=0', [6, 4, 1]),
+                ('accepted=1&scanned=0', [6, 3, 1]),
+                ('scanned=%3E0', [5, 2]),
+                ('scanned=2', [2]),
+                ('vvip=false', [5, 3]),
+            ]
+            for args, guest_ids in cases:
+                response = self.client.get('v1/events/1/tickets?per_page=10&' + args, headers=headers)
+                data = json.loads(response.data.decode())
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual([ticket['guest_id'] for ticket in data['tickets']], guest_ids, args)
+                self.assertEqual(data['count'], len(guest_ids))
+
+            response = self.client.get('v1/events/1/tickets?vvip=true&per_page=3', headers=headers)
+            data = json.loads(response.data.decode())
+            self.assertEqual(data['count'], 4)
+            self.assertEqual(data['next'], 'http://localhost/v1/events/1/tickets?page=2&per_page=3&vvip=true')
+
+    def test_tickets_created_since(self):
+        """
+        Test that the ticket list can be restricted to the tickets created since a time
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_varied_tickets(token)
+            ticket = Ticket.query.filter_by(guest_id=5).first()
+            since = ticket.ticket_created_on.isoformat()
+            response = self.client.get('v1/events/1/tickets?created_since=' + since,
+                                       headers=dict(Authorization='Bearer ' + token))
+            data = json.loads(response.data.decode())
+            self.assertEqual([ticket['guest_id'] for ticket in data['tickets']], [6, 5])
+
+    def test_tickets_include_guest(self):
+        """
+        Test that include=guest nests the guest in the listed tickets and in a single ticket
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_varied_tickets(token)
+            headers = dict(Authorization='Bearer ' + token)
+            response = self.client.get('v1/events/1/tickets?include=guest&per_page=2', headers=headers)
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(data['tickets'][0]['guest']['guest_id'], data['tickets'][0]['guest_id'])
+            self.assertEqual(data['tickets'][0]['guest']['last_name'], 'Prime')
+            self.assertEqual(data['next'], 'http://localhost/v1/events/1/tickets?page=2&per_page=2&include=guest')
+
+            response = self.client.get('v1/events/1/tickets/1?include=guest', headers=headers)
+            data = json.loads(response.data.decode())
+            self.assertEqual(data['ticket']['guest']['first_name'], 'John')
+            response = self.client.get('v1/events/1/tickets/1', headers=headers)
+            self.assertNotIn('guest', json.loads(response.data.decode())['ticket'])
+
+    def test_tickets_include_deleted_guest(self):
+        """
+        Test that include=guest returns a null guest for the tickets of a deleted guest
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            self.create_guest(token)
+            headers = dict(Authorization='Bearer ' + token)
+            self.post_ticket(token, 1, 'qrcodetext')
+            response = self.client.delete('v1/guests/1', headers=headers)
+            self.assertEqual(response.status_code, 200)
+
+            response = self.client.get('v1/events/1/tickets?include=guest', headers=headers)
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(data['tickets'][0]['guest_id'])
+            self.assertIsNone(data['tickets'][0]['guest'])
+
+            response = self.client.get('v1/events/1/tickets/1?include=guest', headers=headers)
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(data['ticket']['guest'])
+
+    def test_invalid_ticket_filter(self):
+        """
+        Test that invalid filter values are rejected
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            for args in ['vvip=maybe', 'scanned=many', 'created_since=yesterday']:
+                response = self.client.get('v1/events/1/tickets?' + args, headers=dict(Authorization='Bearer ' + token))
+                data = json.loads(response.data.decode())
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(data['message'], 'Provide valid vvip, accepted, scanned and created_since filters')
+
+    def ticket_counts(self, token):
+        """
+        Get the ticket counters of the first event
+        :return: Dict of counters
+        """
+        response = self.client.get('v1/events/1', headers=dict(Authorization='Bearer ' + token))
+        return json.loads(response.data.decode())['event']['ticket_counts']
+
+    def test_event_ticket_counters(self):
+        """
+        Test that the ticket counters of the event follow every way tickets are created, changed, scanned and deleted
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            self.create_guests(token)
+            headers = dict(Authorization='Bearer ' + token)
+            self.post_ticket(token, 1, 'qrcodetext')
+            self.assertEqual(self.ticket_counts(token), dict(total=1, accepted=1, vvip=1, checked_in=0))
+
+            self.issue_tickets(token, dict(guest_ids=[2, 3, 4], accepted=True))
+            self.assertEqual(self.ticket_counts(token), dict(total=4, accepted=4, vvip=1, checked_in=0))
+
+            self.check_in(token, 'qrcodetext')
+            self.check_in(token, 'qrcodetext')
+            self.assertEqual(self.ticket_counts(token), dict(total=4, accepted=4, vvip=1, checked_in=1))
+
+            qr_codes = [ticket.qr_code_text for ticket in Ticket.query.filter(Ticket.guest_id.in_([2, 3]))]
+            self.upload_scans(token, [
+                {'scan_id': 's1', 'qr_code': qr_codes[0], 'scanned_at': '2019-05-22T15:00:00'},
+                {'scan_id': 's2', 'qr_code': qr_codes[0], 'scanned_at': '2019-05-22T15:01:00'},
+                {'scan_id': 's3', 'qr_code': qr_codes[1], 'scanned_at': '2019-05-22T15:02:00'},
+                {'scan_id': 's4', 'qr_code': 'qrcodetext', 'scanned_at': '2019-05-22T15:03:00'}
+            ])
+            self.assertEqual(self.ticket_counts(token), dict(total=4, accepted=4, vvip=1, checked_in=3))
+
+            response = self.client.put(
+                'v1/events/1/tickets/1',
+                data=json.dumps(dict(ticket=dict(scanned='0', accepted='0', vvip='1'))),
+                content_type='application/json',
+                headers=headers
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.ticket_counts(token), dict(total=4, accepted=3, vvip=1, checked_in=2))
+
+            self.client.delete('v1/events/1/tickets/1', headers=headers)
+            self.assertEqual(self.ticket_counts(token), dict(total=3, accepted=3, vvip=0, checked_in=2))
+
+    def test_ticket_counters_are_repaired(self):
+        """
+        Test that the ticket counters are recomputed from the tickets
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_varied_tickets(token)
+            expected = self.ticket_counts(token)
+            self.assertEqual(expected, dict(total=6, accepted=4, vvip=4, checked_in=2))
+            Event.query.filter_by(event_id=1).update(dict(tickets_total=0, tickets_checked_in=9))
+            db.session.commit()
+            self.assertEqual(Event.recount_tickets(), 1)
+            self.assertEqual(self.ticket_counts(token), expected)
+            self.assertEqual(Event.recount_tickets(), 0)
+
+    def run_while_ticket_is_locked(self, requests):
+        """
+        Send requests from concurrent threads while another transaction holds the lock of the first
+        ticket, so they all read the ticket before any of them writes it
+        :param requests: List of callables taking a test client and returning a response
+        :return: List of response status codes
+        """
+        statuses = []
+        connection = db.engine.connect()
+        transaction = connection.begin()
+        connection.execute('SELECT 1 FROM tickets WHERE ticket_id = 1 FOR UPDATE')
+
+        def send(request):
+            with self.app.test_client() as client:
+                statuses.append(request(client).status_code)
+
+        threads = [threading.Thread(target=send, args=(request,)) for request in requests]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.5)
+        transaction.commit()
+        connection.close()
+        for thread in threads:
+            thread.join()
+        return sorted(statuses)
+
+    def test_concurrent_ticket_edits_are_counted_once(self):
+        """
+        Test that concurrent edits accepting a ticket and concurrent deletes of a ticket move the counters once
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            self.create_guests(token)
+            headers = dict(Authorization='Bearer ' + token)
+            self.post_ticket(token, 1, 'qrcodetext')
+            self.post_ticket(token, 2, 'textqrcode')
+            self.client.put('v1/events/1/tickets/1', headers=headers, content_type='application/json',
+                            data=json.dumps(dict(ticket=dict(scanned='0', accepted='false', vvip='true'))))
+            self.assertEqual(self.ticket_counts(token)['accepted'], 1)
+
+            def accept(client):
+                return client.put('v1/events/1/tickets/1', headers=headers, content_type='application/json',
+                                  data=json.dumps(dict(ticket=dict(scanned='0', accepted='true', vvip='true'))))
+
+            self.assertEqual(self.run_while_ticket_is_locked([accept, accept]), [200, 200])
+            counters = 'SELECT tickets_total, tickets_accepted FROM events WHERE event_id = 1'
+            self.assertEqual(tuple(db.session.execute(counters).first()), (2, 2))
+
+            def delete(client):
+                return client.delete('v1/events/1/tickets/1', headers=headers)
+
+            self.assertEqual(self.run_while_ticket_is_locked([delete, delete]), [200, 404])
+            db.session.commit()
+            self.assertEqual(tuple(db.session.execute(counters).first()), (1, 1))
+
+    def issue_tickets(self, token, tickets):
+        """
+        Issue tickets of the first event to many guests
+        :return: Http response
+        """
+        return self.client.post(
+            'v1/events/1/tickets/bulk',
+            data=json.dumps(dict(tickets=tickets)),
+            content_type='application/json',
+            headers=dict(Authorization='Bearer ' + token)
+        )
+
+    def test_tickets_are_issued_in_bulk(self):
+        """
+        Test that tickets are issued to a list of guests and that guests with a ticket are skipped
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            self.create_guests(token)
+            self.post_ticket(token, 1, 'qrcodetext')
+            response = self.issue_tickets(token, dict(guest_ids=[1, 2, 3, 3, 999], vvip='true'))
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(data['created'], 2)
+            self.assertEqual(data['skipped'], 2)
+
+            tickets = Ticket.query.filter_by(event_id=1).order_by(Ticket.guest_id).all()
+            self.assertEqual([ticket.guest_id for ticket in tickets], [1, 2, 3])
+            self.assertTrue(all(ticket.vvip for ticket in tickets))
+            self.assertFalse(tickets[1].accepted)
+            self.assertEqual(len(tickets[1].qr_code_text), 32)
+            self.assertNotEqual(tickets[1].qr_code_text, tickets[2].qr_code_text)
+
+    def test_tickets_are_issued_to_all_or_searched_guests(self):
+        """
+        Test that tickets are issued to the guests matching a search and then to all the guests
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            self.create_guests(token)
+            total = Guest.query.count()
+            # The organization is searched like the guest list does
+            response = self.client.get('v1/guests?q=cfa', headers=dict(Authorization='Bearer ' + token))
+            listed = [guest['guest_id'] for guest in json.loads(response.data.decode())['guests']]
+            searched = len(listed)
+            self.assertEqual(searched, 2)
+            response = self.issue_tickets(token, dict(q='cfa'))
+            data = json.loads(response.data.decode())
+            self.assertEqual((data['created'], data['skipped']), (searched, 0))
+            self.assertEqual(sorted(ticket.guest_id for ticket in Ticket.query.filter_by(event_id=1)), sorted(listed))
+            response = self.issue_tickets(token, dict(all=True, accepted=1))
+            data = json.loads(response.data.decode())
+            self.assertEqual((data['created'], data['skipped']), (total - searched, searched))
+            self.assertEqual(Ticket.query.filter_by(event_id=1).count(), total)
+
+    def test_bulk_issuance_needs_guests(self):
+        """
+        Test that the guests to invite and the flags must be valid
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            response = self.issue_tickets(token, dict(vvip=1))
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(json.loads(response.data.decode())['message'], 'Provide guest_ids, q or all')
+            response = self.issue_tickets(token, dict(guest_ids=[1], vvip='maybe'))
+            self.assertEqual(response.status_code, 400)
+            response = self.issue_tickets(token, dict(guest_ids='1'))
+            self.assertEqual(response.status_code, 400)
+            response = self.issue_tickets(token, dict(guest_ids=[True]))
+            self.assertEqual(response.status_code, 400)
+
+    def get_stats(self, token, event_id=1):
+        """
+        Get the statistics of an event
+        :return: Http response
+        """
+        return self.client.get('v1/events/' + str(event_id) + '/stats', headers=dict(Authorization='Bearer ' + token))
+
+    def test_event_stats(self):
+        """
+        Test the rates, VVIP attendance, organization breakdown and check ins per minute of an event
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_varied_tickets(token)
+            Ticket(1, 7, 'qrcode7', False, True, 0).save()
+            self.upload_scans(token, [
+                {'scan_id': 's1', 'qr_code': 'qrcode1', 'scanned_at': '2019-05-22T15:00:10'},
+                {'scan_id': 's2', 'qr_code': 'qrcode3', 'scanned_at': '2019-05-22T15:00:40'},
+                {'scan_id': 's3', 'qr_code': 'qrcode6', 'scanned_at': '2019-05-22T15:02:05'},
+                {'scan_id': 's4', 'qr_code': 'qrcode1', 'scanned_at': '2019-05-22T15:05:00'}
+            ])
+            response = self.get_stats(token)
+            self.assertEqual(response.status_code, 200)
+            stats = json.loads(response.data.decode())['stats']
+            self.assertEqual(stats['tickets'], 7)
+            self.assertEqual(stats['accepted'], 5)
+            self.assertEqual(stats['acceptance_rate'], 0.7143)
+            self.assertEqual(stats['checked_in'], 5)
+            self.assertEqual(stats['check_in_rate'], 0.7143)
+            self.assertEqual(stats['vvip'], dict(total=4, checked_in=3, attendance_rate=0.75))
+            self.assertEqual(stats['organizations'][0],
+                             dict(organization='CFA', total=2, accepted=2, vvip=1, checked_in=1))
+            self.assertEqual([organization['organization'] for organization in stats['organizations']],
+                             ['CFA', 'CBSA', 'CDS', 'CRA', 'CSE', 'CSPS'])
+            per_minute = stats['check_ins_per_minute']
+            self.assertIn(dict(minute='2019-05-22T15:00:00', check_ins=2), per_minute)
+            self.assertIn(dict(minute='2019-05-22T15:02:00', check_ins=1), per_minute)
+            self.assertEqual(sum(minute['check_ins'] for minute in per_minute), 5)
+
+    def test_event_stats_are_cached_until_tickets_change(self):
+        """
+        Test that the statistics are served from the cache and recomputed once a ticket changes
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_varied_tickets(token)
+            self.get_stats(token)
+            with self.count_queries() as statements:
+                response = self.get_stats(token)
+            self.assertFalse([statement for statement in statements if 'GROUPING SETS' in statement])
+            self.assertEqual(json.loads(response.data.decode())['stats']['checked_in'], 2)
+
+            self.check_in(token, 'qrcode1')
+            stats = json.loads(self.get_stats(token).data.decode())['stats']
+            self.assertEqual(stats['checked_in'], 3)
+            self.assertEqual(sum(minute['check_ins'] for minute in stats['check_ins_per_minute']), 3)
+
+    def test_event_stats_of_an_empty_or_unknown_event(self):
+        """
+        Test the statistics of an event without tickets and of an event of another user
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_event(token)
+            stats = json.loads(self.get_stats(token).data.decode())['stats']
+            self.assertEqual(stats['tickets'], 0)
+            self.assertEqual(stats['check_in_rate'], 0.0)
+            self.assertEqual(stats['organizations'], [])
+            self.assertEqual(stats['check_ins_per_minute'], [])
+            self.assertEqual(self.get_stats(token, 2).status_code, 404)
+
+    def test_tickets_are_exported_with_their_guests(self):
+        """
+        Test that the ticket export of an event is an attendance sheet with the guest fields
+        :return:
+        """
+        with self.client:
+            token = self.get_user_token()
+            self.create_varied_tickets(token)
+            headers = dict(Authorization='Bearer ' + token)
+            batch_size = app.config['EXPORT_BATCH_SIZE']
+            app.config['EXPORT_BATCH_SIZE'] = 4
+            try:
+                response = self.client.get('v1/events/1/tickets/export', headers=headers)
+                chunks = list(response.response)
+            finally:
+                app.config['EXPORT_BATCH_SIZE'] = batch_size
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(chunks), 2)
+            rows = list(csv.DictReader(io.StringIO(''.join(chunk.decode() if isinstance(chunk, bytes) else chunk
+                                                           for chunk in chunks))))
+            self.assertEqual([row['guest_id'] for row in rows], ['1', '2', '3', '4', '5', '6'])
+            self.assertEqual((rows[1]['first_name'], rows[1]['last_name'], rows[1]['email']),
+                             ('Bradd', 'Pitt', 'email2@email.com'))
+            self.assertEqual((rows[1]['vvip'], rows[1]['scanned']), ('true', '2'))
+            self.assertTrue(rows[1]['checked_in_on'])
+            self.assertEqual(rows[0]['checked_in_on'], '')
+            self.assertEqual(self.client.get('v1/events/2/tickets/export', headers=headers).status_code, 404)
 
 
 if __name__ == '__main__':